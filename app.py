@@ -1,397 +1,399 @@
 import streamlit as st
 import pandas as pd
-import os
 import io
+import os
+import time
+from datetime import datetime, timezone
 
-def convert_mib_to_gb(mib_value):
-    """Convert MiB to GB"""
-    try:
-        return round(float(mib_value) / 953.7, 2)
-    except (ValueError, TypeError):
-        return 0
+from buffers import MemoryBudgetExceeded, estimate_peak_mb, open_source, release, spool
+from capacity import (CAPACITY_SHEET, DEFAULT_PLAN_SCOPE, PLAN_SCOPES, HostProfile, capacity_rows, capacity_workbook,
+                      empty_scope_message, plan_capacity, plan_scope_labels)
+from enrichment import sheet_specs
+from instrumentation import Instrumentation, configure_json_log, log_run, profile_call
+from jobs import manager_from_env
+from processor import build_output_workbook, output_filename, process_rvtools_file
+from merge import merge_exports
+from reader import VINFO_SHEET, MissingColumnError
+from result_cache import PROCESSING_VERSION, cache_from_env, content_key
+from snapshots import carry_forward, diff_against_previous, read_processed_workbook, save_snapshot
+from summary import SUMMARY_MODES
 
-def convert_mb_to_gb(mb_value):
-    """Convert MB to GB"""
+def process_in_background(job, uploads, previous_bytes, summary_mode, enrich, cache, cache_key, profile=False,
+                          workers=1):
+    """Process the uploads as a background job and cache the result.
+
+    Runs off the script thread, so problems are recorded on the job rather
+    than shown with Streamlit calls. The ServerList and workbook go into the
+    result cache under cache_key; the job keeps only the returned dict of the
+    write stats, the per-phase diagnostics and, when asked, a profile.
+    Enrichment tabs and merged exports are parsed on at most workers processes.
+    """
+    instrumentation = Instrumentation(label=job.name)
+    progress = instrumentation.progress(job.report)
+    
+    def run():
+        # Large uploads are parsed from a memory-mapped copy on disk
+        sources = []
+        try:
+            for name, buffer in uploads:
+                sources.append((name, spool(name, buffer)))
+            if len(sources) == 1:
+                with open_source(sources[0][1]) as f:
+                    server_list = process_rvtools_file(f, enrich=enrich, workers=workers, progress=progress)
+            else:
+                server_list, errors = merge_exports(sources, workers, enrich, progress)
+                for name, error in errors.items():
+                    job.warn(f"Skipped {name}: {error}")
+        finally:
+            for _, source in sources:
+                release(source)
+        if previous_bytes is not None:
+            server_list = carry_forward_previous(job, server_list, previous_bytes)
+        xlsx_bytes, write_stats = build_output_workbook(server_list, summary_mode, progress=progress)
+        cache.put(cache_key, server_list, xlsx_bytes)
+        return write_stats
+    
+    profile_report = None
     try:
-        return round(float(mb_value) / 1024, 2)
-    except (ValueError, TypeError):
-        return 0
+        if profile:
+            write_stats, profile_report = profile_call(run)
+        else:
+            write_stats = run()
+    finally:
+        # Also stops the open stage's RSS sampling when the job fails or is cancelled
+        instrumentation.finish()
+    diagnostics = instrumentation.to_dict()
+    log_run(diagnostics, summary_mode=summary_mode, enrich=enrich, files=len(uploads), profiled=profile)
+    return {'write_stats': write_stats, 'diagnostics': diagnostics, 'profile': profile_report}
+
+def download_filename(uploaded_files):
+    """Name the download after the upload, or as a merge of several"""
+    if len(uploaded_files) == 1:
+        return output_filename(getattr(uploaded_files[0], 'name', None))
+    return "rvtools-merged-processed.xlsx"
 
-def find_column(df, possible_names):
-    """Find a column in the dataframe using possible name variations"""
-    for name in possible_names:
-        if name in df.columns:
-            return name
-    return None
+def upload_digests(uploaded_files):
+    """Content hash of each upload, kept in the session by file ID so reruns do not hash it again"""
+    known = st.session_state.get('upload_digests', {})
+    digests = {uploaded_file.file_id: known.get(uploaded_file.file_id) or content_key(uploaded_file.getbuffer(), '')
+               for uploaded_file in uploaded_files}
+    # Only the current uploads are kept, so removed files do not pile up
+    st.session_state['upload_digests'] = digests
+    return [digests[uploaded_file.file_id] for uploaded_file in uploaded_files]
 
-def process_rvtools_file(uploaded_file):
-    """Process the RVtools Excel file and create a new ServerList tab"""
+def snapshot_name(uploaded_files):
+    """Default vCenter name for snapshots: the export's file name"""
+    if len(uploaded_files) == 1:
+        return os.path.splitext(uploaded_files[0].name)[0]
+    return 'merged'
+
+def carry_forward_previous(job, server_list, previous_bytes):
+    """Copy scope and notes from a previously processed workbook, noting read errors on the job"""
     try:
-        # Read the vInfo tab
-        df = pd.read_excel(uploaded_file, sheet_name='vInfo')
-        
-        # Define possible column name variations
-        column_mappings = {
-            'VM Name': ['VM Name', 'Name', 'Virtual Machine Name', 'VMName', 'VM'],
-            'Powerstate': ['Powerstate', 'Power State', 'Power', 'State'],
-            'CPUs': ['CPUs', 'CPU', 'Num CPU', 'vCPUs'],
-            'Memory': ['Memory', 'Memory MB', 'Memory (MB)', 'RAM'],
-            'Provisioned MB': ['Provisioned MB', 'Provisioned MiB', 'Provisioned', 'Provisioned Storage', 'Provisioned Space'],
-            'In Use MB': ['In Use MB', 'In Use MiB', 'Used Space', 'Used Storage', 'In Use Space'],
-            'Cluster': ['Cluster', 'vSphere Cluster', 'ESX Cluster'],
-            'OS according to the configuration file': ['OS according to the configuration file', 'OS According to the configuration file', 'Guest OS', 'Operating System', 'OS']
-        }
-        
-        # Create a dictionary to store the actual column names found
-        found_columns = {}
-        for target_col, possible_names in column_mappings.items():
-            found_col = find_column(df, possible_names)
-            if found_col is None:
-                st.error(f"Could not find column for {target_col}. Available columns are: {', '.join(df.columns)}")
-                return None
-            found_columns[target_col] = found_col
-        
-        # Select and rename required columns
-        server_list = df[[
-            found_columns['VM Name'],
-            found_columns['Powerstate'],
-            found_columns['CPUs'],
-            found_columns['Memory'],
-            found_columns['Provisioned MB'],
-            found_columns['In Use MB'],
-            found_columns['Cluster'],
-            found_columns['OS according to the configuration file']
-        ]].copy()
-        
-        # Rename columns to standard names
-        server_list.columns = [
-            'VM Name',
-            'Powerstate',
-            'CPUs',
-            'Memory',
-            'Provisioned MB',
-            'In Use MB',
-            'Cluster',
-            'OS according to the configuration file'
-        ]
-        
-        # Convert memory (MB to GB) and disk (MiB to GB)
-        server_list['Memory (GB)'] = server_list['Memory'].apply(convert_mb_to_gb)
-        server_list['Provisioned Disk (GB)'] = server_list['Provisioned MB'].apply(convert_mib_to_gb)
-        server_list['In Use Disk (GB)'] = server_list['In Use MB'].apply(convert_mib_to_gb)
-        
-        # Add new columns
-        server_list['In Scope for Prod?'] = ''
-        server_list['In Scope for DR?'] = ''
-        server_list['Notes'] = ''
-        
-        # Reorder columns
-        final_columns = [
-            'VM Name',
-            'Powerstate',
-            'CPUs',
-            'Memory (GB)',
-            'Provisioned Disk (GB)',
-            'In Use Disk (GB)',
-            'Cluster',
-            'OS according to the configuration file',
-            'In Scope for Prod?',
-            'In Scope for DR?',
-            'Notes'
-        ]
-        
-        server_list = server_list[final_columns]
-        
+        previous = read_processed_workbook(io.BytesIO(previous_bytes))
+    except Exception as e:
+        job.warn(f"Could not read the previously processed workbook: {str(e)}")
         return server_list
+    server_list, matched = carry_forward(server_list, previous)
+    server_list.attrs['carried_forward'] = matched
+    return server_list
+
+def record_snapshot(server_list, vcenter):
+    """Save a snapshot and diff it against the vCenter's previous one"""
+    taken_at = datetime.now(timezone.utc).replace(microsecond=0)
+    path = save_snapshot(server_list, vcenter, timestamp=taken_at)
+    return {'path': path, 'changes': diff_against_previous(server_list, vcenter, before=taken_at)}
+
+def show_changes(snapshot):
+    """Show the added, removed and resized VMs since the previous snapshot"""
+    st.write("### Changes since the previous snapshot")
+    st.caption(f"Snapshot saved to {snapshot['path']}")
+    changes = snapshot['changes']
+    if changes is None:
+        st.write("This is the first snapshot for this vCenter.")
+        return
+    columns = st.columns(3)
+    for column, (label, key) in zip(columns, [('Added', 'added'), ('Removed', 'removed'), ('Resized', 'resized')]):
+        column.metric(f"{label} VMs", len(changes[key]))
+    for label, key in [('Added', 'added'), ('Removed', 'removed'), ('Resized', 'resized')]:
+        if len(changes[key]):
+            with st.expander(f"{label} VMs"):
+                st.dataframe(changes[key])
+
+def capacity_options():
+    """Target host profile and VM scope from the capacity planning inputs, or None when planning is off"""
+    with st.expander("Capacity planning"):
+        if not st.checkbox("Plan target hosts", help="Pack the VMs onto hosts of the profile below"):
+            return None, None
+        defaults = HostProfile()
+        plan_scope = st.selectbox("VMs to plan for", PLAN_SCOPES, index=PLAN_SCOPES.index(DEFAULT_PLAN_SCOPE),
+                                  format_func=lambda scope: plan_scope_labels[scope])
+        columns = st.columns(3)
+        cores = columns[0].number_input("Cores per host", min_value=1, value=defaults.cores)
+        memory_gb = columns[1].number_input("Memory per host (GB)", min_value=1.0, value=float(defaults.memory_gb))
+        storage_gb = columns[2].number_input("Disk per host (GB)", min_value=1.0, value=float(defaults.storage_gb))
+        columns = st.columns(4)
+        cpu_overcommit = columns[0].number_input("vCPUs per core", min_value=0.1, value=defaults.cpu_overcommit)
+        memory_overcommit = columns[1].number_input("Memory overcommit", min_value=0.1, value=defaults.memory_overcommit)
+        storage_overcommit = columns[2].number_input("Disk overcommit", min_value=0.1, value=defaults.storage_overcommit)
+        spare_hosts = columns[3].number_input("Spare hosts (N+)", min_value=0, value=defaults.spare_hosts)
+    profile = HostProfile(int(cores), memory_gb, storage_gb, cpu_overcommit, memory_overcommit, storage_overcommit,
+                          int(spare_hosts))
+    return profile, plan_scope
+
+def show_capacity_plan(server_list, host_profile, plan_scope, cache_key, name):
+    """Show the hosts needed per cluster and OS, repacking only when the inputs change"""
+    plan_key = f"{cache_key}:{host_profile}:{plan_scope}"
+    cached = st.session_state.get('capacity_plan')
+    if cached is None or cached[0] != plan_key:
+        cached = (plan_key, plan_capacity(server_list, host_profile, plan_scope))
+        st.session_state['capacity_plan'] = cached
+    plans = cached[1]
     
-    except Exception as e:
-        st.error(f"Error processing file: {str(e)}")
-        st.error("Available columns in the file: " + ", ".join(df.columns))
-        return None
+    st.write("### Capacity Plan")
+    first = next(iter(plans.values()))
+    st.caption(f"{first.attrs['vms']:,} VMs packed in {first.attrs['seconds']:.2f}s onto hosts of "
+               f"{host_profile.describe()}")
+    if not first.attrs['vms']:
+        st.warning(empty_scope_message(plan_scope))
+        return
+    for category, plan in plans.items():
+        st.write(f"**By {category.lower()}**")
+        st.dataframe(plan, hide_index=True)
+    st.download_button(
+        label="Download capacity plan",
+        data=capacity_workbook(capacity_rows(plans, host_profile, plan_scope)),
+        file_name=f"{os.path.splitext(name)[0]}-capacity.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        help=f"The {CAPACITY_SHEET} sheet on its own"
+    )
+
+# How often the page refreshes while a job is running
+JOB_POLL_SECONDS = 0.5
+
+summary_mode_labels = {
+    'formulas': 'Live formulas',
+    'values': 'Static values',
+    'both': 'Live formulas and static values',
+}
+
+@st.cache_resource
+def get_job_manager():
+    """Process-wide job manager, so every session shares the concurrency cap"""
+    configure_json_log()
+    return manager_from_env()
+
+def show_job(job, jobs):
+    """Show a job's stage and row count, with a button to cancel it"""
+    rows = f" ({job.rows:,} rows)" if job.rows else ""
+    st.progress(job.progress, text=f"{job.name}: {job.stage}{rows}")
+    if st.button("Cancel"):
+        jobs.cancel(job.key)
+
+def show_diagnostics(outcome, name):
+    """Show the per-phase measurements of a run and offer its profile for download"""
+    diagnostics = outcome['diagnostics']
+    st.write("### Diagnostics")
+    columns = st.columns(3)
+    columns[0].metric("Wall time", f"{diagnostics['wall_seconds']:.2f}s")
+    columns[1].metric("CPU time", f"{diagnostics['cpu_seconds']:.2f}s")
+    columns[2].metric("Peak RSS (approx.)", f"{diagnostics['peak_rss_mb']:.0f} MB")
+    st.dataframe(pd.DataFrame(diagnostics['phases']).round(3), hide_index=True)
+    profile = outcome['profile']
+    if profile is not None:
+        st.download_button(
+            label="Download profile (.prof)",
+            data=profile.data,
+            file_name=f"{os.path.splitext(name)[0]}.prof",
+            mime="application/octet-stream",
+            help="Open with snakeviz or pstats"
+        )
+        with st.expander("Profile summary"):
+            st.code(profile.text)
+
+def show_job_stats(jobs):
+    """Show job counts and throughput in the sidebar"""
+    stats = jobs.stats()
+    with st.sidebar.expander("Processing jobs"):
+        st.write(f"Running: {stats['running']} of {stats['max_concurrent']}, queued: {stats['queued']}")
+        st.write(f"Done: {stats['done']}, failed: {stats['failed']}, cancelled: {stats['cancelled']}")
+        st.write(f"Mean wait {stats['mean_wait_seconds']:.1f}s, mean run {stats['mean_run_seconds']:.1f}s")
+        st.write(f"Throughput: {stats['jobs_per_minute']:.1f} jobs/min, {stats['rows_per_second']:,.0f} rows/s")
+        if stats['memory_budget_mb'] is not None:
+            st.write(f"Memory reserved: {stats['reserved_mb']:,.0f} of {stats['memory_budget_mb']:,.0f} MB")
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide result cache shared by every session"""
+    return cache_from_env()
+
+def show_cache_stats(cache):
+    """Show the result cache hit/miss counters in the sidebar"""
+    stats = cache.stats()
+    with st.sidebar.expander("Result cache"):
+        st.write(f"Hits: {stats['hits']} (from disk: {stats['disk_hits']})")
+        st.write(f"Misses: {stats['misses']}")
+        st.write(f"Entries: {stats['entries']} using {stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
 
 def main():
     st.title("RVtools Excel Processor")
-    st.write("Upload an RVtools Excel file to create a ServerList tab")
+    st.write("Upload RVtools Excel files to create a ServerList tab")
+    
+    cache = get_result_cache()
+    jobs = get_job_manager()
+    uploaded_files = st.file_uploader(
+        "Choose one or more Excel files",
+        type=['xlsx', 'xls'],
+        accept_multiple_files=True,
+        help="Upload exports from several vCenters to merge them into one ServerList"
+    )
+    summary_mode = st.selectbox(
+        "Summary output",
+        SUMMARY_MODES,
+        format_func=lambda mode: summary_mode_labels[mode],
+        help="Live formulas are limited to the ServerList data range and recalculate when scope values are edited"
+    )
+    enrich = st.checkbox(
+        "Add host, disk, datastore and NIC details",
+        help="Joins the vHost, vDisk, vDatastore and vNetwork tabs onto the ServerList"
+    )
+    
+    with st.expander("Diagnostics"):
+        show_diagnostics_panel = st.checkbox("Show per-phase timings and memory")
+        profile = st.checkbox(
+            "Capture a profile of the next run",
+            help="Reprocesses the upload under cProfile and offers the profile for download"
+        )
     
-    uploaded_file = st.file_uploader("Choose an Excel file", type=['xlsx', 'xls'])
+    with st.expander("Snapshots and carry-forward"):
+        previous_workbook = st.file_uploader(
+            "Previously processed workbook (optional)",
+            type=['xlsx'],
+            help="Scope and notes entered in this workbook are copied onto matching VMs"
+        )
+        take_snapshot = st.checkbox("Save a snapshot and compare with the previous one")
+        vcenter = st.text_input(
+            "vCenter",
+            value=snapshot_name(uploaded_files) if uploaded_files else '',
+            help="Snapshots are stored and compared per vCenter"
+        )
     
-    if uploaded_file is not None:
+    host_profile, plan_scope = capacity_options()
+    
+    running_job = None
+    if uploaded_files:
         try:
-            # Process the file
-            server_list = process_rvtools_file(uploaded_file)
+            # Reuse the processed result if this exact upload has been seen before
+            if previous_workbook is not None:
+                *digests, previous_digest = upload_digests(uploaded_files + [previous_workbook])
+                file_keys = sorted(digests) + ['previous:' + previous_digest]
+            else:
+                file_keys = sorted(upload_digests(uploaded_files))
+            cache_key = content_key(''.join(file_keys).encode('ascii'), f"{PROCESSING_VERSION}:{summary_mode}:{enrich}")
+            # Profiled runs always reprocess, under their own job
+            job_key = f"{cache_key}:profile" if profile else cache_key
+            job = jobs.get(job_key)
+            # Results are always read from the cache, jobs only know their cache key.
+            # Profiled runs reprocess, so they only read it once their job is done.
+            result = None
+            if job is None and not profile or job is not None and job.status == 'done':
+                result = cache.get(cache_key)
+            if job is not None and job.status == 'done' and result is None:
+                # Evicted from the cache since the job finished
+                jobs.discard(job_key)
+                job = None
+            outcome = None
+            
+            # Process in the background, or pick up the job already running for this upload
+            if result is None and (job is None or (job.status in ('failed', 'cancelled') and st.button("Process again"))):
+                # Jobs get views of the uploaded buffers rather than copies
+                uploads = [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in uploaded_files]
+                previous_bytes = previous_workbook.getvalue() if previous_workbook is not None else None
+                sheet_names = [VINFO_SHEET] + (list(sheet_specs) if enrich else [])
+                memory_mb = estimate_peak_mb(uploaded_files, sheet_names)
+                job = jobs.submit(job_key, download_filename(uploaded_files), lambda job: process_in_background(
+                    job, uploads, previous_bytes, summary_mode, enrich, cache, cache_key, profile,
+                    jobs.workers_per_job),
+                    memory_mb=memory_mb, cache_key=cache_key)
+            
+            if job is not None:
+                for warning in job.warnings:
+                    st.warning(warning)
+                if job.status == 'done':
+                    outcome = job.outcome
+                    write_stats = outcome['write_stats']
+                    st.caption(
+                        f"Processed {job.rows or 0:,} rows in {job.run_seconds:.2f}s; workbook written in "
+                        f"{write_stats.seconds:.2f}s with {write_stats.engine} (peak RSS ~"
+                        f"{write_stats.peak_rss_mb:.0f} MB, +{write_stats.peak_delta_mb:.0f} MB while writing)"
+                    )
+                elif job.status == 'failed':
+                    if isinstance(job.exception, MissingColumnError):
+                        st.error(job.error)
+                    else:
+                        st.error(f"Error processing file: {job.error}")
+                elif job.status == 'cancelled':
+                    st.warning("Processing was cancelled")
+                else:
+                    show_job(job, jobs)
+                    running_job = job
+            
+            if show_diagnostics_panel:
+                if outcome is not None:
+                    show_diagnostics(outcome, download_filename(uploaded_files))
+                elif result is not None:
+                    st.caption("Served from the result cache, so there are no diagnostics for this run")
             
-            if server_list is not None:
+            if result is not None:
+                server_list = result.server_list
+                
+                # Report cells that could not be parsed as numbers
+                parse_errors = server_list.attrs.get('parse_errors', {})
+                for column, failed in parse_errors.items():
+                    if failed:
+                        st.warning(f"{failed} cell(s) in '{column}' could not be parsed as numbers and were counted as 0")
+                
+                duplicates = server_list.attrs.get('duplicates')
+                if duplicates:
+                    st.info(f"{duplicates} duplicate VM(s) seen in more than one export were removed")
+                
+                carried_forward = server_list.attrs.get('carried_forward')
+                if carried_forward is not None:
+                    st.info(f"Scope and notes carried forward for {carried_forward} VM(s)")
+                
+                # Save one snapshot per upload and vCenter, then show the changes
+                if take_snapshot and vcenter:
+                    changes_key = f"changes:{cache_key}:{vcenter}"
+                    if changes_key not in st.session_state:
+                        st.session_state[changes_key] = record_snapshot(server_list, vcenter)
+                    show_changes(st.session_state[changes_key])
+                
                 # Display the processed data
                 st.write("### Processed Server List")
                 st.dataframe(server_list)
                 
-                # Use the original filename with "-processed" appended
-                if hasattr(uploaded_file, 'name') and uploaded_file.name:
-                    base_name = os.path.splitext(uploaded_file.name)[0]
-                    output_filename = f"{base_name}-processed.xlsx"
-                else:
-                    output_filename = "rvtools-processed.xlsx"
-                
-                # Create Excel writer with BytesIO
-                excel_file = io.BytesIO()
-                output = pd.ExcelWriter(excel_file, engine='openpyxl')
-                
-                # Write the ServerList tab
-                server_list.to_excel(output, sheet_name='ServerList', index=False)
-                
-                # Get the ServerList worksheet and add filters
-                serverlist_ws = output.sheets['ServerList']
-                serverlist_ws.auto_filter.ref = serverlist_ws.dimensions
-                
-                # Create Summary tab
-                summary_ws = output.book.create_sheet('Summary')
-                
-                # Add headers to Summary tab
-                summary_headers = [
-                    'Category', 'Sub-Category', 'Count', 'Total CPUs', 
-                    'Total Memory (GB)', 'Total Provisioned Disk (GB)', 
-                    'Total In Use Disk (GB)'
-                ]
-                for col, header in enumerate(summary_headers, 1):
-                    summary_ws.cell(row=1, column=col, value=header)
-                
-                # Add Powerstate summary
-                current_row = 2
-                powerstates = server_list['Powerstate'].unique()
-                for powerstate in powerstates:
-                    # Main category (Powerstate)
-                    summary_ws.cell(row=current_row, column=1, value='Powerstate')
-                    summary_ws.cell(row=current_row, column=2, value=powerstate)
-                    
-                    # Count formula
-                    summary_ws.cell(row=current_row, column=3, 
-                        value=f'=COUNTIFS(ServerList!B:B,"{powerstate}")')
-                    
-                    # CPU sum formula
-                    summary_ws.cell(row=current_row, column=4,
-                        value=f'=SUMIFS(ServerList!C:C,ServerList!B:B,"{powerstate}")')
-                    
-                    # Memory sum formula
-                    summary_ws.cell(row=current_row, column=5,
-                        value=f'=SUMIFS(ServerList!D:D,ServerList!B:B,"{powerstate}")')
-                    
-                    # Provisioned Disk sum formula
-                    summary_ws.cell(row=current_row, column=6,
-                        value=f'=SUMIFS(ServerList!E:E,ServerList!B:B,"{powerstate}")')
-                    
-                    # In Use Disk sum formula
-                    summary_ws.cell(row=current_row, column=7,
-                        value=f'=SUMIFS(ServerList!F:F,ServerList!B:B,"{powerstate}")')
-                    
-                    current_row += 1
-                
-                # Add Powerstate subtotal
-                summary_ws.cell(row=current_row, column=1, value='Powerstate Subtotal')
-                summary_ws.cell(row=current_row, column=2, value='')
-                summary_ws.cell(row=current_row, column=3, value='=SUM(C2:C' + str(current_row-1) + ')')
-                summary_ws.cell(row=current_row, column=4, value='=SUM(D2:D' + str(current_row-1) + ')')
-                summary_ws.cell(row=current_row, column=5, value='=SUM(E2:E' + str(current_row-1) + ')')
-                summary_ws.cell(row=current_row, column=6, value='=SUM(F2:F' + str(current_row-1) + ')')
-                summary_ws.cell(row=current_row, column=7, value='=SUM(G2:G' + str(current_row-1) + ')')
-                current_row += 2  # Add extra blank row after subtotal
-                
-                # Add OS summary
-                current_row += 1  # Add a blank row between sections
-                summary_ws.cell(row=current_row, column=1, value='Operating System Summary')
-                current_row += 1
-                
-                operating_systems = server_list['OS according to the configuration file'].unique()
-                for os_name in operating_systems:
-                    # Main category (OS)
-                    summary_ws.cell(row=current_row, column=1, value='Operating System')
-                    summary_ws.cell(row=current_row, column=2, value=os_name)
-                    
-                    # Count formula
-                    summary_ws.cell(row=current_row, column=3,
-                        value=f'=COUNTIFS(ServerList!H:H,"{os_name}")')
-                    
-                    # CPU sum formula
-                    summary_ws.cell(row=current_row, column=4,
-                        value=f'=SUMIFS(ServerList!C:C,ServerList!H:H,"{os_name}")')
-                    
-                    # Memory sum formula
-                    summary_ws.cell(row=current_row, column=5,
-                        value=f'=SUMIFS(ServerList!D:D,ServerList!H:H,"{os_name}")')
-                    
-                    # Provisioned Disk sum formula
-                    summary_ws.cell(row=current_row, column=6,
-                        value=f'=SUMIFS(ServerList!E:E,ServerList!H:H,"{os_name}")')
-                    
-                    # In Use Disk sum formula
-                    summary_ws.cell(row=current_row, column=7,
-                        value=f'=SUMIFS(ServerList!F:F,ServerList!H:H,"{os_name}")')
-                    
-                    current_row += 1
-                
-                # Add grand totals
-                current_row += 1  # Add a blank row
-                summary_ws.cell(row=current_row, column=1, value='Grand Total')
-                summary_ws.cell(row=current_row, column=3, value='=COUNTA(ServerList!A:A)-1')  # Subtract 1 for header
-                summary_ws.cell(row=current_row, column=4, value='=SUM(ServerList!C:C)')
-                summary_ws.cell(row=current_row, column=5, value='=SUM(ServerList!D:D)')
-                summary_ws.cell(row=current_row, column=6, value='=SUM(ServerList!E:E)')
-                summary_ws.cell(row=current_row, column=7, value='=SUM(ServerList!F:F)')
-                
-                # Add Prod Scope summary
-                current_row += 2  # Add blank rows between sections
-                summary_ws.cell(row=current_row, column=1, value='Production Scope Summary')
-                current_row += 1
-                
-                # Add "In Scope" row
-                summary_ws.cell(row=current_row, column=1, value='Production Scope')
-                summary_ws.cell(row=current_row, column=2, value='In Scope')
-                
-                # Count formula for In Scope (checking for various boolean values)
-                count_formula = '=COUNTIFS(ServerList!I:I,"yes")+COUNTIFS(ServerList!I:I,"true")+COUNTIFS(ServerList!I:I,"1")+COUNTIFS(ServerList!I:I,"X")+COUNTIFS(ServerList!I:I,"y")'
-                summary_ws.cell(row=current_row, column=3, value=count_formula)
-                
-                # CPU sum formula for In Scope
-                cpu_formula = '=SUMIFS(ServerList!C:C,ServerList!I:I,"yes")+SUMIFS(ServerList!C:C,ServerList!I:I,"true")+SUMIFS(ServerList!C:C,ServerList!I:I,"1")+SUMIFS(ServerList!C:C,ServerList!I:I,"X")+SUMIFS(ServerList!C:C,ServerList!I:I,"y")'
-                summary_ws.cell(row=current_row, column=4, value=cpu_formula)
-                
-                # Memory sum formula for In Scope
-                memory_formula = '=SUMIFS(ServerList!D:D,ServerList!I:I,"yes")+SUMIFS(ServerList!D:D,ServerList!I:I,"true")+SUMIFS(ServerList!D:D,ServerList!I:I,"1")+SUMIFS(ServerList!D:D,ServerList!I:I,"X")+SUMIFS(ServerList!D:D,ServerList!I:I,"y")'
-                summary_ws.cell(row=current_row, column=5, value=memory_formula)
-                
-                # Provisioned Disk sum formula for In Scope
-                disk_prov_formula = '=SUMIFS(ServerList!E:E,ServerList!I:I,"yes")+SUMIFS(ServerList!E:E,ServerList!I:I,"true")+SUMIFS(ServerList!E:E,ServerList!I:I,"1")+SUMIFS(ServerList!E:E,ServerList!I:I,"X")+SUMIFS(ServerList!E:E,ServerList!I:I,"y")'
-                summary_ws.cell(row=current_row, column=6, value=disk_prov_formula)
-                
-                # In Use Disk sum formula for In Scope
-                disk_used_formula = '=SUMIFS(ServerList!F:F,ServerList!I:I,"yes")+SUMIFS(ServerList!F:F,ServerList!I:I,"true")+SUMIFS(ServerList!F:F,ServerList!I:I,"1")+SUMIFS(ServerList!F:F,ServerList!I:I,"X")+SUMIFS(ServerList!F:F,ServerList!I:I,"y")'
-                summary_ws.cell(row=current_row, column=7, value=disk_used_formula)
-                
-                current_row += 1
-                
-                # Add "Not In Scope" row for Production
-                summary_ws.cell(row=current_row, column=1, value='Production Scope')
-                summary_ws.cell(row=current_row, column=2, value='Not In Scope')
-                
-                # Count formula for Not In Scope (everything except yes/true/1/X)
-                count_formula = '=COUNTIFS(ServerList!I:I,"<>yes",ServerList!I:I,"<>true",ServerList!I:I,"<>1",ServerList!I:I,"<>X",ServerList!I:I,"<>y")'
-                summary_ws.cell(row=current_row, column=3, value=count_formula)
-                
-                # CPU sum formula for Not In Scope
-                cpu_formula = '=SUMIFS(ServerList!C:C,ServerList!I:I,"<>yes",ServerList!I:I,"<>true",ServerList!I:I,"<>1",ServerList!I:I,"<>X",ServerList!I:I,"<>y")'
-                summary_ws.cell(row=current_row, column=4, value=cpu_formula)
-                
-                # Memory sum formula for Not In Scope
-                memory_formula = '=SUMIFS(ServerList!D:D,ServerList!I:I,"<>yes",ServerList!I:I,"<>true",ServerList!I:I,"<>1",ServerList!I:I,"<>X",ServerList!I:I,"<>y")'
-                summary_ws.cell(row=current_row, column=5, value=memory_formula)
-                
-                # Provisioned Disk sum formula for Not In Scope
-                disk_prov_formula = '=SUMIFS(ServerList!E:E,ServerList!I:I,"<>yes",ServerList!I:I,"<>true",ServerList!I:I,"<>1",ServerList!I:I,"<>X",ServerList!I:I,"<>y")'
-                summary_ws.cell(row=current_row, column=6, value=disk_prov_formula)
-                
-                # In Use Disk sum formula for Not In Scope
-                disk_used_formula = '=SUMIFS(ServerList!F:F,ServerList!I:I,"<>yes",ServerList!I:I,"<>true",ServerList!I:I,"<>1",ServerList!I:I,"<>X",ServerList!I:I,"<>y")'
-                summary_ws.cell(row=current_row, column=7, value=disk_used_formula)
-                
-                current_row += 1
-                
-                # Add Production Scope subtotal
-                prod_start_row = current_row - 2  # Row where Production section started
-                summary_ws.cell(row=current_row, column=1, value='Production Scope Subtotal')
-                summary_ws.cell(row=current_row, column=2, value='')
-                summary_ws.cell(row=current_row, column=3, value=f'=SUM(C{prod_start_row}:C{current_row-1})')
-                summary_ws.cell(row=current_row, column=4, value=f'=SUM(D{prod_start_row}:D{current_row-1})')
-                summary_ws.cell(row=current_row, column=5, value=f'=SUM(E{prod_start_row}:E{current_row-1})')
-                summary_ws.cell(row=current_row, column=6, value=f'=SUM(F{prod_start_row}:F{current_row-1})')
-                summary_ws.cell(row=current_row, column=7, value=f'=SUM(G{prod_start_row}:G{current_row-1})')
-                current_row += 2  # Add extra blank row after subtotal
-                
-                # Add DR Scope summary
-                current_row += 1  # Add blank row between sections
-                summary_ws.cell(row=current_row, column=1, value='DR Scope Summary')
-                current_row += 1
-                
-                # Add "In Scope" row
-                summary_ws.cell(row=current_row, column=1, value='DR Scope')
-                summary_ws.cell(row=current_row, column=2, value='In Scope')
-                
-                # Count formula for In Scope (checking for various boolean values)
-                count_formula = '=COUNTIFS(ServerList!J:J,"yes")+COUNTIFS(ServerList!J:J,"true")+COUNTIFS(ServerList!J:J,"1")+COUNTIFS(ServerList!J:J,"X")+COUNTIFS(ServerList!J:J,"y")'
-                summary_ws.cell(row=current_row, column=3, value=count_formula)
-                
-                # CPU sum formula for In Scope
-                cpu_formula = '=SUMIFS(ServerList!C:C,ServerList!J:J,"yes")+SUMIFS(ServerList!C:C,ServerList!J:J,"true")+SUMIFS(ServerList!C:C,ServerList!J:J,"1")+SUMIFS(ServerList!C:C,ServerList!J:J,"X")+SUMIFS(ServerList!C:C,ServerList!J:J,"y")'
-                summary_ws.cell(row=current_row, column=4, value=cpu_formula)
-                
-                # Memory sum formula for In Scope
-                memory_formula = '=SUMIFS(ServerList!D:D,ServerList!J:J,"yes")+SUMIFS(ServerList!D:D,ServerList!J:J,"true")+SUMIFS(ServerList!D:D,ServerList!J:J,"1")+SUMIFS(ServerList!D:D,ServerList!J:J,"X")+SUMIFS(ServerList!D:D,ServerList!J:J,"y")'
-                summary_ws.cell(row=current_row, column=5, value=memory_formula)
-                
-                # Provisioned Disk sum formula for In Scope
-                disk_prov_formula = '=SUMIFS(ServerList!E:E,ServerList!J:J,"yes")+SUMIFS(ServerList!E:E,ServerList!J:J,"true")+SUMIFS(ServerList!E:E,ServerList!J:J,"1")+SUMIFS(ServerList!E:E,ServerList!J:J,"X")+SUMIFS(ServerList!E:E,ServerList!J:J,"y")'
-                summary_ws.cell(row=current_row, column=6, value=disk_prov_formula)
-                
-                # In Use Disk sum formula for In Scope
-                disk_used_formula = '=SUMIFS(ServerList!F:F,ServerList!J:J,"yes")+SUMIFS(ServerList!F:F,ServerList!J:J,"true")+SUMIFS(ServerList!F:F,ServerList!J:J,"1")+SUMIFS(ServerList!F:F,ServerList!J:J,"X")+SUMIFS(ServerList!F:F,ServerList!J:J,"y")'
-                summary_ws.cell(row=current_row, column=7, value=disk_used_formula)
-                
-                current_row += 1
-                
-                # Add "Not In Scope" row for DR
-                summary_ws.cell(row=current_row, column=1, value='DR Scope')
-                summary_ws.cell(row=current_row, column=2, value='Not In Scope')
-                
-                # Count formula for Not In Scope (everything except yes/true/1/X)
-                count_formula = '=COUNTIFS(ServerList!J:J,"<>yes",ServerList!J:J,"<>true",ServerList!J:J,"<>1",ServerList!J:J,"<>X",ServerList!J:J,"<>y")'
-                summary_ws.cell(row=current_row, column=3, value=count_formula)
-                
-                # CPU sum formula for Not In Scope
-                cpu_formula = '=SUMIFS(ServerList!C:C,ServerList!J:J,"<>yes",ServerList!J:J,"<>true",ServerList!J:J,"<>1",ServerList!J:J,"<>X",ServerList!J:J,"<>y")'
-                summary_ws.cell(row=current_row, column=4, value=cpu_formula)
-                
-                # Memory sum formula for Not In Scope
-                memory_formula = '=SUMIFS(ServerList!D:D,ServerList!J:J,"<>yes",ServerList!J:J,"<>true",ServerList!J:J,"<>1",ServerList!J:J,"<>X",ServerList!J:J,"<>y")'
-                summary_ws.cell(row=current_row, column=5, value=memory_formula)
-                
-                # Provisioned Disk sum formula for Not In Scope
-                disk_prov_formula = '=SUMIFS(ServerList!E:E,ServerList!J:J,"<>yes",ServerList!J:J,"<>true",ServerList!J:J,"<>1",ServerList!J:J,"<>X",ServerList!J:J,"<>y")'
-                summary_ws.cell(row=current_row, column=6, value=disk_prov_formula)
-                
-                # In Use Disk sum formula for Not In Scope
-                disk_used_formula = '=SUMIFS(ServerList!F:F,ServerList!J:J,"<>yes",ServerList!J:J,"<>true",ServerList!J:J,"<>1",ServerList!J:J,"<>X",ServerList!J:J,"<>y")'
-                summary_ws.cell(row=current_row, column=7, value=disk_used_formula)
-                
-                current_row += 1
-                
-                # Add DR Scope subtotal
-                dr_start_row = current_row - 2  # Row where DR section started
-                summary_ws.cell(row=current_row, column=1, value='DR Scope Subtotal')
-                summary_ws.cell(row=current_row, column=2, value='')
-                summary_ws.cell(row=current_row, column=3, value=f'=SUM(C{dr_start_row}:C{current_row-1})')
-                summary_ws.cell(row=current_row, column=4, value=f'=SUM(D{dr_start_row}:D{current_row-1})')
-                summary_ws.cell(row=current_row, column=5, value=f'=SUM(E{dr_start_row}:E{current_row-1})')
-                summary_ws.cell(row=current_row, column=6, value=f'=SUM(F{dr_start_row}:F{current_row-1})')
-                summary_ws.cell(row=current_row, column=7, value=f'=SUM(G{dr_start_row}:G{current_row-1})')
-                current_row += 2  # Add extra blank row after subtotal
-                
-                # Format the Summary tab
-                for col in range(1, len(summary_headers) + 1):
-                    summary_ws.column_dimensions[chr(64 + col)].width = 20
-                
-                # Close the Excel writer to write to the BytesIO object
-                output.close()
-                
-                # Create download button with the in-memory file
+                # Create download button with the cached workbook
                 st.download_button(
                     label="Download processed Excel file",
-                    data=excel_file,
-                    file_name=output_filename,
+                    data=result.xlsx_bytes,
+                    file_name=download_filename(uploaded_files),
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
                 
-                # Close the BytesIO object
-                excel_file.close()
+                if host_profile is not None:
+                    show_capacity_plan(server_list, host_profile, plan_scope, cache_key, download_filename(uploaded_files))
+        except MemoryBudgetExceeded as e:
+            st.error(str(e))
         except Exception as e:
             st.error(f"Error processing file: {str(e)}")
+    
+    show_cache_stats(cache)
+    show_job_stats(jobs)
+    
+    # Refresh until the running job finishes
+    if running_job is not None:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
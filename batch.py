@@ -0,0 +1,333 @@
+"""Headless batch processing of RVtools exports.
+
+Processes every export in a directory or glob on a process pool and writes a
+<name>-processed.xlsx next to each one (or into --output-dir, keeping the
+exports' subfolders):
+
+    python batch.py exports/ --workers 4
+    python batch.py "exports/*/*.xlsx" --output-dir processed/ --summary-mode values
+
+With --merge the exports are combined into a single de-duplicated workbook
+with a Source column instead:
+
+    python batch.py exports/ --merge all-vcenters-processed.xlsx
+
+--formats picks the outputs: the xlsx workbook, a gzip CSV and/or a Parquet
+file of the ServerList, e.g. --formats parquet for pipelines that never open
+the workbook. ServerLists longer than an Excel sheet are split across
+numbered ServerList sheets in the workbook.
+
+--capacity-plan adds a Capacity Plan sheet with the target hosts needed per
+cluster and per OS, for the host profile given by the --host-* options:
+
+    python batch.py exports/ --capacity-plan --plan-scope powered-on --host-cores 48 --host-memory-gb 1024
+
+--diagnostics LOG writes per-phase timings for each export as JSON lines.
+Exports are parsed through a memory map, and with RVTOOLS_MEMORY_BUDGET_MB
+set, exports estimated to need more memory than that are skipped with an error.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from buffers import MemoryBudgetExceeded, estimate_peak_mb, memory_budget_mb, open_mapped
+from capacity import (CAPACITY_SHEET, DEFAULT_PLAN_SCOPE, PLAN_SCOPES, HostProfile, capacity_rows,
+                      empty_scope_message, plan_capacity)
+from enrichment import sheet_specs
+from instrumentation import Instrumentation, configure_json_log, log_run
+from merge import merge_exports
+from processor import OUTPUT_EXTENSIONS, OUTPUT_FORMATS, output_filename, process_rvtools_file, save_outputs
+from reader import VINFO_SHEET, pool_context
+from summary import DEFAULT_SUMMARY_MODE, SUMMARY_MODES
+
+EXPORT_EXTENSIONS = ('.xlsx', '.xls')
+
+
+@dataclass
+class FileResult:
+    """Outcome of processing one export"""
+    path: str
+    output_paths: list = field(default_factory=list)
+    rows: int = 0
+    input_bytes: int = 0
+    seconds: float = 0.0
+    error: str = None
+    warnings: list = field(default_factory=list)
+    diagnostics: dict = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _is_export(path):
+    """RVtools exports, skipping our own outputs and Excel lock files"""
+    name = os.path.basename(path)
+    return (name.lower().endswith(EXPORT_EXTENSIONS)
+            and not name.startswith('~$')
+            and not os.path.splitext(name)[0].endswith('-processed'))
+
+
+def find_exports(patterns):
+    """Expand directories, globs and file paths into a sorted list of exports"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern) or [pattern]
+        paths.update(path for path in candidates if os.path.isfile(path) and _is_export(path))
+    return sorted(paths)
+
+
+def check_memory_budget(path, enrich=False):
+    """Raise MemoryBudgetExceeded if the export is estimated to need more than RVTOOLS_MEMORY_BUDGET_MB"""
+    budget = memory_budget_mb()
+    if budget is None:
+        return
+    sheet_names = [VINFO_SHEET] + (list(sheet_specs) if enrich else [])
+    estimate = estimate_peak_mb([path], sheet_names)
+    if estimate > budget:
+        raise MemoryBudgetExceeded(estimate, budget)
+
+
+def merge_output_paths(output_path, formats):
+    """Output path for each format of a merge, sharing output_path's base name"""
+    base = output_path
+    for extension in OUTPUT_EXTENSIONS.values():
+        if output_path.lower().endswith(extension):
+            base = output_path[:-len(extension)]
+            break
+    return {fmt: base + OUTPUT_EXTENSIONS[fmt] for fmt in formats}
+
+
+def capacity_sheet(server_list, host_profile=None, plan_scope=DEFAULT_PLAN_SCOPE):
+    """Extra sheets holding the capacity plan, and a warning when the plan is skipped.
+
+    There is no plan without a host profile, and none is written when the
+    scope selects no VMs.
+    """
+    if host_profile is None:
+        return None, None
+    plans = plan_capacity(server_list, host_profile, plan_scope)
+    if not next(iter(plans.values())).attrs['vms']:
+        return None, empty_scope_message(plan_scope)
+    return {CAPACITY_SHEET: capacity_rows(plans, host_profile, plan_scope)}, None
+
+
+def process_export(path, output_dir=None, summary_mode=DEFAULT_SUMMARY_MODE, enrich=False, diagnostics=False,
+                   formats=('xlsx',), host_profile=None, plan_scope=DEFAULT_PLAN_SCOPE):
+    """Process a single export and write its workbook, capturing any error"""
+    result = FileResult(path)
+    instrumentation = Instrumentation(label=path) if diagnostics else None
+    progress = instrumentation.progress() if instrumentation else None
+    start = time.perf_counter()
+    try:
+        result.input_bytes = os.path.getsize(path)
+        check_memory_budget(path, enrich)
+        with open_mapped(path) as f:
+            server_list = process_rvtools_file(f, enrich=enrich, workers=1, progress=progress)
+        result.rows = len(server_list)
+
+        paths = {fmt: os.path.join(output_dir or os.path.dirname(path), output_filename(path, fmt)) for fmt in formats}
+        extra_sheets = None
+        if 'xlsx' in formats:
+            extra_sheets, warning = capacity_sheet(server_list, host_profile, plan_scope)
+            if warning:
+                result.warnings.append(warning)
+        save_outputs(server_list, paths, summary_mode, progress=progress, extra_sheets=extra_sheets)
+        result.output_paths = list(paths.values())
+    except Exception as e:
+        result.output_paths = []
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    if instrumentation:
+        instrumentation.finish()
+        result.diagnostics = instrumentation.to_dict()
+    return result
+
+
+def output_dirs(paths, output_dir=None, formats=('xlsx',)):
+    """Directory each export's outputs are written to.
+
+    Without output_dir that is the export's own directory. With it, the
+    exports' subdirectories below their common parent are kept, so same-named
+    exports from different folders do not overwrite each other. Raises
+    ValueError if two exports would still write the same output file.
+    """
+    if output_dir and paths:
+        parents = [os.path.dirname(os.path.abspath(path)) for path in paths]
+        common = os.path.commonpath(parents)
+        dirs = [os.path.normpath(os.path.join(output_dir, os.path.relpath(parent, common))) for parent in parents]
+    else:
+        dirs = [os.path.dirname(path) for path in paths]
+
+    claimed = {}
+    for path, directory in zip(paths, dirs):
+        for fmt in formats:
+            output_path = os.path.normcase(os.path.abspath(os.path.join(directory, output_filename(path, fmt))))
+            if output_path in claimed:
+                raise ValueError(f"{claimed[output_path]} and {path} would both be written to {output_path}; "
+                                 f"rename one of them or process them separately")
+            claimed[output_path] = path
+    return dirs
+
+
+def run_batch(paths, output_dir=None, workers=None, summary_mode=DEFAULT_SUMMARY_MODE, enrich=False,
+              diagnostics=False, formats=('xlsx',), host_profile=None, plan_scope=DEFAULT_PLAN_SCOPE):
+    """Process exports across a process pool, yielding each FileResult as it completes.
+
+    Raises ValueError before processing anything if two exports would write the same output.
+    """
+    dirs = output_dirs(paths, output_dir, formats)
+    for directory in set(dirs):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    if workers == 1:
+        for path, directory in zip(paths, dirs):
+            yield process_export(path, directory, summary_mode, enrich, diagnostics, formats, host_profile, plan_scope)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        futures = [pool.submit(process_export, path, directory, summary_mode, enrich, diagnostics, formats,
+                               host_profile, plan_scope) for path, directory in zip(paths, dirs)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Process a batch of RVtools exports into ServerList/Summary workbooks")
+    parser.add_argument('inputs', nargs='+', help="Directories, glob patterns or export files to process")
+    parser.add_argument('-o', '--output-dir', help="Directory for the processed workbooks (default: next to each export)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: CPU count)")
+    parser.add_argument('--summary-mode', choices=SUMMARY_MODES, default=DEFAULT_SUMMARY_MODE, help="How the Summary tab is written")
+    parser.add_argument('--merge', metavar='OUTPUT', help="Merge every export into a single workbook written to OUTPUT")
+    parser.add_argument('--enrich', action='store_true', help="Add host, disk, datastore and NIC details from the other tabs")
+    parser.add_argument('--diagnostics', metavar='LOG', help="Write per-phase timings as JSON lines to LOG ('-' for stderr)")
+    parser.add_argument('--formats', nargs='+', choices=OUTPUT_FORMATS, default=['xlsx'],
+                        help="Outputs to write: xlsx workbook, gzip csv and/or parquet (default: xlsx)")
+
+    defaults = HostProfile()
+    planning = parser.add_argument_group("capacity planning", "Add a Capacity Plan sheet with the target hosts needed")
+    planning.add_argument('--capacity-plan', action='store_true', help="Pack the VMs onto target hosts of this profile")
+    planning.add_argument('--plan-scope', choices=PLAN_SCOPES, default=DEFAULT_PLAN_SCOPE,
+                          help="VMs to pack: Prod or DR scope, powered on, or all (default: powered-on)")
+    planning.add_argument('--host-cores', type=int, default=defaults.cores, help="Physical cores per host")
+    planning.add_argument('--host-memory-gb', type=float, default=defaults.memory_gb, help="Memory per host in GB")
+    planning.add_argument('--host-storage-gb', type=float, default=defaults.storage_gb, help="Disk per host in GB")
+    planning.add_argument('--cpu-overcommit', type=float, default=defaults.cpu_overcommit, help="vCPUs per core")
+    planning.add_argument('--memory-overcommit', type=float, default=defaults.memory_overcommit,
+                          help="Memory overcommit ratio")
+    planning.add_argument('--storage-overcommit', type=float, default=defaults.storage_overcommit,
+                          help="Disk overcommit ratio")
+    planning.add_argument('--spare-hosts', type=int, default=defaults.spare_hosts,
+                          help="Spare hosts added per cluster and OS (default: 1, for N+1)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def host_profile_from_args(args):
+    """HostProfile from the capacity planning options, or None when planning is off"""
+    if not args.capacity_plan:
+        return None
+    return HostProfile(args.host_cores, args.host_memory_gb, args.host_storage_gb, args.cpu_overcommit,
+                       args.memory_overcommit, args.storage_overcommit, args.spare_hosts)
+
+
+def run_merge(paths, output_path, workers=None, summary_mode=DEFAULT_SUMMARY_MODE, enrich=False,
+              diagnostics=False, formats=('xlsx',), host_profile=None, plan_scope=DEFAULT_PLAN_SCOPE):
+    """Merge the exports into one workbook, returning an exit status"""
+    instrumentation = Instrumentation(label=output_path) if diagnostics else None
+    progress = instrumentation.progress() if instrumentation else None
+    start = time.perf_counter()
+    try:
+        server_list, errors = merge_exports([(path, path) for path in paths], workers, enrich, progress)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    output_paths = merge_output_paths(output_path, formats)
+    extra_sheets = None
+    if 'xlsx' in formats:
+        extra_sheets, warning = capacity_sheet(server_list, host_profile, plan_scope)
+        if warning:
+            print(f"Warning: {warning}", file=sys.stderr)
+    try:
+        save_outputs(server_list, output_paths, summary_mode, progress, extra_sheets)
+    except Exception as e:
+        print(f"Could not write {', '.join(output_paths.values())}: {type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+    if instrumentation:
+        instrumentation.finish()
+        log_run(instrumentation.to_dict(), rows=len(server_list), files=len(paths))
+
+    print(f"Merged {len(paths) - len(errors)} of {len(paths)} export(s) into {', '.join(output_paths.values())} "
+          f"({len(server_list)} VMs, {server_list.attrs['duplicates']} duplicates removed, {elapsed:.2f}s)")
+    if errors:
+        print(f"{len(errors)} export(s) failed:", file=sys.stderr)
+        for path, error in errors.items():
+            print(f"  {path}: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = find_exports(args.inputs)
+    if not paths:
+        print("No RVtools exports found", file=sys.stderr)
+        return 2
+
+    if args.diagnostics:
+        configure_json_log(args.diagnostics)
+
+    host_profile = host_profile_from_args(args)
+    if args.merge:
+        return run_merge(paths, args.merge, args.workers, args.summary_mode, args.enrich, bool(args.diagnostics),
+                         args.formats, host_profile, args.plan_scope)
+
+    try:
+        output_dirs(paths, args.output_dir, args.formats)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    print(f"Processing {len(paths)} export(s) with {args.workers} worker(s)")
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(paths, args.output_dir, args.workers, args.summary_mode, args.enrich,
+                            bool(args.diagnostics), args.formats, host_profile, args.plan_scope):
+        results.append(result)
+        if result.diagnostics:
+            log_run(result.diagnostics, rows=result.rows, input_bytes=result.input_bytes, error=result.error)
+        if result.ok:
+            print(f"  ok      {result.path} -> {', '.join(result.output_paths)} ({result.rows} VMs, {result.seconds:.2f}s)")
+            for warning in result.warnings:
+                print(f"  warning {result.path}: {warning}", file=sys.stderr)
+        else:
+            print(f"  FAILED  {result.path}: {result.error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    succeeded = [result for result in results if result.ok]
+    failed = [result for result in results if not result.ok]
+    rows = sum(result.rows for result in succeeded)
+    megabytes = sum(result.input_bytes for result in results) / 1024 / 1024
+    print(f"Processed {len(succeeded)} of {len(results)} export(s) in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.2f} files/s, {rows / elapsed:.0f} VMs/s, {megabytes / elapsed:.1f} MB/s)")
+    if failed:
+        print(f"{len(failed)} export(s) failed:", file=sys.stderr)
+        for result in failed:
+            print(f"  {result.path}: {result.error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
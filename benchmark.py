@@ -0,0 +1,270 @@
+"""Phase-level benchmarks for processing synthetic RVtools exports.
+
+Each size is timed through the read, normalize, enrich, summary, capacity and
+write phases separately (best of --repeat runs), then run once more under
+tracemalloc to record each phase's peak memory. Results can be saved as a JSON baseline and
+later runs compared against it, failing when a phase regresses by more than
+the threshold:
+
+    python benchmark.py --sizes 1000 10000 --save-baseline
+    python benchmark.py --sizes 1000 10000 --threshold 0.2
+
+With --users the job throughput under that many concurrent users is also
+measured, through the same job manager the app uses.
+
+Synthetic exports are generated once and kept in the data directory.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from capacity import HostProfile, plan_capacity
+from enrichment import enrich_server_list, sheet_specs, vinfo_mappings
+from jobs import DEFAULT_MAX_CONCURRENT, JobManager
+from normalize import normalize_server_list
+from processor import build_output_workbook, process_rvtools_file
+from reader import VINFO_SHEET, XlsxPackage, column_mappings, dtype_plan, optional_mappings, read_sheets
+from summary import DEFAULT_SUMMARY_MODE, SUMMARY_MODES, summary_rows
+from synthetic import SIZES, write_export
+from workbook_writer import write_workbook
+
+PHASES = ['read', 'normalize', 'enrich', 'summary', 'capacity', 'write']
+
+DEFAULT_DATA_DIR = os.path.join('benchmarks', 'data')
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+
+# Allowed slowdown or memory growth over the baseline, as a fraction
+DEFAULT_THRESHOLD = 0.25
+
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.05
+MIN_PEAK_MB_DELTA = 5.0
+
+
+def export_path(vms, data_dir=DEFAULT_DATA_DIR):
+    """Path of the synthetic export for a size, generating it on first use"""
+    path = os.path.join(data_dir, f'rvtools-{vms}.xlsx')
+    # Exports generated before the enrichment tabs were added are regenerated
+    if not os.path.exists(path) or not _has_tabs(path, sheet_specs):
+        os.makedirs(data_dir, exist_ok=True)
+        write_export(path, vms)
+    return path
+
+
+def _has_tabs(path, names):
+    with XlsxPackage(path) as package:
+        return all(name in package.sheet_paths for name in names)
+
+
+def _run_phases(path, summary_mode):
+    """Run each phase once, yielding (phase, rows, columns) as each one finishes"""
+    # vInfo as processing with enrichment reads it, with the UUID and host columns
+    vinfo_spec = {'mappings': column_mappings, 'plan': dtype_plan,
+                  'optional': {**optional_mappings, **vinfo_mappings}}
+    with open(path, 'rb') as f:
+        raw = read_sheets(f, {VINFO_SHEET: vinfo_spec}, required=(VINFO_SHEET,))[VINFO_SHEET]
+    yield 'read', raw.shape
+
+    server_list, _ = normalize_server_list(raw)
+    for col in ['In Scope for Prod?', 'In Scope for DR?', 'Notes']:
+        server_list[col] = ''
+    yield 'normalize', server_list.shape
+
+    with open(path, 'rb') as f:
+        sheets = read_sheets(f, sheet_specs)
+    server_list = enrich_server_list(server_list, sheets)
+    yield 'enrich', server_list.shape
+
+    rows = summary_rows(server_list, summary_mode)
+    yield 'summary', (len(rows), max(len(row) for row in rows))
+
+    plans = plan_capacity(server_list, HostProfile(), 'all')
+    yield 'capacity', (len(server_list), sum(len(plan) for plan in plans.values()))
+
+    output, _ = write_workbook(server_list, summary_mode=summary_mode, summary=rows)
+    output.close()
+    yield 'write', server_list.shape
+
+
+def time_phases(path, summary_mode=DEFAULT_SUMMARY_MODE, repeat=3):
+    """Best wall time of each phase over repeat runs, with the shape each phase produced"""
+    results = {phase: {'seconds': float('inf')} for phase in PHASES}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for phase, (rows, columns) in _run_phases(path, summary_mode):
+            now = time.perf_counter()
+            result = results[phase]
+            result.update(seconds=min(result['seconds'], now - start), rows=rows, columns=columns)
+            start = now
+    return results
+
+
+def measure_peak_memory(path, summary_mode=DEFAULT_SUMMARY_MODE):
+    """Peak traced memory in MB of each phase, run once under tracemalloc"""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for phase, _ in _run_phases(path, summary_mode):
+            peaks[phase] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.reset_peak()
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def _process_job(job, path, summary_mode):
+    with open(path, 'rb') as f:
+        server_list = process_rvtools_file(f, progress=job.report)
+    # Like the app's jobs, keep only the write stats rather than the workbook
+    _, write_stats = build_output_workbook(server_list, summary_mode, progress=job.report)
+    return write_stats
+
+
+def measure_throughput(path, users, max_concurrent=DEFAULT_MAX_CONCURRENT, summary_mode=DEFAULT_SUMMARY_MODE):
+    """Submit one job per simulated user at once and return the job manager's stats once all finish"""
+    manager = JobManager(max_concurrent=max_concurrent, max_queued=users)
+    try:
+        for user in range(users):
+            manager.submit(f'user-{user}', path, lambda job: _process_job(job, path, summary_mode))
+        while not all(job.finished for job in manager.jobs()):
+            time.sleep(0.05)
+        return manager.stats()
+    finally:
+        manager.shutdown()
+
+
+def run_benchmarks(sizes=SIZES, data_dir=DEFAULT_DATA_DIR, summary_mode=DEFAULT_SUMMARY_MODE,
+                   repeat=3, memory=True):
+    """Benchmark every size, returning a JSON-ready results dict"""
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'summary_mode': summary_mode,
+        'sizes': {},
+    }
+    for vms in sizes:
+        path = export_path(vms, data_dir)
+        phases = time_phases(path, summary_mode, repeat)
+        if memory:
+            for phase, peak in measure_peak_memory(path, summary_mode).items():
+                phases[phase]['peak_mb'] = round(peak, 1)
+        for result in phases.values():
+            result['seconds'] = round(result['seconds'], 4)
+        results['sizes'][str(vms)] = phases
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Regressions against the baseline as (size, phase, metric, baseline value, current value)"""
+    regressions = []
+    for size, phases in results['sizes'].items():
+        for phase, result in phases.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(phase)
+            if previous is None:
+                continue
+            for metric, min_delta in [('seconds', MIN_SECONDS_DELTA), ('peak_mb', MIN_PEAK_MB_DELTA)]:
+                if metric not in result or metric not in previous:
+                    continue
+                before, after = previous[metric], result[metric]
+                if after > before * (1 + threshold) and after - before > min_delta:
+                    regressions.append((size, phase, metric, before, after))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    """Table of phase timings and peaks, with the change against the baseline when given"""
+    print(f"{'VMs':>8}  {'phase':<10} {'seconds':>9} {'peak MB':>9} {'vs baseline':>12}")
+    for size, phases in results['sizes'].items():
+        for phase, result in phases.items():
+            change = ''
+            previous = (baseline or {}).get('sizes', {}).get(size, {}).get(phase)
+            if previous and previous.get('seconds'):
+                change = f"{result['seconds'] / previous['seconds'] - 1:+.0%}"
+            peak = result.get('peak_mb')
+            print(f"{size:>8}  {phase:<10} {result['seconds']:>9.3f} "
+                  f"{peak if peak is not None else '-':>9} {change:>12}")
+
+
+def load_baseline(path):
+    """Saved baseline results, or None if there is none yet"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path):
+    """Write results as the new baseline"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RVtools processing phases on synthetic exports")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="VM counts to benchmark")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Directory for the generated exports")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Save these results as the new baseline")
+    parser.add_argument('--output', help="Also write these results to a JSON file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed regression over the baseline as a fraction (default: 0.25)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per size, the best is kept")
+    parser.add_argument('--summary-mode', choices=SUMMARY_MODES, default=DEFAULT_SUMMARY_MODE,
+                        help="How the Summary tab is written")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak memory run")
+    parser.add_argument('--users', type=int, default=0,
+                        help="Also measure job throughput with this many concurrent users on the smallest size")
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_CONCURRENT,
+                        help="Concurrent job cap for the throughput run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args.sizes, args.data_dir, args.summary_mode, args.repeat, not args.no_memory)
+    baseline = load_baseline(args.baseline)
+    print_results(results, baseline)
+
+    if args.users:
+        size = min(args.sizes)
+        stats = measure_throughput(export_path(size, args.data_dir), args.users, args.max_jobs, args.summary_mode)
+        results['throughput'] = {'vms': size, 'users': args.users, **stats}
+        print(f"{args.users} concurrent users on {size} VMs with {args.max_jobs} job slot(s): "
+              f"{stats['jobs_per_minute']:.1f} jobs/min, {stats['rows_per_second']:,.0f} rows/s, "
+              f"mean wait {stats['mean_wait_seconds']:.2f}s, mean run {stats['mean_run_seconds']:.2f}s")
+
+    if args.output:
+        save_baseline(results, args.output)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}:", file=sys.stderr)
+        for size, phase, metric, before, after in regressions:
+            print(f"  {size} VMs {phase} {metric}: {before} -> {after}", file=sys.stderr)
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
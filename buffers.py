@@ -0,0 +1,224 @@
+"""Upload buffers, disk spill and the peak-memory budget.
+
+Uploads are hashed and handed to jobs as views of the buffer Streamlit
+already holds rather than as copies, and small uploads are parsed straight
+from that view. Above a size threshold the upload is spooled to a temporary
+file and parsed through a read-only memory map, so the parser reads from the
+page cache instead of a second in-memory copy.
+
+Before a job starts, its peak memory is estimated from the uncompressed size
+of the sheets it will parse. Jobs whose estimate exceeds the configured
+budget are refused up front rather than running the container out of memory.
+"""
+import io
+import mmap
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+from reader import XlsxPackage
+
+# Uploads larger than this are spooled to disk and memory-mapped for parsing
+DEFAULT_SPOOL_THRESHOLD_MB = 64
+
+# Spooled uploads are written in slices of this size
+SPOOL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Peak working set model, fitted on synthetic exports: a fixed overhead plus
+# a share of the uncompressed sheet XML that is parsed. Legacy .xls files
+# are not zipped, so their file size is used with a larger factor.
+BASE_PEAK_MB = 32
+PEAK_MB_PER_XML_MB = 0.75
+PEAK_MB_PER_XLS_MB = 8
+
+
+class MemoryBudgetExceeded(ValueError):
+    """Raised when a job is estimated to need more memory than the budget allows"""
+
+    def __init__(self, estimate_mb, budget_mb):
+        self.estimate_mb = estimate_mb
+        self.budget_mb = budget_mb
+        super().__init__(
+            f"Processing this upload needs about {estimate_mb:,.0f} MB, more than the "
+            f"{budget_mb:,.0f} MB memory budget. Split the export or raise RVTOOLS_MEMORY_BUDGET_MB."
+        )
+
+
+def spool_threshold_bytes():
+    """Spool threshold from RVTOOLS_SPOOL_THRESHOLD_MB, in bytes"""
+    threshold_mb = float(os.environ.get('RVTOOLS_SPOOL_THRESHOLD_MB') or DEFAULT_SPOOL_THRESHOLD_MB)
+    return int(threshold_mb * 1024 * 1024)
+
+
+def memory_budget_mb():
+    """Peak-memory budget from RVTOOLS_MEMORY_BUDGET_MB, or None for no limit"""
+    budget = os.environ.get('RVTOOLS_MEMORY_BUDGET_MB')
+    return float(budget) if budget else None
+
+
+def spool(name, buffer, threshold=None, directory=None):
+    """A BufferFile over a small upload, or the path of a temporary copy on disk for a large one.
+
+    buffer is any bytes-like object (e.g. a memoryview of the upload). The
+    caller releases the view or removes the temporary file with release()
+    when done.
+    """
+    threshold = spool_threshold_bytes() if threshold is None else threshold
+    view = memoryview(buffer)
+    if view.nbytes <= threshold:
+        return BufferFile(view)
+
+    suffix = os.path.splitext(name)[1] or '.xlsx'
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as f:
+        for start in range(0, view.nbytes, SPOOL_CHUNK_SIZE):
+            f.write(view[start:start + SPOOL_CHUNK_SIZE])
+    return f.name
+
+
+def release(source):
+    """Remove a spooled upload, or release the view of a small one"""
+    if isinstance(source, str):
+        if os.path.exists(source):
+            os.remove(source)
+    elif isinstance(source, BufferFile):
+        source.close()
+
+
+class BufferFile(io.RawIOBase):
+    """Seekable read-only file over a bytes-like buffer, which is not copied.
+
+    It pickles as a copy of the bytes, so it can be sent to worker processes.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def __reduce__(self):
+        return BufferFile, (self._view.tobytes(),)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self._view.nbytes}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        end = self._view.nbytes if size is None or size < 0 else self._position + size
+        data = self._view[self._position:end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class MappedFile(io.RawIOBase):
+    """Seekable read-only file over a memory map, which zipfile and pandas can read"""
+
+    def __init__(self, mapped, name=None):
+        super().__init__()
+        self._map = mapped
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._map.tell(), os.SEEK_END: len(self._map)}[whence]
+        # Files may seek past the end, a memory map may not
+        self._map.seek(min(max(base + offset, 0), len(self._map)))
+        return self._map.tell()
+
+    def tell(self):
+        return self._map.tell()
+
+    def read(self, size=-1):
+        return self._map.read(None if size is None or size < 0 else size)
+
+    def readinto(self, buffer):
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def open_mapped(path):
+    """Open a file through a read-only memory map, falling back to the file for empty files"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield MappedFile(mapped, path)
+
+
+@contextmanager
+def open_source(source):
+    """File-like view of an upload given as a BufferFile, bytes or a spooled path"""
+    if isinstance(source, BufferFile):
+        source.seek(0)
+        yield source
+    elif isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    else:
+        with open_mapped(source) as f:
+            yield f
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _source_size(source):
+    """Size in bytes of a file-like object or path"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    _rewind(source)
+    return size
+
+
+def estimate_peak_mb(sources, sheet_names):
+    """Estimated peak memory in MB for parsing the named sheets of each source.
+
+    sources are paths or seekable file-like objects; only the zip directory
+    is read, so this is cheap even for large uploads.
+    """
+    xml_mb = xls_mb = 0.0
+    for source in sources:
+        _rewind(source)
+        if not zipfile.is_zipfile(source):
+            xls_mb += _source_size(source) / 1024 / 1024
+            continue
+        _rewind(source)
+        with XlsxPackage(source) as package:
+            for sheet_name in sheet_names:
+                path = package.sheet_paths.get(sheet_name)
+                if path is not None:
+                    xml_mb += package.archive.getinfo(path).file_size / 1024 / 1024
+        _rewind(source)
+    return BASE_PEAK_MB + PEAK_MB_PER_XML_MB * xml_mb + PEAK_MB_PER_XLS_MB * xls_mb
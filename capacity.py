@@ -0,0 +1,214 @@
+"""Capacity planning: how many target hosts the in-scope VMs need.
+
+Each VM's demand is its CPUs, Memory (GB) and In Use Disk (GB). VMs are
+packed onto hosts of a target profile with first-fit decreasing over all
+three dimensions: largest VMs first (by their largest share of a host), each
+onto the first open host with room in every dimension. The fit test runs
+over NumPy arrays of the open hosts' free capacity, so 100k VMs pack in a
+few seconds. Host counts are given per cluster and per OS, with spare hosts
+added to each for N+1 style headroom.
+
+    plans = plan_capacity(server_list, HostProfile(cores=48, memory_gb=1024))
+    rows = capacity_rows(plans, profile)
+"""
+import io
+import math
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from summary import scope_flag
+
+CAPACITY_SHEET = 'Capacity Plan'
+
+# ServerList columns that make up a VM's demand, in HostProfile.capacity order
+DEMAND_COLUMNS = ['CPUs', 'Memory (GB)', 'In Use Disk (GB)']
+
+# Which VMs are packed: those flagged in a scope column, powered on, or all.
+# Fresh exports have empty scope columns, so the default needs no flags.
+PLAN_SCOPES = ['prod', 'dr', 'powered-on', 'all']
+DEFAULT_PLAN_SCOPE = 'powered-on'
+plan_scope_labels = {
+    'prod': 'In scope for Prod',
+    'dr': 'In scope for DR',
+    'powered-on': 'Powered on',
+    'all': 'All VMs',
+}
+scope_columns = {
+    'prod': 'In Scope for Prod?',
+    'dr': 'In Scope for DR?',
+}
+
+# Groupings hosts are counted for, by ServerList column
+plan_groups = {
+    'Cluster': 'Cluster',
+    'Operating System': 'OS according to the configuration file',
+}
+
+plan_headers = [
+    'Category', 'Sub-Category', 'VMs', 'vCPUs', 'Memory (GB)', 'In Use Disk (GB)',
+    'Minimum Hosts', 'Hosts', 'Hosts with Spares', 'CPU Used %', 'Memory Used %', 'Disk Used %',
+    'Oversized VMs',
+]
+
+
+@dataclass
+class HostProfile:
+    """A target host, its overcommit ratios and the spare hosts kept per group"""
+    cores: int = 32
+    memory_gb: float = 768
+    storage_gb: float = 20000
+    cpu_overcommit: float = 4.0
+    memory_overcommit: float = 1.0
+    storage_overcommit: float = 1.0
+    spare_hosts: int = 1
+
+    @property
+    def capacity(self):
+        """Schedulable vCPUs, memory and disk of one host"""
+        return np.array([
+            self.cores * self.cpu_overcommit,
+            self.memory_gb * self.memory_overcommit,
+            self.storage_gb * self.storage_overcommit,
+        ], dtype=np.float64)
+
+    def describe(self):
+        return (f"{self.cores} cores at {self.cpu_overcommit:g}:1, {self.memory_gb:g} GB memory at "
+                f"{self.memory_overcommit:g}:1, {self.storage_gb:g} GB disk at {self.storage_overcommit:g}:1, "
+                f"N+{self.spare_hosts}")
+
+
+def scoped_vms(server_list, scope=DEFAULT_PLAN_SCOPE):
+    """The ServerList rows to plan for"""
+    if scope == 'all':
+        return server_list
+    if scope == 'powered-on':
+        return server_list[server_list['Powerstate'] == 'poweredOn']
+    if scope in scope_columns:
+        return server_list[scope_flag(server_list[scope_columns[scope]]).to_numpy()]
+    raise ValueError(f"Unknown plan scope: {scope}")
+
+
+def empty_scope_message(scope):
+    """Why no capacity plan was made for a scope that selects no VMs"""
+    message = f"No VMs match the plan scope '{plan_scope_labels[scope]}', so no capacity plan was made."
+    if scope in scope_columns:
+        message += f" Mark VMs in the '{scope_columns[scope]}' column, or plan for powered on or all VMs."
+    return message
+
+
+def demand_matrix(server_list):
+    """VMs x (vCPUs, memory GB, disk GB) as float64, counting missing values as 0"""
+    columns = [pd.to_numeric(server_list[col], errors='coerce').to_numpy(dtype=np.float64, na_value=0.0)
+               for col in DEMAND_COLUMNS]
+    return np.nan_to_num(np.column_stack(columns) if columns[0].size else np.empty((0, 3)), nan=0.0)
+
+
+def first_fit_decreasing(demand, capacity):
+    """Pack demand vectors onto hosts of the given capacity.
+
+    Returns each VM's host number and the number of hosts. A VM larger than a
+    host in any dimension gets a host of its own.
+    """
+    count = len(demand)
+    hosts_of = np.empty(count, dtype=np.int64)
+    if count == 0:
+        return hosts_of, 0
+
+    order = np.argsort(-(demand / capacity).max(axis=1), kind='stable')
+    # Free capacity per dimension of every open host; never more hosts than VMs
+    free_cpu, free_memory, free_disk = (np.empty(count) for _ in range(3))
+    hosts = 0
+    for index in order:
+        cpu, memory, disk = demand[index]
+        fits = (free_cpu[:hosts] >= cpu) & (free_memory[:hosts] >= memory) & (free_disk[:hosts] >= disk)
+        host = int(fits.argmax()) if hosts else 0
+        if hosts == 0 or not fits[host]:
+            host = hosts
+            hosts += 1
+            free_cpu[host], free_memory[host], free_disk[host] = capacity
+        free_cpu[host] -= cpu
+        free_memory[host] -= memory
+        free_disk[host] -= disk
+        hosts_of[index] = host
+    return hosts_of, hosts
+
+
+def _group_plan(demand, codes, labels, profile):
+    """Pack each group's VMs separately and tabulate the hosts it needs"""
+    capacity = profile.capacity
+    oversized = (demand > capacity).any(axis=1)
+    rows = []
+    for code, label in enumerate(labels):
+        group = demand[codes == code]
+        _, hosts = first_fit_decreasing(group, capacity)
+        totals = group.sum(axis=0)
+        used = totals / (hosts * capacity) * 100 if hosts else np.zeros(3)
+        rows.append({
+            'Name': None if pd.isna(label) else label,
+            'VMs': len(group),
+            'vCPUs': int(totals[0]),
+            'Memory (GB)': round(float(totals[1]), 2),
+            'In Use Disk (GB)': round(float(totals[2]), 2),
+            'Minimum Hosts': int(math.ceil((totals / capacity).max())) if len(group) else 0,
+            'Hosts': hosts,
+            'Hosts with Spares': hosts + profile.spare_hosts if hosts else 0,
+            'CPU Used %': round(float(used[0]), 1),
+            'Memory Used %': round(float(used[1]), 1),
+            'Disk Used %': round(float(used[2]), 1),
+            'Oversized VMs': int(oversized[codes == code].sum()),
+        })
+    return pd.DataFrame(rows, columns=['Name'] + plan_headers[2:])
+
+
+def plan_capacity(server_list, profile=None, scope=DEFAULT_PLAN_SCOPE):
+    """Hosts needed per cluster and per OS, as a DataFrame per grouping in plan_groups.
+
+    The DataFrames' attrs record the VMs planned and the seconds the packing took.
+    """
+    profile = profile or HostProfile()
+    start = time.perf_counter()
+    vms = scoped_vms(server_list, scope)
+    demand = demand_matrix(vms)
+
+    plans = {}
+    for category, column in plan_groups.items():
+        codes, labels = pd.factorize(vms[column], use_na_sentinel=False)
+        plans[category] = _group_plan(demand, codes, labels, profile)
+    seconds = time.perf_counter() - start
+    for plan in plans.values():
+        plan.attrs.update(vms=len(vms), seconds=seconds)
+    return plans
+
+
+def capacity_rows(plans, profile, scope=DEFAULT_PLAN_SCOPE):
+    """The Capacity Plan sheet as a list of rows, like the Summary tab"""
+    rows = [[f"Target host: {profile.describe()}"], [f"VMs planned: {plan_scope_labels[scope]}"], [], list(plan_headers)]
+    for category, plan in plans.items():
+        for record in plan.itertuples(index=False):
+            rows.append([category, *record])
+        subtotal = [f'{category} Subtotal', '']
+        for col in plan_headers[2:]:
+            if col.endswith('%'):
+                subtotal.append(None)
+            elif col in ('Memory (GB)', 'In Use Disk (GB)'):
+                subtotal.append(round(float(plan[col].sum()), 2))
+            else:
+                subtotal.append(int(plan[col].sum()))
+        rows.append(subtotal)
+        rows.append([])
+    return rows[:-1]
+
+
+def capacity_workbook(rows):
+    """xlsx bytes with only the Capacity Plan sheet"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(CAPACITY_SHEET)
+    for row in rows:
+        ws.append(row)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
@@ -0,0 +1,148 @@
+"""Optional ServerList enrichment from the vDisk, vHost, vDatastore and vNetwork tabs.
+
+The extra tabs are read in the same pass over the workbook as vInfo, with only
+the columns we need. vDisk and vNetwork are reduced per VM with grouped
+aggregations, and every result is hash-joined onto the ServerList by VM key.
+Tabs that are missing from an export are skipped and their columns left blank.
+"""
+import pandas as pd
+
+from normalize import MIB_PER_GB, coerce_numeric
+
+# Extra vInfo columns read when enriching
+vinfo_mappings = {
+    'Host': ['Host', 'ESX Host'],
+}
+
+sheet_specs = {
+    'vDisk': {
+        'mappings': {
+            'VM': ['VM', 'VM Name', 'Name'],
+            'Capacity MiB': ['Capacity MiB', 'Capacity MB', 'Capacity'],
+            'Path': ['Path', 'Disk Path', 'Filename'],
+        },
+        'optional': {'VM UUID': ['VM UUID', 'UUID']},
+    },
+    'vNetwork': {
+        'mappings': {'VM': ['VM', 'VM Name', 'Name']},
+        'optional': {'VM UUID': ['VM UUID', 'UUID']},
+    },
+    'vHost': {
+        'mappings': {'Host': ['Host', 'Name']},
+        'optional': {'CPU Model': ['CPU Model', 'CPU model']},
+    },
+    'vDatastore': {
+        'mappings': {'Name': ['Name', 'Datastore']},
+        'optional': {'Type': ['Type', 'Datastore Type']},
+    },
+}
+
+# Columns added to the ServerList, after Notes
+enrichment_columns = [
+    'Host',
+    'Host CPU Model',
+    'Disk Count',
+    'Largest Disk (GB)',
+    'Datastore',
+    'Datastore Type',
+    'NIC Count',
+]
+
+
+def _vm_keys(uuids, names):
+    """The VM UUID of each row, or the VM name where the UUID is missing"""
+    keys = 'name\x1f' + names.astype('string')
+    if uuids is None:
+        return keys
+    uuids = uuids.astype('string').str.strip()
+    return ('uuid\x1f' + uuids).where(uuids.notna() & (uuids != ''), keys)
+
+
+def _join_keys(server_list, sheet):
+    """Keys to join a per-VM sheet on, for the ServerList and the sheet rows.
+
+    Each row is keyed on its VM UUID, falling back to the VM name per row, so
+    exports that leave some UUIDs blank still match those VMs by name. A
+    ServerList row whose UUID the sheet never mentions also joins by name.
+    """
+    right = _vm_keys(sheet.get('VM UUID'), sheet['VM'])
+    left = _vm_keys(server_list.get('VM UUID'), server_list['VM Name'])
+    left = left.where(left.isin(right), 'name\x1f' + server_list['VM Name'].astype('string'))
+    return left, right
+
+
+def _join(server_list, per_vm, keys):
+    """Columns of per_vm looked up for each ServerList row by key"""
+    matched = per_vm.reindex(keys.to_numpy())
+    matched.index = server_list.index
+    return pd.concat([server_list, matched], axis=1)
+
+
+def aggregate_disks(vdisk, key):
+    """Disk count, largest disk and the datastore of the largest disk for each VM key"""
+    capacity, _ = coerce_numeric(vdisk['Capacity MiB'])
+    disks = pd.DataFrame({
+        'key': key,
+        'capacity': (capacity.fillna(0) / MIB_PER_GB).round(2),
+        'datastore': vdisk['Path'].astype(str).str.extract(r'^\[([^\]]+)\]', expand=False),
+    })
+
+    grouped = disks.groupby('key', sort=False)
+    per_vm = pd.DataFrame({
+        'Disk Count': grouped.size(),
+        'Largest Disk (GB)': grouped['capacity'].max(),
+    })
+    largest = disks.sort_values('capacity', ascending=False, kind='stable').drop_duplicates('key')
+    per_vm['Datastore'] = largest.set_index('key')['datastore']
+    return per_vm
+
+
+def aggregate_nics(vnetwork, key):
+    """NIC count for each VM key"""
+    return vnetwork.groupby(key, sort=False).size().rename('NIC Count')
+
+
+def enrich_server_list(server_list, sheets):
+    """Join the per-VM disk, NIC, host and datastore details onto the ServerList.
+
+    sheets is the dict returned by read_sheets; the vInfo Host column must
+    already be on the ServerList when host details are wanted.
+    """
+    enriched = server_list.copy()
+    if 'Host' not in enriched.columns:
+        enriched['Host'] = None
+
+    if 'vDisk' in sheets:
+        left, right = _join_keys(enriched, sheets['vDisk'])
+        enriched = _join(enriched, aggregate_disks(sheets['vDisk'], right), left)
+    else:
+        enriched['Disk Count'] = 0
+        enriched['Largest Disk (GB)'] = 0.0
+        enriched['Datastore'] = None
+
+    if 'vNetwork' in sheets:
+        left, right = _join_keys(enriched, sheets['vNetwork'])
+        enriched = _join(enriched, aggregate_nics(sheets['vNetwork'], right).to_frame(), left)
+    else:
+        enriched['NIC Count'] = 0
+
+    hosts = sheets.get('vHost')
+    if hosts is not None and 'CPU Model' in hosts.columns:
+        cpu_models = hosts.drop_duplicates('Host').set_index('Host')['CPU Model']
+        enriched['Host CPU Model'] = enriched['Host'].map(cpu_models)
+    else:
+        enriched['Host CPU Model'] = None
+
+    datastores = sheets.get('vDatastore')
+    if datastores is not None and 'Type' in datastores.columns:
+        types = datastores.drop_duplicates('Name').set_index('Name')['Type']
+        enriched['Datastore Type'] = enriched['Datastore'].map(types)
+    else:
+        enriched['Datastore Type'] = None
+
+    enriched['Disk Count'] = enriched['Disk Count'].fillna(0).astype('int32')
+    enriched['NIC Count'] = enriched['NIC Count'].fillna(0).astype('int32')
+    enriched['Largest Disk (GB)'] = enriched['Largest Disk (GB)'].fillna(0.0)
+    for col in ['Host', 'Host CPU Model', 'Datastore', 'Datastore Type']:
+        enriched[col] = enriched[col].astype('category')
+    return enriched
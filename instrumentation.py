@@ -0,0 +1,146 @@
+"""Per-phase instrumentation of the processing pipeline.
+
+An Instrumentation records wall time, CPU time, peak RSS and the row and
+column counts of each stage reported through the pipeline's progress
+callback (reading, normalizing, summarizing, writing). The clocks are read
+at stage boundaries and RSS by one sampling thread per open stage, so leaving
+it on costs little, and with no progress callback the pipeline does no
+instrumentation work at all.
+
+Finished runs can be logged as one JSON line each to the
+'rvtools.instrumentation' logger, and profile_call captures a cProfile of a
+single run for download.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from workbook_writer import RSSWindow
+
+logger = logging.getLogger('rvtools.instrumentation')
+
+# Number of functions listed in a profile's text report
+PROFILE_REPORT_LIMIT = 40
+
+
+@dataclass
+class PhaseStats:
+    """Measurements for one pipeline stage"""
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_mb: float
+    peak_delta_mb: float
+    rows: Optional[int] = None
+    columns: Optional[int] = None
+
+
+class Instrumentation:
+    """Measures each stage reported through a progress callback.
+
+    CPU time is that of the calling thread; tabs parsed on worker processes
+    show up in wall time only. Each stage's peak RSS is an approximation
+    sampled over that stage alone (see RSSWindow), along with how far it
+    rose above the RSS the stage started at.
+    """
+
+    def __init__(self, label=None):
+        self.label = label
+        self.phases = []
+        self._current = None
+
+    def progress(self, callback=None):
+        """Progress callback that records the stages, then forwards them to callback"""
+        def report(stage, rows=None, columns=None):
+            self.mark(stage, rows, columns)
+            if callback is not None:
+                callback(stage, rows, columns)
+        return report
+
+    def mark(self, stage, rows=None, columns=None):
+        """Close the current stage and start the next one"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self._close(wall, cpu, rows, columns)
+        self._current = (stage, wall, cpu, rows, columns, RSSWindow())
+
+    def _close(self, wall, cpu, rows=None, columns=None):
+        if self._current is None:
+            return
+        stage, started_wall, started_cpu, stage_rows, stage_columns, memory = self._current
+        memory.close()
+        # A stage that started without a size (reading) takes the size it produced
+        if stage_rows is None:
+            stage_rows, stage_columns = rows, columns
+        self.phases.append(PhaseStats(stage, wall - started_wall, cpu - started_cpu, memory.peak_mb(),
+                                      memory.delta_mb(), stage_rows, stage_columns))
+        self._current = None
+
+    def finish(self):
+        """Close the last stage and return the recorded phases"""
+        self._close(time.perf_counter(), time.thread_time())
+        return self.phases
+
+    def to_dict(self):
+        """JSON-ready summary of the run"""
+        return {
+            'label': self.label,
+            'wall_seconds': round(sum(phase.wall_seconds for phase in self.phases), 4),
+            'cpu_seconds': round(sum(phase.cpu_seconds for phase in self.phases), 4),
+            'peak_rss_mb': round(max((phase.peak_rss_mb for phase in self.phases), default=0.0), 1),
+            'phases': [{**asdict(phase),
+                        'wall_seconds': round(phase.wall_seconds, 4),
+                        'cpu_seconds': round(phase.cpu_seconds, 4),
+                        'peak_rss_mb': round(phase.peak_rss_mb, 1),
+                        'peak_delta_mb': round(phase.peak_delta_mb, 1)} for phase in self.phases],
+        }
+
+
+def log_run(run, **fields):
+    """Log one run's instrumentation as a JSON line"""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'run', **fields, **run}, default=str))
+
+
+def configure_json_log(target=None):
+    """Send the instrumentation JSON lines to a file, or to stderr for '-'.
+
+    Defaults to RVTOOLS_DIAGNOSTICS_LOG; does nothing when neither is set.
+    """
+    target = target or os.environ.get('RVTOOLS_DIAGNOSTICS_LOG')
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == '-' else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+@dataclass
+class ProfileReport:
+    """A captured profile: pstats data for tools like snakeviz, and a text summary"""
+    data: bytes
+    text: str
+
+
+def profile_call(fn, *args, **kwargs):
+    """Run fn under cProfile, returning its result and a ProfileReport"""
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.create_stats()
+    # Same format as Profile.dump_stats, so pstats and snakeviz can load it.
+    # Taken first because pstats.Stats empties the profiler's stats.
+    data = marshal.dumps(profiler.stats)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_REPORT_LIMIT)
+    return result, ProfileReport(data, text.getvalue())
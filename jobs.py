@@ -0,0 +1,274 @@
+"""Background processing jobs for the Streamlit app.
+
+Uploads are processed on a bounded thread pool instead of the Streamlit
+script thread, so a large export does not block the session. A semaphore
+caps how many jobs run at once across every session, and an optional
+memory budget holds jobs back until their estimated peak memory fits; the
+rest wait in the queue. Each job reports its stage (reading, normalizing, summarizing,
+writing) and row count as it goes and can be cancelled. Jobs write their
+output to the result cache and only keep its cache key and a small report
+of the run, so finished jobs hold no ServerLists or workbooks.
+
+Cancellation takes effect immediately for queued jobs and at the next stage
+boundary for running ones.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from buffers import MemoryBudgetExceeded, memory_budget_mb
+
+# Stages a job reports, in order
+STAGES = ['queued', 'reading', 'normalizing', 'summarizing', 'writing', 'done']
+
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_MAX_QUEUED = 8
+DEFAULT_KEEP_FINISHED = 20
+
+# How often a queued job checks whether it was cancelled while waiting for a slot
+SLOT_POLL_SECONDS = 0.2
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it was cancelled"""
+
+
+@dataclass
+class Job:
+    """A processing job and its progress"""
+    key: str
+    name: str
+    status: str = 'queued'  # queued, running, done, failed or cancelled
+    stage: str = 'queued'
+    rows: Optional[int] = None
+    memory_mb: float = 0.0
+    cache_key: Optional[str] = None
+    outcome: Any = None
+    error: Optional[str] = None
+    exception: Optional[Exception] = field(default=None, repr=False)
+    warnings: list = field(default_factory=list)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    @property
+    def progress(self):
+        """Fraction of the stages completed, for a progress bar"""
+        # Writing stages name their format, as in 'writing:xlsx'
+        return STAGES.index(self.stage.split(':')[0]) / (len(STAGES) - 1)
+
+    @property
+    def wait_seconds(self):
+        """Time spent queued before a slot was free"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_seconds(self):
+        """Time spent running, so far or in total"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def report(self, stage, rows=None, columns=None):
+        """Progress callback for the processing functions; raises JobCancelled if cancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.stage = stage
+        if rows is not None:
+            self.rows = rows
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class JobManager:
+    """Runs jobs on a bounded pool, at most max_concurrent at a time"""
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, max_queued=DEFAULT_MAX_QUEUED,
+                 keep_finished=DEFAULT_KEEP_FINISHED, memory_budget_mb=None):
+        self.max_concurrent = max_concurrent
+        self.keep_finished = keep_finished
+        self.memory_budget_mb = memory_budget_mb
+        self._reserved_mb = 0.0
+        self._memory = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent + max_queued, thread_name_prefix='rvtools-job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._first_submit = None
+        self._totals = {'done': 0, 'failed': 0, 'cancelled': 0, 'rows': 0, 'wait_seconds': 0.0, 'run_seconds': 0.0}
+
+    @property
+    def workers_per_job(self):
+        """Worker processes each job may parse with, so the running jobs together use about one per CPU"""
+        return max((os.cpu_count() or 1) // self.max_concurrent, 1)
+
+    def get(self, key):
+        """The job for this key, or None"""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key, name, fn, memory_mb=0.0, cache_key=None):
+        """Queue fn(job) under key, returning the job.
+
+        fn stores its output in the result cache under cache_key and returns
+        only a small report of the run, kept as job.outcome. A job already
+        queued, running or finished for the same key is returned instead, so
+        identical uploads are processed once. Failed and cancelled jobs are
+        replaced. memory_mb is the job's estimated peak memory: jobs only start
+        while the running ones leave room for it in the memory budget, and
+        MemoryBudgetExceeded is raised if it can never fit.
+        """
+        if self.memory_budget_mb is not None and memory_mb > self.memory_budget_mb:
+            raise MemoryBudgetExceeded(memory_mb, self.memory_budget_mb)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status not in ('failed', 'cancelled'):
+                return job
+            job = Job(key, name, memory_mb=memory_mb, cache_key=cache_key)
+            self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._first_submit = self._first_submit or job.submitted_at
+            self._futures[key] = self._pool.submit(self._run, job, fn)
+            self._prune()
+        return job
+
+    def discard(self, key):
+        """Forget a finished job, so the next submit for its key processes again"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.finished:
+                del self._jobs[key]
+
+    def cancel(self, key):
+        """Cancel a job: queued jobs stop at once, running ones at their next stage"""
+        with self._lock:
+            job = self._jobs.get(key)
+            future = self._futures.get(key)
+        if job is None or job.finished:
+            return
+        job.cancel()
+        if future is not None and future.cancel():
+            self._finish(job, 'cancelled')
+
+    def _reserve_memory(self, job):
+        """Wait until the job's memory estimate fits in the budget; False if cancelled meanwhile"""
+        if self.memory_budget_mb is None:
+            return True
+        with self._memory:
+            while self._reserved_mb + job.memory_mb > self.memory_budget_mb:
+                if job.cancel_event.is_set():
+                    return False
+                self._memory.wait(SLOT_POLL_SECONDS)
+            self._reserved_mb += job.memory_mb
+        return True
+
+    def _release_memory(self, job):
+        if self.memory_budget_mb is None:
+            return
+        with self._memory:
+            self._reserved_mb -= job.memory_mb
+            self._memory.notify_all()
+
+    def _run(self, job, fn):
+        # Wait for a free slot and room in the memory budget, giving up if
+        # the job is cancelled meanwhile
+        while not self._slots.acquire(timeout=SLOT_POLL_SECONDS):
+            if job.cancel_event.is_set():
+                self._finish(job, 'cancelled')
+                return
+        if not self._reserve_memory(job):
+            self._slots.release()
+            self._finish(job, 'cancelled')
+            return
+        try:
+            job.started_at = time.time()
+            job.status = 'running'
+            job.report('reading')
+            job.outcome = fn(job)
+            job.report('done')
+            self._finish(job, 'done')
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except MemoryError as e:
+            job.error = "Ran out of memory while processing. Try a smaller export or fewer concurrent jobs."
+            job.exception = e
+            self._finish(job, 'failed')
+        except Exception as e:
+            job.error = str(e)
+            job.exception = e
+            self._finish(job, 'failed')
+        finally:
+            self._release_memory(job)
+            self._slots.release()
+
+    def _finish(self, job, status):
+        job.finished_at = time.time()
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                self._futures.pop(job.key, None)
+            self._totals[status] += 1
+            if status == 'done':
+                self._totals['rows'] += job.rows or 0
+                self._totals['wait_seconds'] += job.wait_seconds
+                self._totals['run_seconds'] += job.run_seconds
+            # Set last, so stats already count a job once it shows as finished
+            job.status = status
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond keep_finished"""
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[key]
+
+    def jobs(self):
+        """Every known job, oldest first"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def stats(self):
+        """Job counts, mean wait and run times of completed jobs, and throughput since the first submit"""
+        with self._lock:
+            totals = dict(self._totals)
+            active = [job.status for job in self._jobs.values()]
+        done = totals['done']
+        elapsed = time.time() - self._first_submit if self._first_submit else 0.0
+        return {
+            'queued': active.count('queued'),
+            'running': active.count('running'),
+            'done': done,
+            'failed': totals['failed'],
+            'cancelled': totals['cancelled'],
+            'max_concurrent': self.max_concurrent,
+            'memory_budget_mb': self.memory_budget_mb,
+            'reserved_mb': self._reserved_mb,
+            'rows': totals['rows'],
+            'mean_wait_seconds': totals['wait_seconds'] / done if done else 0.0,
+            'mean_run_seconds': totals['run_seconds'] / done if done else 0.0,
+            'jobs_per_minute': done / elapsed * 60 if elapsed else 0.0,
+            'rows_per_second': totals['rows'] / elapsed if elapsed else 0.0,
+        }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def manager_from_env():
+    """JobManager sized from RVTOOLS_MAX_JOBS (default 2 concurrent jobs) and RVTOOLS_MEMORY_BUDGET_MB"""
+    max_concurrent = int(os.environ.get('RVTOOLS_MAX_JOBS') or DEFAULT_MAX_CONCURRENT)
+    return JobManager(max_concurrent=max(max_concurrent, 1), memory_budget_mb=memory_budget_mb())
@@ -0,0 +1,154 @@
+"""Merge RVtools exports from several vCenters into one ServerList.
+
+Exports are parsed concurrently on a process pool, so merging many files takes
+about as long as the slowest single parse. Each row is tagged with its
+Source (the vCenter from the VI SDK Server column, or the file name) and VMs
+seen in more than one export, whether from overlapping vCenters or repeat
+exports of one vCenter, are dropped through a hash index on the VM UUID and
+on the VM name + cluster; VMs repeated within one export are kept.
+"""
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from buffers import open_mapped
+from normalize import categorical_columns
+from processor import final_columns, process_rvtools_file
+from reader import pool_context
+from summary import SOURCE_COLUMN
+
+UUID_COLUMN = 'VM UUID'
+VCENTER_COLUMN = 'VI SDK Server'
+
+
+def _parse_export(source, enrich=False):
+    """Process one export given as a path, the raw bytes of an upload or a file object"""
+    # Already running on the pool, so the export's own tabs are read in-process
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return process_rvtools_file(io.BytesIO(source), identity_columns=True, enrich=enrich, workers=1)
+    if hasattr(source, 'read'):
+        source.seek(0)
+        return process_rvtools_file(source, identity_columns=True, enrich=enrich, workers=1)
+    with open_mapped(source) as f:
+        return process_rvtools_file(f, identity_columns=True, enrich=enrich, workers=1)
+
+
+def parse_exports(exports, workers=None, enrich=False):
+    """Parse (name, source) pairs concurrently.
+
+    Returns the parsed (name, server_list) pairs in input order and a dict of
+    export name to error message for the exports that failed.
+    """
+    if not exports:
+        return [], {}
+    workers = min(len(exports), workers or os.cpu_count() or 1)
+
+    parsed, errors = [], {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        futures = [(name, pool.submit(_parse_export, source, enrich)) for name, source in exports]
+        for name, future in futures:
+            try:
+                parsed.append((name, future.result()))
+            except Exception as e:
+                errors[name] = str(e)
+    return parsed, errors
+
+
+def _source_labels(name, server_list):
+    """Source for each row: the vCenter when the export names it, otherwise the file name"""
+    fallback = os.path.splitext(os.path.basename(name))[0]
+    if VCENTER_COLUMN in server_list.columns:
+        return server_list[VCENTER_COLUMN].astype(object).fillna(fallback).astype(str)
+    return pd.Series(fallback, index=server_list.index)
+
+
+def _first_seen_elsewhere(keys, exports, valid):
+    """Rows whose key was first seen in a different export; rows not valid never match"""
+    first_export = exports[valid].groupby(keys[valid], sort=False).transform('first')
+    mask = pd.Series(False, index=keys.index)
+    mask[valid] = (first_export != exports[valid]).to_numpy()
+    return mask
+
+
+def duplicate_mask(server_list, exports=None):
+    """Mark rows whose VM UUID, or VM name + cluster, was already seen in an earlier export.
+
+    exports gives the input export each row came from (its position in the
+    merge); without it every row counts as one export. VMs sharing a name
+    within one export are all kept, and rows without a VM name (or UUID) are
+    left out of that match rather than matching each other.
+    """
+    if exports is None:
+        exports = pd.Series(0, index=server_list.index)
+    exports = pd.Series(np.asarray(exports), index=server_list.index)
+
+    names = server_list['VM Name'].astype('string').str.strip()
+    clusters = server_list['Cluster'].astype('string').fillna('')
+    name_cluster = names.str.lower().fillna('') + '\x1f' + clusters.str.lower()
+    has_name = (names.notna() & (names != '')).to_numpy(dtype=bool)
+    duplicates = _first_seen_elsewhere(name_cluster, exports, has_name)
+
+    if UUID_COLUMN in server_list.columns:
+        uuids = server_list[UUID_COLUMN].astype('string').str.strip()
+        has_uuid = (uuids.notna() & (uuids != '')).to_numpy(dtype=bool)
+        duplicates |= _first_seen_elsewhere(uuids.fillna(''), exports, has_uuid)
+    return duplicates
+
+
+def merge_server_lists(parsed):
+    """Combine parsed ServerLists into one, tagged with Source and de-duplicated"""
+    frames = []
+    parse_errors = {}
+    for name, server_list in parsed:
+        frame = server_list.copy()
+        frame[SOURCE_COLUMN] = _source_labels(name, server_list)
+        frames.append(frame)
+        for column, failed in server_list.attrs.get('parse_errors', {}).items():
+            parse_errors[column] = parse_errors.get(column, 0) + failed
+
+    if not frames:
+        raise ValueError("No exports could be processed")
+
+    # Leave all-blank columns (e.g. enrichment tabs an export lacks) out of the
+    # concat so they do not decide the combined dtypes, then restore them
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    combined = pd.concat([frame.dropna(axis=1, how='all') for frame in frames], ignore_index=True)
+    combined = combined.reindex(columns=columns)
+    # Which input each row came from; Source only labels the vCenter, which
+    # two exports of the same vCenter share
+    exports = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+    duplicates = duplicate_mask(combined, exports)
+    combined = combined[~duplicates].reset_index(drop=True)
+
+    # Categories differ between exports, so concat falls back to object
+    for col in categorical_columns + [SOURCE_COLUMN]:
+        combined[col] = combined[col].astype('category')
+
+    # Keep any enrichment columns, dropping the identity columns used above
+    extra_columns = [col for col in combined.columns
+                     if col not in final_columns and col not in (UUID_COLUMN, VCENTER_COLUMN, SOURCE_COLUMN)]
+    combined = combined[final_columns + extra_columns + [SOURCE_COLUMN]]
+    combined.attrs['parse_errors'] = parse_errors
+    combined.attrs['duplicates'] = int(duplicates.sum())
+    return combined
+
+
+def merge_exports(exports, workers=None, enrich=False, progress=None):
+    """Parse and merge (name, source) exports, returning the combined ServerList and any errors.
+
+    progress is called with 'reading' before the exports are parsed and with
+    'normalizing' and the parsed row and column counts before they are combined.
+    """
+    if progress is not None:
+        progress('reading', None, None)
+    parsed, errors = parse_exports(exports, workers, enrich)
+    if not parsed:
+        details = '; '.join(f"{name}: {error}" for name, error in errors.items())
+        raise ValueError(f"No exports could be processed. {details}")
+    if progress is not None:
+        rows = sum(len(server_list) for _, server_list in parsed)
+        progress('normalizing', rows, max(len(server_list.columns) for _, server_list in parsed))
+    return merge_server_lists(parsed), errors
@@ -0,0 +1,67 @@
+"""Vectorized normalization of the projected vInfo columns.
+
+The schema below drives numeric coercion, unit conversion to GB and the
+categorical columns in bulk rather than cell by cell. Cells that fail to parse
+are counted per column and reported instead of silently becoming 0.
+"""
+import pandas as pd
+
+# Divisors for the unit conversions
+MB_PER_GB = 1024
+MIB_PER_GB = 953.7
+
+# Numeric columns: source column, output column and the divisor to reach GB.
+# A divisor of None keeps the value in its original unit.
+numeric_schema = {
+    'CPUs': {'source': 'CPUs', 'divisor': None},
+    'Memory (GB)': {'source': 'Memory', 'divisor': MB_PER_GB},
+    'Provisioned Disk (GB)': {'source': 'Provisioned MB', 'divisor': MIB_PER_GB},
+    'In Use Disk (GB)': {'source': 'In Use MB', 'divisor': MIB_PER_GB},
+}
+
+# Low-cardinality text columns stored as categoricals
+categorical_columns = ['Powerstate', 'Cluster', 'OS according to the configuration file']
+
+
+def coerce_numeric(series):
+    """Coerce a column to numbers, returning the values and how many cells failed to parse"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series, 0
+
+    values = pd.to_numeric(series, errors='coerce')
+    # Only inspect the cells that did not parse, blank cells are not failures
+    unparsed = series[values.isna() & series.notna()]
+    failed = int((unparsed.astype(str).str.strip() != '').sum())
+    return values, failed
+
+
+def to_gb(values, divisor):
+    """Convert a numeric column to GB rounded to two decimals"""
+    return (values.astype('float64') / divisor).round(2)
+
+
+def _downcast_whole_numbers(values):
+    """Store whole-number columns in the smallest integer dtype"""
+    if (values % 1 == 0).all():
+        return pd.to_numeric(values.astype('int64'), downcast='integer')
+    return values
+
+
+def normalize_server_list(df):
+    """Apply the normalization schema, returning the new frame and the per-column parse failures"""
+    normalized = df.copy()
+    parse_errors = {}
+
+    for target_col, spec in numeric_schema.items():
+        values, failed = coerce_numeric(df[spec['source']])
+        parse_errors[spec['source']] = failed
+        values = values.fillna(0)
+        if spec['divisor'] is None:
+            normalized[target_col] = _downcast_whole_numbers(values)
+        else:
+            normalized[target_col] = to_gb(values, spec['divisor'])
+
+    for col in categorical_columns:
+        normalized[col] = normalized[col].astype('category')
+
+    return normalized, parse_errors
@@ -0,0 +1,137 @@
+"""RVtools processing shared by the Streamlit app and the batch CLI.
+
+Nothing here depends on Streamlit: errors are raised to the caller, which
+decides how to report them.
+"""
+import os
+import shutil
+
+from enrichment import enrich_server_list, enrichment_columns, sheet_specs, vinfo_mappings
+from normalize import normalize_server_list
+from reader import VINFO_SHEET, column_mappings, dtype_plan, optional_mappings, read_sheets, read_vinfo
+from side_outputs import SIDE_FORMATS, write_side_output
+from summary import DEFAULT_SUMMARY_MODE, summary_rows
+from workbook_writer import write_workbook
+
+# Column order of the ServerList tab
+final_columns = [
+    'VM Name',
+    'Powerstate',
+    'CPUs',
+    'Memory (GB)',
+    'Provisioned Disk (GB)',
+    'In Use Disk (GB)',
+    'Cluster',
+    'OS according to the configuration file',
+    'In Scope for Prod?',
+    'In Scope for DR?',
+    'Notes'
+]
+
+# Output formats and their extensions: the workbook and its CSV/Parquet side outputs
+OUTPUT_EXTENSIONS = {'xlsx': '.xlsx', **SIDE_FORMATS}
+OUTPUT_FORMATS = list(OUTPUT_EXTENSIONS)
+
+
+def _report(progress, stage, frame=None):
+    """Tell the progress callback, if any, which stage is starting and the size of its input"""
+    if progress is not None:
+        rows, columns = frame.shape if frame is not None else (None, None)
+        progress(stage, rows, columns)
+
+
+def process_rvtools_file(source, identity_columns=False, enrich=False, workers=None, progress=None):
+    """Process the RVtools Excel file and create a new ServerList tab.
+
+    With identity_columns the VM UUID and VI SDK Server columns are kept after
+    the ServerList columns when the export has them. With enrich the host,
+    disk, datastore and NIC details from the other tabs are added after Notes,
+    parsing those tabs on up to workers processes (default: CPU count).
+    progress is called with the stage name, row and column count as each stage starts.
+    Raises MissingColumnError if a required vInfo column cannot be found.
+    """
+    _report(progress, 'reading')
+    # Stream only the mapped columns out of the vInfo tab, plus the
+    # enrichment tabs in the same pass over the workbook
+    sheets = {}
+    if enrich:
+        vinfo_spec = {
+            'mappings': column_mappings,
+            'plan': dtype_plan,
+            'optional': {**optional_mappings, **vinfo_mappings},
+        }
+        specs = {VINFO_SHEET: vinfo_spec, **sheet_specs}
+        sheets = read_sheets(source, specs, required=(VINFO_SHEET,), workers=workers or os.cpu_count() or 1)
+        server_list = sheets.pop(VINFO_SHEET)
+    else:
+        server_list = read_vinfo(source, include_optional=identity_columns)
+
+    # Coerce numbers, convert memory (MB to GB) and disk (MiB to GB) and
+    # store the low-cardinality text columns as categoricals
+    _report(progress, 'normalizing', server_list)
+    server_list, parse_errors = normalize_server_list(server_list)
+
+    # Add new columns
+    server_list['In Scope for Prod?'] = ''
+    server_list['In Scope for DR?'] = ''
+    server_list['Notes'] = ''
+
+    if enrich:
+        server_list = enrich_server_list(server_list, sheets)
+
+    # Reorder columns
+    extra_columns = enrichment_columns if enrich else []
+    if identity_columns:
+        extra_columns = extra_columns + [col for col in optional_mappings if col in server_list.columns]
+    server_list = server_list[final_columns + extra_columns]
+    server_list.attrs['parse_errors'] = parse_errors
+
+    return server_list
+
+
+def output_filename(name, fmt='xlsx'):
+    """Use the original filename with "-processed" and the format's extension appended"""
+    extension = OUTPUT_EXTENSIONS[fmt]
+    if name:
+        base_name = os.path.splitext(os.path.basename(name))[0]
+        return f"{base_name}-processed{extension}"
+    return f"rvtools-processed{extension}"
+
+
+def build_output_workbook(server_list, summary_mode=DEFAULT_SUMMARY_MODE, progress=None):
+    """Build the ServerList and Summary workbook, returning the xlsx bytes and write stats"""
+    _report(progress, 'summarizing', server_list)
+    rows = summary_rows(server_list, summary_mode)
+    _report(progress, 'writing:xlsx', server_list)
+    output, stats = write_workbook(server_list, summary_mode=summary_mode, summary=rows)
+    with output:
+        return output.read(), stats
+
+
+def save_output_workbook(server_list, path, summary_mode=DEFAULT_SUMMARY_MODE, progress=None, extra_sheets=None):
+    """Write the ServerList and Summary workbook to path, returning the write stats.
+
+    extra_sheets maps further sheet names to their rows, written after the Summary.
+    """
+    _report(progress, 'summarizing', server_list)
+    rows = summary_rows(server_list, summary_mode)
+    _report(progress, 'writing:xlsx', server_list)
+    output, stats = write_workbook(server_list, summary_mode=summary_mode, summary=rows, extra_sheets=extra_sheets)
+    with output, open(path, 'wb') as f:
+        shutil.copyfileobj(output, f)
+    return stats
+
+
+def save_outputs(server_list, paths, summary_mode=DEFAULT_SUMMARY_MODE, progress=None, extra_sheets=None):
+    """Write the ServerList in each format of paths (format to path), returning the write stats by format.
+
+    Each format is reported to progress as its own stage, e.g. 'writing:parquet'.
+    """
+    stats = {}
+    for fmt, path in paths.items():
+        if fmt == 'xlsx':
+            stats[fmt] = save_output_workbook(server_list, path, summary_mode, progress, extra_sheets)
+        else:
+            _report(progress, f'writing:{fmt}', server_list)
+            stats[fmt] = write_side_output(server_list, path, fmt)
+    return stats
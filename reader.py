@@ -0,0 +1,569 @@
+"""Streaming reader for the tabs of an RVtools export.
+
+Only the requested worksheets are read out of the xlsx zip. The header row is
+read first to resolve the column aliases, then the data rows are streamed and
+only the columns we keep are materialised, so time and memory scale with the
+projected columns rather than the full width of the sheet. Several sheets can
+be read from one upload while opening the package and loading the shared
+strings only once.
+"""
+import html
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import from_ISO8601
+
+try:
+    import python_calamine  # noqa: F401
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+VINFO_SHEET = 'vInfo'
+
+# Worker processes start from a fresh interpreter rather than a fork of this
+# one, which may hold locks taken by Streamlit's or the job pool's threads
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def pool_context():
+    """Multiprocessing context for the process pools that parse exports"""
+    return multiprocessing.get_context(POOL_START_METHOD)
+
+# Possible column name variations for each column we keep
+column_mappings = {
+    'VM Name': ['VM Name', 'Name', 'Virtual Machine Name', 'VMName', 'VM'],
+    'Powerstate': ['Powerstate', 'Power State', 'Power', 'State'],
+    'CPUs': ['CPUs', 'CPU', 'Num CPU', 'vCPUs'],
+    'Memory': ['Memory', 'Memory MB', 'Memory (MB)', 'RAM'],
+    'Provisioned MB': ['Provisioned MB', 'Provisioned MiB', 'Provisioned', 'Provisioned Storage', 'Provisioned Space'],
+    'In Use MB': ['In Use MB', 'In Use MiB', 'Used Space', 'Used Storage', 'In Use Space'],
+    'Cluster': ['Cluster', 'vSphere Cluster', 'ESX Cluster'],
+    'OS according to the configuration file': ['OS according to the configuration file', 'OS According to the configuration file', 'Guest OS', 'Operating System', 'OS']
+}
+
+# Columns read when present, used to identify VMs and their vCenter when
+# several exports are merged
+optional_mappings = {
+    'VM UUID': ['VM UUID', 'UUID', 'Instance UUID'],
+    'VI SDK Server': ['VI SDK Server', 'vCenter', 'vCenter Server'],
+}
+
+# dtype for each projected column. Numeric columns only take the numeric dtype
+# when every cell parses, messy columns stay object for the unit conversion.
+dtype_plan = {
+    'VM Name': 'object',
+    'Powerstate': 'object',
+    'CPUs': 'numeric',
+    'Memory': 'numeric',
+    'Provisioned MB': 'numeric',
+    'In Use MB': 'numeric',
+    'Cluster': 'object',
+    'OS according to the configuration file': 'object'
+}
+
+
+class MissingColumnError(ValueError):
+    """Raised when a required column cannot be found in the header row"""
+
+    def __init__(self, target_col, available_columns):
+        self.target_col = target_col
+        self.available_columns = [str(col) for col in available_columns]
+        super().__init__(
+            f"Could not find column for {target_col}. "
+            f"Available columns are: {', '.join(self.available_columns)}"
+        )
+
+
+class MissingSheetError(ValueError):
+    """Raised when a requested sheet is not in the workbook"""
+
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        super().__init__(f"Worksheet named '{sheet_name}' not found")
+
+
+def find_column(columns, possible_names):
+    """Find a column in the header using possible name variations"""
+    for name in possible_names:
+        if name in columns:
+            return name
+    return None
+
+
+def resolve_columns(header, mappings=None, optional=None):
+    """Map each target column to its position in the header row.
+
+    Columns in optional are included only when the header has them.
+    """
+    mappings = mappings or column_mappings
+    header = [str(col) if col is not None else '' for col in header]
+    positions = {}
+    for target_col, possible_names in mappings.items():
+        found_col = find_column(header, possible_names)
+        if found_col is None:
+            raise MissingColumnError(target_col, [col for col in header if col])
+        positions[target_col] = header.index(found_col)
+    for target_col, possible_names in (optional or {}).items():
+        found_col = find_column(header, possible_names)
+        if found_col is not None:
+            positions[target_col] = header.index(found_col)
+    return positions
+
+
+def _rewind(source):
+    """Seek file-like sources back to the start so they can be re-read"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _apply_dtype_plan(df, plan):
+    """Cast the projected columns according to the dtype plan"""
+    for name, dtype in plan.items():
+        if name not in df.columns:
+            continue
+        if dtype == 'numeric':
+            converted = pd.to_numeric(df[name], errors='coerce')
+            if converted.notna().sum() == df[name].notna().sum():
+                df[name] = converted
+        else:
+            df[name] = df[name].astype(dtype)
+    return df
+
+
+# Sheet XML is scanned in blocks of this many compressed-stream bytes
+SCAN_BLOCK_SIZE = 4 * 1024 * 1024
+
+_ROW_RE = re.compile(rb'<row\b[^>]*>(.*?)</row>', re.S)
+_TYPE_RE = re.compile(rb'\bt="(\w+)"')
+_VALUE_RE = re.compile(rb'<v>(.*?)</v>', re.S)
+_INLINE_RE = re.compile(rb'<t(?:\s[^>]*)?>(.*?)</t>', re.S)
+_OTHER_FIRST_ATTR_RE = re.compile(rb'<c(?: (?!r=")|>)')
+
+
+@lru_cache(maxsize=64)
+def _cell_pattern(columns, leading_ref=False):
+    """Regex matching <c> elements in the given column letters (a regex alternation).
+
+    With leading_ref the cell reference must be the first attribute, as
+    Excel and most writers emit it, which lets every other cell be rejected
+    after a few bytes. Both variants yield the same groups.
+    """
+    if leading_ref:
+        return re.compile(rb'<c() r="(' + columns + rb')(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+    return re.compile(rb'<c\b([^>]*?)\br="(' + columns + rb')(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+
+
+def _leading_refs(chunk):
+    """Whether every cell in the chunk has its reference as the first attribute"""
+    return _OTHER_FIRST_ATTR_RE.search(chunk) is None
+
+
+def _referenced(chunk, leading_refs):
+    """Whether every cell in the chunk carries an r reference, which the scanner relies on"""
+    if leading_refs:
+        return True
+    elements = chunk.count(b'<c ') + chunk.count(b'<c>') + chunk.count(b'<row ') + chunk.count(b'<row>')
+    return chunk.count(b' r="') >= elements
+
+
+def _plain_value(cell_type, text):
+    """Value of a cell from the text of its <v>, for all but shared and inline strings.
+
+    Numbers that do not parse, dates not in ISO 8601 and unknown cell types
+    keep their text rather than failing the sheet.
+    """
+    if cell_type == 'b':
+        return text == '1'
+    if cell_type == 'e':
+        return None
+    if cell_type in (None, 'n'):
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    if cell_type == 'd':
+        try:
+            return from_ISO8601(text)
+        except ValueError:
+            return text
+    return text
+
+
+def _unescape(text):
+    """Decode XML text taken straight from the sheet"""
+    text = text.decode('utf-8')
+    return html.unescape(text) if '&' in text else text
+
+
+def _row_chunks(f, size=SCAN_BLOCK_SIZE):
+    """Read sheet XML in blocks that always end on a row boundary"""
+    tail = b''
+    while True:
+        block = f.read(size)
+        if not block:
+            if tail:
+                yield tail
+            return
+        block = tail + block
+        cut = block.rfind(b'</row>')
+        if cut == -1:
+            tail = block
+            continue
+        cut += len(b'</row>')
+        yield block[:cut]
+        tail = block[cut:]
+
+
+def _column_index(ref, cache):
+    """Zero-based column index of a cell reference such as 'AB12'"""
+    letters = ref.rstrip('0123456789')
+    index = cache.get(letters)
+    if index is None:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - 64
+        index -= 1
+        cache[letters] = index
+    return index
+
+
+class XlsxPackage:
+    """Minimal streaming reader over the parts of an xlsx package.
+
+    The zip is opened and the shared strings are loaded once, so several
+    sheets can be read from the same upload without parsing the workbook
+    again. Sheet XML is streamed row by row and only the projected cells are
+    converted to Python values.
+    """
+
+    def __init__(self, source):
+        self.archive = zipfile.ZipFile(source)
+        self.sheet_paths = self._sheet_paths()
+        self._shared_strings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+
+    @property
+    def sheetnames(self):
+        return list(self.sheet_paths)
+
+    def _sheet_paths(self):
+        """Map sheet names to their worksheet part inside the zip"""
+        rels = ET.fromstring(self.archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+        workbook = ET.fromstring(self.archive.read('xl/workbook.xml'))
+        paths = {}
+        for element in workbook.iter():
+            if element.tag.rsplit('}', 1)[-1] != 'sheet':
+                continue
+            rel_id = next(value for key, value in element.attrib.items() if key.rsplit('}', 1)[-1] == 'id')
+            target = targets[rel_id]
+            paths[element.get('name')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+        return paths
+
+    @property
+    def shared_strings(self):
+        """The shared string table, loaded on first use"""
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if 'xl/sharedStrings.xml' in self.archive.namelist():
+                with self.archive.open('xl/sharedStrings.xml') as f:
+                    for _, element in ET.iterparse(f):
+                        if element.tag.endswith('}si'):
+                            self._shared_strings.append(self._string_item(element))
+                            element.clear()
+        return self._shared_strings
+
+    @staticmethod
+    def _string_item(element):
+        """Text of a shared or inline string, joining rich text runs"""
+        ns = element.tag[:element.tag.index('}') + 1]
+        text = element.find(f'{ns}t')
+        if text is not None:
+            return text.text or ''
+        return ''.join(run.findtext(f'{ns}t') or '' for run in element.findall(f'{ns}r'))
+
+    def _cell_value(self, cell, ns):
+        cell_type = cell.get('t')
+        if cell_type == 'inlineStr':
+            inline = cell.find(f'{ns}is')
+            return self._string_item(inline) if inline is not None else None
+        value = cell.find(f'{ns}v')
+        if value is None or value.text is None:
+            return None
+        if cell_type == 's':
+            return self.shared_strings[int(value.text)]
+        return _plain_value(cell_type, value.text)
+
+    def read_projected(self, sheet_name, mappings, optional=None):
+        """Read the mapped columns of a sheet into a DataFrame.
+
+        The header row is resolved first, then only the cells in the resolved
+        columns are converted for the remaining rows. Blank rows are skipped.
+        """
+        if sheet_name not in self.sheet_paths:
+            raise MissingSheetError(sheet_name)
+
+        df = self._read_scanned(sheet_name, mappings, optional)
+        if df is None:
+            df = self._read_parsed(sheet_name, mappings, optional)
+        return df
+
+    def _scanned_value(self, attrs, content):
+        """Python value of a cell matched by the byte scanner"""
+        if content is None:
+            return None
+        type_match = _TYPE_RE.search(attrs)
+        cell_type = type_match.group(1) if type_match else None
+        if cell_type == b'inlineStr':
+            text = b''.join(_INLINE_RE.findall(content))
+            return _unescape(text)
+        value = _VALUE_RE.search(content)
+        if value is None:
+            return None
+        text = value.group(1)
+        if cell_type == b's':
+            return self.shared_strings[int(text)]
+        if cell_type is None or cell_type == b'n':
+            try:
+                return int(text)
+            except ValueError:
+                pass
+            try:
+                return float(text)
+            except ValueError:
+                pass
+        return _plain_value(cell_type and cell_type.decode('ascii'), _unescape(text))
+
+    def _read_scanned(self, sheet_name, mappings, optional):
+        """Fast path: scan the raw sheet XML for the projected cells only.
+
+        A regular expression that only matches the resolved column letters
+        skips every other cell without creating any Python objects for it.
+        Returns None when the sheet does not use the plain layout this
+        expects (unprefixed tags with a reference on every row and cell), so
+        the caller can fall back to the XML parser.
+        """
+        with self.archive.open(self.sheet_paths[sheet_name]) as f:
+            chunks = _row_chunks(f)
+            first = next(chunks, b'')
+            header_row = _ROW_RE.search(first)
+            if header_row is None or not _referenced(first, _leading_refs(first)):
+                return None
+
+            header = {}
+            for attrs, letters, _, more_attrs, content in _cell_pattern(rb'[A-Z]{1,3}').findall(header_row.group(1)):
+                header[_column_index(letters.decode('ascii'), {})] = self._scanned_value(attrs + more_attrs, content or None)
+            width = max(header, default=-1) + 1
+            positions = resolve_columns([header.get(i) for i in range(width)], mappings, optional)
+
+            # Targets whose aliases resolve to the same column share its cells
+            slots = {}
+            for slot, index in enumerate(positions.values()):
+                slots.setdefault(get_column_letter(index + 1).encode('ascii'), []).append(slot)
+            columns = b'|'.join(slots)
+
+            data = []
+            current_row, values = None, None
+            rest = first[header_row.end():]
+            for number, chunk in enumerate(itertools.chain([rest], chunks)):
+                leading_refs = _leading_refs(chunk)
+                if number and not _referenced(chunk, leading_refs):
+                    return None
+                pattern = _cell_pattern(columns, leading_refs)
+                for attrs, letters, row_number, more_attrs, content in pattern.findall(chunk):
+                    value = self._scanned_value(attrs + more_attrs, content or None)
+                    if value is None:
+                        continue
+                    if row_number != current_row:
+                        if values is not None:
+                            data.append(values)
+                        current_row, values = row_number, [None] * len(positions)
+                    for slot in slots[letters]:
+                        values[slot] = value
+            if values is not None:
+                data.append(values)
+
+        return pd.DataFrame.from_records(data, columns=list(positions))
+
+    def _read_parsed(self, sheet_name, mappings, optional):
+        """Fallback: stream the sheet through the XML parser"""
+        cache = {}
+        positions = None
+        data = []
+        with self.archive.open(self.sheet_paths[sheet_name]) as f:
+            sheet_data = None
+            for event, element in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if sheet_data is None and element.tag.endswith('}sheetData'):
+                        sheet_data = element
+                        ns = element.tag[:element.tag.index('}') + 1]
+                        row_tag = f'{ns}row'
+                    continue
+                if sheet_data is None or element.tag != row_tag:
+                    continue
+
+                if positions is None:
+                    # Header row: every cell is needed to resolve the aliases
+                    header = {}
+                    for position, cell in enumerate(element):
+                        ref = cell.get('r')
+                        index = _column_index(ref, cache) if ref else position
+                        header[index] = self._cell_value(cell, ns)
+                    width = max(header, default=-1) + 1
+                    positions = resolve_columns([header.get(i) for i in range(width)], mappings, optional)
+                    wanted = {}
+                    for slot, index in enumerate(positions.values()):
+                        wanted.setdefault(index, []).append(slot)
+                    last_wanted = max(wanted)
+                else:
+                    values = [None] * len(positions)
+                    found = False
+                    for position, cell in enumerate(element):
+                        ref = cell.get('r')
+                        index = _column_index(ref, cache) if ref else position
+                        if index > last_wanted:
+                            break
+                        slots = wanted.get(index)
+                        if slots is not None:
+                            value = self._cell_value(cell, ns)
+                            if value is not None:
+                                for slot in slots:
+                                    values[slot] = value
+                                found = True
+                    if found:
+                        data.append(values)
+
+                # Drop the rows parsed so far so memory stays flat
+                sheet_data.clear()
+
+        if positions is None:
+            positions = resolve_columns([], mappings, optional)
+        return pd.DataFrame.from_records(data, columns=list(positions))
+
+
+def _read_pandas(source, sheet_name, mappings, optional, engine=None):
+    """Read the sheet through pandas, projecting only the resolved columns"""
+    with pd.ExcelFile(source, engine=engine) as book:
+        if sheet_name not in book.sheet_names:
+            raise MissingSheetError(sheet_name)
+        header = book.parse(sheet_name, nrows=0).columns
+        positions = resolve_columns(header, mappings, optional)
+        usecols = sorted(positions.values())
+        df = book.parse(sheet_name, usecols=usecols)
+    df = df.iloc[:, [usecols.index(pos) for pos in positions.values()]]
+    df.columns = list(positions)
+    return df.dropna(how='all').reset_index(drop=True)
+
+
+def _read_optional_sheet(path, sheet_name, spec):
+    """Read one sheet in a worker process, or None when the export lacks it or a mapped column"""
+    return read_sheets(path, {sheet_name: spec}).get(sheet_name)
+
+
+def _read_sheets_parallel(source, specs, required, workers):
+    """Read the optional sheets on a process pool while the required ones are read here"""
+    # Workers reopen the export by path. An in-memory source is written to a
+    # temporary file once rather than pickled to every worker.
+    temp_path = None
+    if isinstance(source, (str, os.PathLike)):
+        path = source
+    elif isinstance(getattr(source, 'name', None), str) and os.path.isfile(source.name):
+        path = source.name
+    else:
+        _rewind(source)
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+            shutil.copyfileobj(source, f, SCAN_BLOCK_SIZE)
+        path = temp_path = f.name
+    try:
+        optional = [name for name in specs if name not in required]
+        with ProcessPoolExecutor(max_workers=min(workers, len(optional)), mp_context=pool_context()) as pool:
+            futures = {name: pool.submit(_read_optional_sheet, path, name, specs[name]) for name in optional}
+            local = read_sheets(source, {name: specs[name] for name in required}, required)
+            frames = {name: future.result() for name, future in futures.items()}
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+    frames.update(local)
+    return {name: frames[name] for name in specs if frames.get(name) is not None}
+
+
+def read_sheets(source, specs, required=(), workers=1):
+    """Read the mapped columns of several sheets from one RVtools export.
+
+    specs maps each sheet name to a dict with 'mappings' and optionally 'plan'
+    and 'optional'. Sheets listed in required raise if they are missing or lack
+    a mapped column; any other sheet that is missing or lacks a mapped column
+    is left out of the returned dict of DataFrames, while other errors are
+    raised for every sheet. With more than one worker the other sheets
+    are parsed in worker processes alongside the required ones.
+    """
+    _rewind(source)
+    if workers > 1 and len(specs) > len(required) and zipfile.is_zipfile(source):
+        return _read_sheets_parallel(source, specs, required, workers)
+
+    _rewind(source)
+    frames = {}
+    if zipfile.is_zipfile(source):
+        _rewind(source)
+        package = XlsxPackage(source)
+        read = package.read_projected
+    else:
+        # Legacy .xls exports are not zip packages, fall back to pandas
+        package = None
+        engine = 'calamine' if HAS_CALAMINE else None
+
+        def read(sheet_name, mappings, optional):
+            _rewind(source)
+            return _read_pandas(source, sheet_name, mappings, optional, engine=engine)
+
+    try:
+        for sheet_name, spec in specs.items():
+            try:
+                df = read(sheet_name, spec['mappings'], spec.get('optional'))
+            except (MissingSheetError, MissingColumnError):
+                if sheet_name in required:
+                    raise
+                continue
+            frames[sheet_name] = _apply_dtype_plan(df, spec.get('plan') or {})
+    finally:
+        if package is not None:
+            package.close()
+    return frames
+
+
+def read_sheet(source, sheet_name, mappings, plan=None, optional=None):
+    """Read the mapped columns of a single sheet from an RVtools export"""
+    spec = {'mappings': mappings, 'plan': plan, 'optional': optional}
+    return read_sheets(source, {sheet_name: spec}, required=(sheet_name,))[sheet_name]
+
+
+def read_vinfo(source, include_optional=False):
+    """Read the vInfo tab, returning only the mapped columns under their standard names.
+
+    With include_optional the VM UUID and vCenter columns are added when present.
+    """
+    optional = optional_mappings if include_optional else None
+    return read_sheet(source, VINFO_SHEET, column_mappings, dtype_plan, optional)
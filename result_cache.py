@@ -0,0 +1,170 @@
+"""Content-addressed cache for processed RVtools uploads.
+
+Results are keyed by a hash of the uploaded bytes plus PROCESSING_VERSION, so
+Streamlit reruns and repeat uploads of the same export skip the parse and the
+workbook build. Entries live in a bounded in-memory LRU and can optionally be
+spilled to a directory on disk.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Bump whenever the ServerList or the workbook layout changes so stale
+# results are not served from the cache
+PROCESSING_VERSION = '4'
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class CachedResult:
+    """A processed upload: the normalized ServerList and the rendered workbook"""
+    server_list: object
+    xlsx_bytes: bytes
+
+    @property
+    def size(self):
+        """Approximate memory held by this entry in bytes"""
+        return int(self.server_list.memory_usage(deep=True).sum()) + len(self.xlsx_bytes)
+
+
+def content_key(data, version=PROCESSING_VERSION):
+    """Hash the uploaded bytes together with the processing version"""
+    digest = hashlib.sha256()
+    digest.update(version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU of CachedResult entries with an optional disk spill directory"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        if key in self._entries:
+            return True
+        path = self._spill_path(key)
+        return path is not None and os.path.exists(path)
+
+    @property
+    def current_bytes(self):
+        return self._current_bytes
+
+    def stats(self):
+        """Hit/miss counters and memory use for display"""
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._current_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load_spilled(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+            return entry
+
+    def put(self, key, server_list, xlsx_bytes):
+        """Store a processed result, evicting least recently used entries over budget"""
+        entry = CachedResult(server_list, xlsx_bytes)
+        self._spill(key, entry)
+        with self._lock:
+            self._insert(key, entry)
+        return entry
+
+    def clear(self):
+        """Drop every in-memory entry, leaving spilled files in place"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._current_bytes = 0
+
+    def _insert(self, key, entry):
+        if key in self._entries:
+            self._current_bytes -= self._sizes.pop(key)
+            del self._entries[key]
+
+        size = entry.size
+        # Entries larger than the whole budget are only kept on disk, or kept
+        # alone in memory when there is no disk to spill to
+        if size > self.max_bytes:
+            if self.spill_dir:
+                return
+            self._entries.clear()
+            self._sizes.clear()
+            self._current_bytes = 0
+
+        self._entries[key] = entry
+        self._sizes[key] = size
+        self._current_bytes += size
+        while self._current_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, _ = self._entries.popitem(last=False)
+            self._current_bytes -= self._sizes.pop(old_key)
+
+    def _spill_path(self, key):
+        if not self.spill_dir:
+            return None
+        return os.path.join(self.spill_dir, f"{key}.pkl")
+
+    def _spill(self, key, entry):
+        path = self._spill_path(key)
+        if path is None or os.path.exists(path):
+            return
+        # Write to a temporary name first so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((entry.server_list, entry.xlsx_bytes), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _load_spilled(self, key):
+        path = self._spill_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                server_list, xlsx_bytes = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return CachedResult(server_list, xlsx_bytes)
+
+
+def cache_from_env():
+    """Build a ResultCache from RVTOOLS_CACHE_MAX_MB and RVTOOLS_CACHE_DIR"""
+    max_mb = os.environ.get('RVTOOLS_CACHE_MAX_MB')
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+    spill_dir = os.environ.get('RVTOOLS_CACHE_DIR') or None
+    return ResultCache(max_bytes=max_bytes, spill_dir=spill_dir)
@@ -0,0 +1,57 @@
+"""Gzip CSV and Parquet copies of the processed ServerList.
+
+For downstream tools that do not need the xlsx workbook. The ServerList is
+converted and written in chunks of rows, so neither output is built in
+memory as a whole, and neither has a row limit.
+"""
+import gzip
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from workbook_writer import RSSWindow, WriteStats
+
+# Rows converted and written at a time
+CHUNK_ROWS = 100_000
+
+# Side output formats and their file extensions
+SIDE_FORMATS = {
+    'csv': '.csv.gz',
+    'parquet': '.parquet',
+}
+
+
+def _chunks(server_list, chunk_rows):
+    for start in range(0, len(server_list), chunk_rows):
+        yield server_list.iloc[start:start + chunk_rows]
+
+
+def _write_csv(server_list, path, chunk_rows):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        if server_list.empty:
+            server_list.to_csv(f, index=False)
+        for number, chunk in enumerate(_chunks(server_list, chunk_rows)):
+            chunk.to_csv(f, index=False, header=number == 0)
+
+
+def _write_parquet(server_list, path, chunk_rows):
+    # Schema from the whole ServerList, so a chunk of all-empty cells keeps its column type
+    schema = pa.Schema.from_pandas(server_list, preserve_index=False)
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for chunk in _chunks(server_list, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_side_output(server_list, path, fmt, chunk_rows=CHUNK_ROWS):
+    """Write the ServerList to path as 'csv' (gzip) or 'parquet', returning the WriteStats"""
+    writers = {'csv': _write_csv, 'parquet': _write_parquet}
+    if fmt not in writers:
+        raise ValueError(f"Unknown side output format: {fmt}")
+
+    with RSSWindow() as memory:
+        start = time.perf_counter()
+        writers[fmt](server_list, path, chunk_rows)
+        seconds = time.perf_counter() - start
+    return WriteStats(fmt, len(server_list), seconds, os.path.getsize(path), memory.peak_mb(), memory.delta_mb())
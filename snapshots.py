@@ -0,0 +1,206 @@
+"""Parquet snapshots of processed ServerLists and the changes between them.
+
+Each normalized ServerList can be saved as a Parquet snapshot keyed by vCenter
+and timestamp:
+
+    <snapshot dir>/<vcenter>/<YYYYmmddTHHMMSSZ>.parquet
+
+A new export is diffed against the previous snapshot of the same vCenter to
+list added, removed and resized VMs, and the scope and notes entered in a
+previously processed workbook can be carried forward by VM key. Snapshots are
+read memory-mapped with only the needed columns, so trend reports across many
+weeks stay cheap.
+"""
+import os
+import re
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from reader import XlsxPackage, read_sheet, read_sheets
+from summary import METRIC_COLUMNS, SERVERLIST_SHEET, SOURCE_COLUMN
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+
+UUID_COLUMN = 'VM UUID'
+
+# Columns compared between snapshots to detect resized VMs
+SIZE_COLUMNS = ['CPUs', 'Memory (GB)', 'Provisioned Disk (GB)']
+
+# User-entered ServerList columns carried forward from a processed workbook
+CARRY_FORWARD_COLUMNS = ['In Scope for Prod?', 'In Scope for DR?', 'Notes']
+
+# ServerList sheets of a processed workbook: ServerList, ServerList 2, ...
+SHARD_SHEET_RE = re.compile(rf'{SERVERLIST_SHEET}( \d+)?')
+
+# Columns read back from a processed workbook's ServerList tab
+processed_mappings = {
+    'VM Name': ['VM Name'],
+    'Cluster': ['Cluster'],
+    'In Scope for Prod?': ['In Scope for Prod?'],
+    'In Scope for DR?': ['In Scope for DR?'],
+    'Notes': ['Notes'],
+}
+
+
+def default_snapshot_dir():
+    """Snapshot directory from RVTOOLS_SNAPSHOT_DIR, defaulting to ./snapshots"""
+    return os.environ.get('RVTOOLS_SNAPSHOT_DIR') or 'snapshots'
+
+
+def vcenter_slug(vcenter):
+    """Filesystem-safe directory name for a vCenter"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', str(vcenter)).strip('._')
+    return slug or 'unknown'
+
+
+def _key_part(values):
+    """Lower-cased strings with missing values as '', so None, NaN and blank cells match"""
+    return values.astype('string').fillna('').str.strip().str.lower()
+
+
+def vm_keys(server_list):
+    """Key identifying each VM across exports.
+
+    The VM UUID when the ServerList has one, otherwise the lower-cased VM name
+    and cluster (plus Source for merged ServerLists).
+    """
+    key = _key_part(server_list['VM Name']) + '\x1f' + _key_part(server_list['Cluster'])
+    if SOURCE_COLUMN in server_list.columns:
+        key = _key_part(server_list[SOURCE_COLUMN]) + '\x1f' + key
+    if UUID_COLUMN in server_list.columns:
+        uuids = _key_part(server_list[UUID_COLUMN])
+        key = uuids.where(uuids != '', key)
+    return key.astype(object).rename('VM Key')
+
+
+def save_snapshot(server_list, vcenter, snapshot_dir=None, timestamp=None):
+    """Write the ServerList as a Parquet snapshot and return its path"""
+    timestamp = timestamp or datetime.now(timezone.utc)
+    directory = os.path.join(snapshot_dir or default_snapshot_dir(), vcenter_slug(vcenter))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{timestamp.strftime(TIMESTAMP_FORMAT)}.parquet")
+
+    table = pa.Table.from_pandas(server_list, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'vcenter': str(vcenter).encode('utf-8')})
+    pq.write_table(table, path, compression='zstd')
+    return path
+
+
+def list_snapshots(vcenter, snapshot_dir=None):
+    """(timestamp, path) pairs for a vCenter's snapshots, oldest first"""
+    directory = os.path.join(snapshot_dir or default_snapshot_dir(), vcenter_slug(vcenter))
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext != '.parquet':
+            continue
+        try:
+            timestamp = datetime.strptime(stem, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        snapshots.append((timestamp, os.path.join(directory, name)))
+    return sorted(snapshots)
+
+
+def previous_snapshot(vcenter, snapshot_dir=None, before=None):
+    """Path of the latest snapshot taken before the given time, or None"""
+    snapshots = list_snapshots(vcenter, snapshot_dir)
+    if before is not None:
+        snapshots = [(timestamp, path) for timestamp, path in snapshots if timestamp < before]
+    return snapshots[-1][1] if snapshots else None
+
+
+def read_snapshot(path, columns=None):
+    """Read a snapshot memory-mapped, loading only the requested columns"""
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def diff_snapshots(previous, current):
+    """Added, removed and resized VMs between two ServerLists.
+
+    Returns a dict of DataFrames keyed 'added', 'removed' and 'resized'.
+    Resized rows carry the previous and current value of each size column.
+    """
+    columns = ['VM Name', 'Cluster'] + SIZE_COLUMNS
+    # Only key on the identity columns both sides have
+    key_columns = ['VM Name', 'Cluster'] + [col for col in (SOURCE_COLUMN, UUID_COLUMN)
+                                            if col in previous.columns and col in current.columns]
+    before = previous[columns].assign(**{'VM Key': vm_keys(previous[key_columns])}).drop_duplicates('VM Key')
+    after = current[columns].assign(**{'VM Key': vm_keys(current[key_columns])}).drop_duplicates('VM Key')
+
+    joined = before.merge(after, on='VM Key', how='outer', suffixes=(' (previous)', ''), indicator=True)
+
+    added = joined[joined['_merge'] == 'right_only']
+    removed = joined[joined['_merge'] == 'left_only']
+    both = joined[joined['_merge'] == 'both']
+
+    changed = pd.Series(False, index=both.index)
+    for col in SIZE_COLUMNS:
+        changed |= both[f'{col} (previous)'].ne(both[col])
+
+    size_pairs = [name for col in SIZE_COLUMNS for name in (f'{col} (previous)', col)]
+    removed = removed[['VM Name (previous)', 'Cluster (previous)'] + [f'{col} (previous)' for col in SIZE_COLUMNS]]
+    return {
+        'added': added[columns].reset_index(drop=True),
+        'removed': removed.rename(columns=lambda col: col.replace(' (previous)', '')).reset_index(drop=True),
+        'resized': both.loc[changed, ['VM Name', 'Cluster'] + size_pairs].reset_index(drop=True),
+    }
+
+
+def diff_against_previous(server_list, vcenter, snapshot_dir=None, before=None):
+    """Diff a ServerList against the vCenter's previous snapshot, or None if there is none"""
+    path = previous_snapshot(vcenter, snapshot_dir, before)
+    if path is None:
+        return None
+    available = pq.read_schema(path, memory_map=True).names
+    columns = [col for col in ['VM Name', 'Cluster', SOURCE_COLUMN, UUID_COLUMN] + SIZE_COLUMNS if col in available]
+    return diff_snapshots(read_snapshot(path, columns), server_list)
+
+
+def read_processed_workbook(source):
+    """User-entered scope and notes from a previously processed workbook's ServerList sheets"""
+    with XlsxPackage(source) as package:
+        names = [name for name in package.sheetnames if SHARD_SHEET_RE.fullmatch(name)]
+    if len(names) <= 1:
+        return read_sheet(source, SERVERLIST_SHEET, processed_mappings)
+    spec = {'mappings': processed_mappings}
+    sheets = read_sheets(source, {name: spec for name in names}, required=names)
+    return pd.concat([sheets[name] for name in names], ignore_index=True)
+
+
+def carry_forward(server_list, previous):
+    """Copy the scope and notes columns from a previous ServerList onto matching VMs.
+
+    Processed workbooks have no VM UUID, so VMs are matched by name and cluster.
+    Returns the updated ServerList and the number of VMs that were matched.
+    """
+    previous_values = previous.assign(**{'VM Key': vm_keys(previous[['VM Name', 'Cluster']])})
+    previous_values = previous_values.drop_duplicates('VM Key', keep='last').set_index('VM Key')
+
+    keys = vm_keys(server_list[['VM Name', 'Cluster']])
+    matched = keys.isin(previous_values.index)
+
+    updated = server_list.copy()
+    for col in CARRY_FORWARD_COLUMNS:
+        values = keys.map(previous_values[col]).astype(object)
+        values = values.where(values.notna(), '')
+        updated[col] = values.where(matched, updated[col])
+    return updated, int(matched.sum())
+
+
+def trend_report(vcenter, snapshot_dir=None, since=None):
+    """VM count and metric totals for each of a vCenter's snapshots, oldest first"""
+    rows = []
+    for timestamp, path in list_snapshots(vcenter, snapshot_dir):
+        if since is not None and timestamp < since:
+            continue
+        snapshot = read_snapshot(path, METRIC_COLUMNS)
+        totals = snapshot.sum()
+        rows.append({'Snapshot': timestamp, 'VMs': len(snapshot), **totals.round(2).to_dict()})
+    return pd.DataFrame(rows, columns=['Snapshot', 'VMs'] + METRIC_COLUMNS)
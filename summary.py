@@ -0,0 +1,286 @@
+"""Rows for the Summary tab of the processed workbook.
+
+The Summary is produced as a list of rows, top to bottom, so it can be
+appended to a streaming worksheet without random cell access.
+
+ServerLists longer than an Excel sheet are split across numbered sheets
+(ServerList, ServerList 2, ...); the live formulas add up each sheet's range.
+
+All totals come from a single groupby pass over the ServerList. Depending on
+the summary mode the rows hold those static values, live formulas bounded to
+the actual ServerList data range, or both side by side. Scope matching for the
+live formulas is done once per VM by a helper column on the ServerList rather
+than by OR'ing a SUMIFS per recognised value, and follows the same rule as the
+static values: the cell's text, trimmed of spaces, equal to a recognised value
+ignoring case.
+"""
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+summary_headers = [
+    'Category', 'Sub-Category', 'Count', 'Total CPUs',
+    'Total Memory (GB)', 'Total Provisioned Disk (GB)',
+    'Total In Use Disk (GB)'
+]
+
+# Headers for the static value block written next to the formulas in 'both' mode
+static_headers = [f'{header} (at processing)' for header in summary_headers[2:]]
+
+SUMMARY_MODES = ['formulas', 'values', 'both']
+DEFAULT_SUMMARY_MODE = 'formulas'
+
+# Values in the scope columns that count as "In Scope"
+SCOPE_VALUES = ['yes', 'true', '1', 'X', 'y']
+
+IN_SCOPE = 'In Scope'
+NOT_IN_SCOPE = 'Not In Scope'
+
+# Data rows per ServerList sheet: Excel's 1,048,576-row limit less the header
+MAX_SHEET_ROWS = 1_048_575
+SERVERLIST_SHEET = 'ServerList'
+
+# Column added to merged ServerLists naming the vCenter each VM came from
+SOURCE_COLUMN = 'Source'
+
+METRIC_COLUMNS = ['CPUs', 'Memory (GB)', 'Provisioned Disk (GB)', 'In Use Disk (GB)']
+
+# ServerList columns the formulas refer to
+METRIC_LETTERS = ['C', 'D', 'E', 'F']
+POWERSTATE_LETTER = 'B'
+OS_LETTER = 'H'
+
+# Scope column on the ServerList and the header of its helper column
+scope_helpers = {
+    'In Scope for Prod?': 'Prod Scope (calc)',
+    'In Scope for DR?': 'DR Scope (calc)',
+}
+
+
+def uses_formulas(mode):
+    """Whether the summary mode writes live formulas"""
+    return mode in ('formulas', 'both')
+
+
+def uses_values(mode):
+    """Whether the summary mode writes static values"""
+    return mode in ('values', 'both')
+
+
+def serverlist_shards(row_count, shard_rows=MAX_SHEET_ROWS):
+    """(sheet name, start row, stop row) of each ServerList sheet, always at least one"""
+    shards = []
+    for number, start in enumerate(range(0, max(row_count, 1), shard_rows), 1):
+        name = SERVERLIST_SHEET if number == 1 else f'{SERVERLIST_SHEET} {number}'
+        shards.append((name, start, min(start + shard_rows, row_count)))
+    return shards
+
+
+def _sheet_ref(name):
+    """Sheet name as used in a formula, quoted when it has a space"""
+    return f"'{name}'" if ' ' in name else name
+
+
+def scope_flag(series):
+    """True for the rows whose scope value is one of the recognised In Scope values.
+
+    Matches the helper formula: Excel's TRIM only removes spaces, and shows
+    whole numbers without a decimal point.
+    """
+    if pd.api.types.is_float_dtype(series):
+        series = series.map(lambda value: f'{value:g}')
+    normalized = series.astype(str).str.strip(' ').str.lower()
+    return normalized.isin([value.lower() for value in SCOPE_VALUES])
+
+
+def criterion(value):
+    """COUNTIFS criterion, as a formula string literal, matching cells equal to value.
+
+    Missing values match empty cells. Otherwise the value is compared with
+    '=' so text starting with '<', '>' or '=' is not read as an operator,
+    and the wildcards and '~' are escaped with '~'.
+    """
+    if pd.isna(value):
+        return '"="'
+    text = str(value)
+    for char in '~*?':
+        text = text.replace(char, '~' + char)
+    return '"=' + text.replace('"', '""') + '"'
+
+
+def scope_helper_columns(server_list, shard_rows=MAX_SHEET_ROWS, start=0):
+    """Formula columns appended to the ServerList that classify each row's scope once.
+
+    Returns a dict of helper column header to the list of per-row formulas,
+    each referring to its row on its own ServerList sheet. server_list may be
+    a chunk of rows beginning at row number start of the whole ServerList.
+    """
+    columns = list(server_list.columns)
+    # = rather than MATCH, which would treat * and ? in the cell as wildcards
+    values = '{' + ','.join(f'"{value}"' for value in SCOPE_VALUES) + '}'
+    helpers = {}
+    for scope_col, header in scope_helpers.items():
+        letter = get_column_letter(columns.index(scope_col) + 1)
+        helpers[header] = [
+            f'=IF(OR(TRIM({letter}{index % shard_rows + 2}&"")={values}),"{IN_SCOPE}","{NOT_IN_SCOPE}")'
+            for index in range(start, start + len(server_list))
+        ]
+    return helpers
+
+
+def helper_letters(server_list):
+    """Column letters of the scope helper columns, which follow the ServerList columns"""
+    first = len(server_list.columns) + 1
+    return {header: get_column_letter(first + i) for i, header in enumerate(scope_helpers.values())}
+
+
+def aggregate(server_list):
+    """Count and metric totals grouped by Powerstate, OS and both scope flags in one pass"""
+    frame = server_list[METRIC_COLUMNS].assign(
+        Count=1,
+        _powerstate=server_list['Powerstate'],
+        _os=server_list['OS according to the configuration file'],
+        _prod=scope_flag(server_list['In Scope for Prod?']),
+        _dr=scope_flag(server_list['In Scope for DR?']),
+    )
+    keys = ['_powerstate', '_os', '_prod', '_dr']
+    if SOURCE_COLUMN in server_list.columns:
+        frame['_source'] = server_list[SOURCE_COLUMN]
+        keys.append('_source')
+    return frame.groupby(keys, sort=False, observed=True, dropna=False)[['Count'] + METRIC_COLUMNS].sum()
+
+
+def _rollup(grouped, level):
+    """Collapse the grouped totals down to a single key, keeping first-seen order"""
+    return grouped.groupby(level=level, sort=False, observed=True, dropna=False).sum()
+
+
+def _totals(row):
+    """Static Count and metric totals as plain Python numbers"""
+    values = [int(row['Count'])]
+    for col in METRIC_COLUMNS:
+        total = row[col]
+        values.append(int(total) if col == 'CPUs' else round(float(total), 2))
+    return values
+
+
+def _label(value):
+    """Cell value for a group key, leaving missing values blank"""
+    return None if pd.isna(value) else value
+
+
+class _SummaryBuilder:
+    """Accumulates Summary rows for the chosen mode"""
+
+    def __init__(self, server_list, mode, shard_rows=MAX_SHEET_ROWS):
+        if mode not in SUMMARY_MODES:
+            raise ValueError(f"Unknown summary mode: {mode}")
+        self.mode = mode
+        self.shards = serverlist_shards(len(server_list), shard_rows)
+        self.rows = [list(summary_headers)]
+        if uses_values(mode) and uses_formulas(mode):
+            self.rows[0] += [None] + static_headers
+
+        # One bounded range per ServerList sheet for each column
+        self.ranges = {letter: self.column_ranges(letter)
+                       for letter in METRIC_LETTERS + ['A', POWERSTATE_LETTER, OS_LETTER]}
+        for header, letter in helper_letters(server_list).items():
+            self.ranges[header] = self.column_ranges(letter)
+        if SOURCE_COLUMN in server_list.columns:
+            letter = get_column_letter(list(server_list.columns).index(SOURCE_COLUMN) + 1)
+            self.ranges[SOURCE_COLUMN] = self.column_ranges(letter)
+
+    def column_ranges(self, letter):
+        return [f'{_sheet_ref(name)}!${letter}$2:${letter}${max(stop - start + 1, 2)}'
+                for name, start, stop in self.shards]
+
+    @property
+    def next_row(self):
+        return len(self.rows) + 1
+
+    def blank(self, count=1):
+        self.rows += [[] for _ in range(count)]
+
+    def title(self, text):
+        self.rows.append([text])
+
+    def add(self, category, sub_category, formulas, totals):
+        """Append a data row, picking formulas, values or both for the mode"""
+        row = [category, sub_category]
+        if self.mode == 'formulas':
+            row += formulas
+        elif self.mode == 'values':
+            row += totals
+        else:
+            row += formulas + [None] + totals
+        self.rows.append(row)
+
+    def criteria_formulas(self, criteria_ranges, value):
+        """COUNTIFS/SUMIFS over the bounded ranges for rows matching value, added up across sheets"""
+        criteria = [f'{criteria_range},{criterion(value)}' for criteria_range in criteria_ranges]
+        formulas = ['=' + '+'.join(f'COUNTIFS({c})' for c in criteria)]
+        for letter in METRIC_LETTERS:
+            formulas.append('=' + '+'.join(f'SUMIFS({r},{c})' for r, c in zip(self.ranges[letter], criteria)))
+        return formulas
+
+    def subtotal(self, label, start_row, end_row, totals):
+        """SUM of a block of Summary rows, or its static total"""
+        formulas = [f'=SUM({col}{start_row}:{col}{end_row})' for col in 'CDEFG']
+        self.add(label, '', formulas, totals)
+
+
+def summary_rows(server_list, mode=DEFAULT_SUMMARY_MODE, shard_rows=MAX_SHEET_ROWS):
+    """Build the Summary tab as a list of rows, starting with the header row.
+
+    shard_rows must match the one the ServerList sheets are written with.
+    """
+    builder = _SummaryBuilder(server_list, mode, shard_rows)
+    grouped = aggregate(server_list)
+
+    # Powerstate summary
+    by_powerstate = _rollup(grouped, '_powerstate')
+    for powerstate, row in by_powerstate.iterrows():
+        formulas = builder.criteria_formulas(builder.ranges[POWERSTATE_LETTER], powerstate)
+        builder.add('Powerstate', _label(powerstate), formulas, _totals(row))
+    builder.subtotal('Powerstate Subtotal', 2, builder.next_row - 1, _totals(by_powerstate.sum()))
+    builder.blank(2)
+
+    # OS summary
+    builder.title('Operating System Summary')
+    for os_name, row in _rollup(grouped, '_os').iterrows():
+        formulas = builder.criteria_formulas(builder.ranges[OS_LETTER], os_name)
+        builder.add('Operating System', _label(os_name), formulas, _totals(row))
+
+    # Grand totals
+    builder.blank()
+    formulas = [f'=COUNTA({",".join(builder.ranges["A"])})']
+    formulas += [f'=SUM({",".join(builder.ranges[letter])})' for letter in METRIC_LETTERS]
+    builder.add('Grand Total', None, formulas, _totals(grouped.sum()))
+
+    # Prod and DR scope summaries
+    scope_sections = [
+        (1, 'Production Scope Summary', 'Production Scope', '_prod', 'Prod Scope (calc)'),
+        (2, 'DR Scope Summary', 'DR Scope', '_dr', 'DR Scope (calc)'),
+    ]
+    for blank_rows, title, category, level, helper in scope_sections:
+        builder.blank(blank_rows)
+        builder.title(title)
+        start_row = builder.next_row
+        by_scope = _rollup(grouped, level)
+        for in_scope, label in [(True, IN_SCOPE), (False, NOT_IN_SCOPE)]:
+            row = by_scope.loc[in_scope] if in_scope in by_scope.index else None
+            totals = _totals(row) if row is not None else [0, 0, 0, 0, 0]
+            builder.add(category, label, builder.criteria_formulas(builder.ranges[helper], label), totals)
+        builder.subtotal(f'{category} Subtotal', start_row, builder.next_row - 1, _totals(by_scope.sum()))
+
+    # Per-vCenter summary for merged ServerLists
+    if SOURCE_COLUMN in server_list.columns:
+        builder.blank(2)
+        builder.title('Source Summary')
+        start_row = builder.next_row
+        by_source = _rollup(grouped, '_source')
+        for source, row in by_source.iterrows():
+            formulas = builder.criteria_formulas(builder.ranges[SOURCE_COLUMN], source)
+            builder.add('Source', _label(source), formulas, _totals(row))
+        builder.subtotal('Source Subtotal', start_row, builder.next_row - 1, _totals(by_source.sum()))
+
+    return builder.rows
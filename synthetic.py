@@ -0,0 +1,283 @@
+"""Generate synthetic RVtools exports for benchmarking.
+
+The vInfo tab mimics a real export: header names are drawn from the aliases
+in column_mappings, a share of the numeric cells are messy (thousands
+separators, padding, N/A, blanks) and the VMs are spread over many clusters,
+hosts and guest OS strings. Filler columns bring the width closer to a real
+vInfo tab. The vDisk, vNetwork, vHost and vDatastore tabs are scaled to the
+VM count, with a few disks and NICs per VM, and a small share of VMs have no
+UUID in vDisk and vNetwork so enrichment has to match them by name. Output
+is deterministic for a given size and seed.
+
+    python synthetic.py 10000 -o rvtools-10000.xlsx
+"""
+import argparse
+import sys
+
+import numpy as np
+from openpyxl import Workbook
+
+from reader import VINFO_SHEET, column_mappings, optional_mappings
+from summary import MAX_SHEET_ROWS
+
+try:
+    import xlsxwriter
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
+# VM counts the benchmark suite is run at
+SIZES = [1000, 10000, 100000, 500000]
+
+# Share of numeric cells written in a messy form
+DEFAULT_MESSY_RATIO = 0.01
+
+# Share of VMs whose vDisk and vNetwork rows have no VM UUID
+DEFAULT_MISSING_UUID_RATIO = 0.02
+
+POWERSTATES = ['poweredOn', 'poweredOff', 'suspended']
+POWERSTATE_WEIGHTS = [0.8, 0.18, 0.02]
+
+CPU_CHOICES = [1, 2, 4, 8, 16, 32]
+CPU_WEIGHTS = [0.1, 0.35, 0.3, 0.15, 0.07, 0.03]
+
+MEMORY_MB_CHOICES = [1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072]
+MEMORY_WEIGHTS = [0.05, 0.1, 0.25, 0.3, 0.15, 0.1, 0.04, 0.01]
+
+OS_NAMES = [
+    'Microsoft Windows Server 2012 R2 (64-bit)',
+    'Microsoft Windows Server 2016 or later (64-bit)',
+    'Microsoft Windows Server 2019 (64-bit)',
+    'Microsoft Windows Server 2022 (64-bit)',
+    'Microsoft Windows 10 (64-bit)',
+    'Microsoft Windows 11 (64-bit)',
+    'Red Hat Enterprise Linux 7 (64-bit)',
+    'Red Hat Enterprise Linux 8 (64-bit)',
+    'Red Hat Enterprise Linux 9 (64-bit)',
+    'CentOS 7 (64-bit)',
+    'CentOS 8 (64-bit)',
+    'Rocky Linux (64-bit)',
+    'AlmaLinux (64-bit)',
+    'Oracle Linux 7 (64-bit)',
+    'Oracle Linux 8 (64-bit)',
+    'SUSE Linux Enterprise 12 (64-bit)',
+    'SUSE Linux Enterprise 15 (64-bit)',
+    'Ubuntu Linux (64-bit)',
+    'Debian GNU/Linux 10 (64-bit)',
+    'Debian GNU/Linux 11 (64-bit)',
+    'VMware Photon OS (64-bit)',
+    'FreeBSD 13 (64-bit)',
+    'Other 3.x or later Linux (64-bit)',
+    'Other Linux (64-bit)',
+]
+
+DISKS_PER_VM = [1, 2, 3, 4]
+DISK_WEIGHTS = [0.45, 0.35, 0.15, 0.05]
+DISK_MIB_CHOICES = [20480, 40960, 61440, 102400, 204800, 512000, 1048576]
+DISK_MIB_WEIGHTS = [0.1, 0.3, 0.2, 0.2, 0.1, 0.07, 0.03]
+
+NICS_PER_VM = [1, 2, 3]
+NIC_WEIGHTS = [0.75, 0.2, 0.05]
+
+VMS_PER_HOST = 25
+VMS_PER_DATASTORE = 40
+
+CPU_MODELS = [
+    'Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz',
+    'Intel(R) Xeon(R) Gold 6338 CPU @ 2.00GHz',
+    'Intel(R) Xeon(R) Platinum 8380 CPU @ 2.30GHz',
+    'AMD EPYC 7543 32-Core Processor',
+    'AMD EPYC 9354 32-Core Processor',
+]
+DATASTORE_TYPES = ['VMFS', 'NFS', 'vsan']
+DATASTORE_TYPE_WEIGHTS = [0.6, 0.3, 0.1]
+
+# Real vInfo headers that none of the column aliases use
+FILLER_COLUMNS = [
+    'Template', 'Config status', 'DNS Name', 'Connection state', 'Guest state',
+    'Heartbeat', 'Consolidation Needed', 'PowerOn', 'Suspend time', 'Creation date',
+    'Change Version', 'NICs', 'Disks', 'Primary IP Address', 'Network #1',
+    'Resource pool', 'Folder', 'vApp', 'HW version', 'Annotation',
+]
+
+
+def _header(rng):
+    """One alias per mapped column, so each file exercises different header names"""
+    return {target: str(rng.choice(aliases)) for target, aliases in column_mappings.items()}
+
+
+def _messy(values, rng, ratio):
+    """Numeric column as objects with a share of the cells written the way real exports mangle them"""
+    cells = values.astype(object)
+    picked = np.flatnonzero(rng.random(len(values)) < ratio)
+    for index, kind in zip(picked, rng.integers(0, 5, len(picked))):
+        value = values[index]
+        if kind == 0:
+            cells[index] = f'{value:,}'
+        elif kind == 1:
+            cells[index] = f' {value} '
+        elif kind == 2:
+            cells[index] = str(value)
+        elif kind == 3:
+            cells[index] = 'N/A'
+        else:
+            cells[index] = None
+    return cells
+
+
+def _inventory(vms):
+    """Host and datastore names for an export of the given size"""
+    hosts = [f'esx{n:04d}.example.local' for n in range(max(vms // VMS_PER_HOST, 2))]
+    datastores = [f'ds-{n:04d}' for n in range(max(vms // VMS_PER_DATASTORE, 2))]
+    return hosts, datastores
+
+
+def generate_vinfo(vms, seed=0, messy_ratio=DEFAULT_MESSY_RATIO):
+    """Header row and column values of a synthetic vInfo tab"""
+    rng = np.random.default_rng(seed)
+    names = _header(rng)
+
+    clusters = [f'DC{dc}-CL{n:02d}' for dc in range(1, 5) for n in range(1, max(vms // 2000, 3) + 1)]
+    vcenters = [f'vcenter{n}.example.local' for n in range(1, 4)]
+    provisioned = np.round(rng.lognormal(11, 1, vms)).astype(np.int64) + 1024
+    in_use = (provisioned * rng.uniform(0.05, 1.0, vms)).astype(np.int64)
+
+    columns = {
+        names['VM Name']: _vm_names(vms),
+        names['Powerstate']: rng.choice(POWERSTATES, vms, p=POWERSTATE_WEIGHTS).tolist(),
+        names['CPUs']: _messy(rng.choice(CPU_CHOICES, vms, p=CPU_WEIGHTS), rng, messy_ratio),
+        names['Memory']: _messy(rng.choice(MEMORY_MB_CHOICES, vms, p=MEMORY_WEIGHTS), rng, messy_ratio),
+        names['Provisioned MB']: _messy(provisioned, rng, messy_ratio),
+        names['In Use MB']: _messy(in_use, rng, messy_ratio),
+        names['Cluster']: rng.choice(clusters, vms).tolist(),
+        names['OS according to the configuration file']: rng.choice(OS_NAMES, vms).tolist(),
+        optional_mappings['VM UUID'][0]: [f'{a:016x}-{b:016x}' for a, b in rng.integers(0, 2**63, (vms, 2))],
+        optional_mappings['VI SDK Server'][0]: rng.choice(vcenters, vms).tolist(),
+    }
+    for n, filler in enumerate(FILLER_COLUMNS):
+        columns[filler] = [f'{filler} {v}' for v in rng.integers(0, 50, vms)] if n % 2 else rng.integers(0, 1000, vms).tolist()
+    hosts, _ = _inventory(vms)
+    columns['Host'] = rng.choice(hosts, vms).tolist()
+    return list(columns), list(columns.values())
+
+
+def _vm_names(vms):
+    return [f'vm-{i:07d}' for i in range(vms)]
+
+
+def _per_vm_rows(rng, vms, choices, weights):
+    """VM index and per-VM item number of each row of a tab with several rows per VM.
+
+    Rows past the sheet's row limit are dropped.
+    """
+    counts = rng.choice(choices, vms, p=weights)
+    vm = np.repeat(np.arange(vms), counts)[:MAX_SHEET_ROWS]
+    item = np.arange(len(vm)) - np.repeat(np.cumsum(counts) - counts, counts)[:MAX_SHEET_ROWS]
+    return vm, item
+
+
+def _uuids_for(vm, uuids, missing):
+    """VM UUID of each row, blank for the VMs flagged missing"""
+    return [None if missing[i] else uuids[i] for i in vm]
+
+
+def generate_tabs(vms, seed=0, messy_ratio=DEFAULT_MESSY_RATIO, missing_uuid_ratio=DEFAULT_MISSING_UUID_RATIO):
+    """Header row and column values of every synthetic tab, by sheet name"""
+    header, columns = generate_vinfo(vms, seed, messy_ratio)
+    tabs = {VINFO_SHEET: (header, columns)}
+
+    rng = np.random.default_rng(seed + 1)
+    names = _vm_names(vms)
+    uuids = columns[header.index(optional_mappings['VM UUID'][0])]
+    missing = rng.random(vms) < missing_uuid_ratio
+    hosts, datastores = _inventory(vms)
+
+    vm, disk = _per_vm_rows(rng, vms, DISKS_PER_VM, DISK_WEIGHTS)
+    home = rng.choice(datastores, vms)
+    vdisk = {
+        'VM': [names[i] for i in vm],
+        'Disk': [f'Hard disk {n + 1}' for n in disk],
+        'Capacity MiB': rng.choice(DISK_MIB_CHOICES, len(vm), p=DISK_MIB_WEIGHTS).tolist(),
+        'Thin': rng.choice(['True', 'False'], len(vm)).tolist(),
+        'Path': [f'[{home[i]}] {names[i]}/{names[i]}{f"_{n}" if n else ""}.vmdk' for i, n in zip(vm, disk)],
+        'VM UUID': _uuids_for(vm, uuids, missing),
+    }
+
+    vm, nic = _per_vm_rows(rng, vms, NICS_PER_VM, NIC_WEIGHTS)
+    vnetwork = {
+        'VM': [names[i] for i in vm],
+        'NIC label': [f'Network adapter {n + 1}' for n in nic],
+        'Adapter': rng.choice(['vmxnet3', 'e1000e'], len(vm), p=[0.9, 0.1]).tolist(),
+        'Network': [f'VLAN{v}' for v in rng.integers(100, 140, len(vm))],
+        'Connected': ['True'] * len(vm),
+        'VM UUID': _uuids_for(vm, uuids, missing),
+    }
+
+    vhost = {
+        'Host': hosts,
+        'CPU Model': rng.choice(CPU_MODELS, len(hosts)).tolist(),
+        '# CPU': [2] * len(hosts),
+        '# Cores': rng.choice([32, 48, 64], len(hosts)).tolist(),
+        '# Memory': rng.choice([524288, 786432, 1048576], len(hosts)).tolist(),
+    }
+
+    vdatastore = {
+        'Name': datastores,
+        'Type': rng.choice(DATASTORE_TYPES, len(datastores), p=DATASTORE_TYPE_WEIGHTS).tolist(),
+        'Capacity MiB': rng.choice([4194304, 8388608, 16777216], len(datastores)).tolist(),
+        '# VMs': rng.integers(0, VMS_PER_DATASTORE * 2, len(datastores)).tolist(),
+    }
+
+    for sheet_name, tab in [('vDisk', vdisk), ('vNetwork', vnetwork), ('vHost', vhost), ('vDatastore', vdatastore)]:
+        tabs[sheet_name] = (list(tab), list(tab.values()))
+    return tabs
+
+
+def write_export(path, vms, seed=0, messy_ratio=DEFAULT_MESSY_RATIO,
+                 missing_uuid_ratio=DEFAULT_MISSING_UUID_RATIO, vinfo_only=False):
+    """Write a synthetic RVtools export with tabs of the given size"""
+    if vinfo_only:
+        tabs = {VINFO_SHEET: generate_vinfo(vms, seed, messy_ratio)}
+    else:
+        tabs = generate_tabs(vms, seed, messy_ratio, missing_uuid_ratio)
+
+    if HAS_XLSXWRITER:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_numbers': False})
+        for sheet_name, (header, columns) in tabs.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, header)
+            for row_number, row in enumerate(zip(*columns), start=1):
+                worksheet.write_row(row_number, 0, row)
+        workbook.close()
+        return path
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, (header, columns) in tabs.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(header)
+        for row in zip(*columns):
+            worksheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic RVtools export")
+    parser.add_argument('vms', type=int, help="Number of VMs in the export")
+    parser.add_argument('-o', '--output', help="Output path (default: rvtools-<vms>.xlsx)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--messy-ratio', type=float, default=DEFAULT_MESSY_RATIO,
+                        help="Share of numeric cells written in a messy form")
+    parser.add_argument('--missing-uuid-ratio', type=float, default=DEFAULT_MISSING_UUID_RATIO,
+                        help="Share of VMs without a UUID in the vDisk and vNetwork tabs")
+    parser.add_argument('--vinfo-only', action='store_true', help="Only write the vInfo tab")
+    args = parser.parse_args(argv)
+
+    path = write_export(args.output or f'rvtools-{args.vms}.xlsx', args.vms, args.seed, args.messy_ratio,
+                        args.missing_uuid_ratio, args.vinfo_only)
+    print(f"Wrote {args.vms} VMs to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""First-fit-decreasing host packing and the capacity plan built on it."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from capacity import (HostProfile, capacity_rows, empty_scope_message, first_fit_decreasing, plan_capacity,
+                      scoped_vms)
+
+
+def server_list(cpus, memory=None, disk=None, clusters=None, powerstates=None, prod=None):
+    count = len(cpus)
+    return pd.DataFrame({
+        'VM Name': [f'vm{i}' for i in range(count)],
+        'Powerstate': powerstates if powerstates is not None else ['poweredOn'] * count,
+        'CPUs': cpus,
+        'Memory (GB)': memory if memory is not None else [1.0] * count,
+        'In Use Disk (GB)': disk if disk is not None else [1.0] * count,
+        'Cluster': clusters if clusters is not None else ['CL1'] * count,
+        'OS according to the configuration file': ['Linux'] * count,
+        'In Scope for Prod?': prod if prod is not None else [''] * count,
+        'In Scope for DR?': [''] * count,
+    })
+
+
+def test_packs_largest_first_into_the_first_host_with_room():
+    capacity = np.array([10.0, 10.0, 10.0])
+    demand = np.array([[3, 1, 1], [7, 1, 1], [5, 1, 1], [5, 1, 1]], dtype=float)
+    hosts_of, hosts = first_fit_decreasing(demand, capacity)
+    assert hosts == 2
+    # 7 and 3 share a host, the two 5s the other
+    assert hosts_of[1] == hosts_of[0]
+    assert hosts_of[2] == hosts_of[3] != hosts_of[0]
+
+
+def test_every_dimension_must_fit():
+    capacity = np.array([10.0, 10.0, 10.0])
+    # Tiny on CPU but each fills most of a host's memory
+    demand = np.array([[1, 6, 1], [1, 6, 1], [1, 6, 1]], dtype=float)
+    _, hosts = first_fit_decreasing(demand, capacity)
+    assert hosts == 3
+
+
+def test_hosts_are_never_overfilled():
+    rng = np.random.default_rng(0)
+    capacity = np.array([64.0, 512.0, 4000.0])
+    demand = rng.uniform(0, 1, size=(2000, 3)) * capacity / 3
+    hosts_of, hosts = first_fit_decreasing(demand, capacity)
+    used = np.zeros((hosts, 3))
+    np.add.at(used, hosts_of, demand)
+    assert (used <= capacity + 1e-9).all()
+    assert hosts >= np.ceil((demand.sum(axis=0) / capacity).max())
+
+
+def test_no_vms_need_no_hosts():
+    hosts_of, hosts = first_fit_decreasing(np.empty((0, 3)), np.array([1.0, 1.0, 1.0]))
+    assert hosts == 0 and len(hosts_of) == 0
+
+
+def test_oversized_vms_get_a_host_each_and_are_counted():
+    profile = HostProfile(cores=4, memory_gb=16, storage_gb=100, cpu_overcommit=1.0, spare_hosts=1)
+    df = server_list([8, 8, 1, 1], memory=[4.0, 4.0, 4.0, 4.0])
+    plan = plan_capacity(df, profile)['Cluster'].iloc[0]
+    assert plan['Oversized VMs'] == 2
+    assert plan['Hosts'] == 3
+    assert plan['Hosts with Spares'] == 4
+
+
+def test_plan_per_cluster_and_scope():
+    profile = HostProfile(cores=4, memory_gb=16, storage_gb=100, cpu_overcommit=1.0, spare_hosts=0)
+    df = server_list([4, 4, 2, 2, 2], clusters=['A', 'A', 'B', 'B', 'B'],
+                     powerstates=['poweredOn', 'poweredOn', 'poweredOn', 'poweredOff', 'poweredOn'])
+    plans = plan_capacity(df, profile)
+    by_cluster = plans['Cluster'].set_index('Name')
+    assert by_cluster.loc['A', 'Hosts'] == 2
+    assert by_cluster.loc['B', 'VMs'] == 2
+    assert by_cluster.loc['B', 'Hosts'] == 1
+    assert plans['Cluster'].attrs['vms'] == 4
+
+    rows = capacity_rows(plans, profile)
+    assert rows[-1][0] == 'Operating System Subtotal'
+
+
+def test_scope_columns_and_empty_scopes():
+    df = server_list([1, 1, 1], prod=['yes', ' X ', 'no'])
+    assert len(scoped_vms(df, 'prod')) == 2
+    assert len(scoped_vms(df, 'dr')) == 0
+    assert 'In Scope for DR?' in empty_scope_message('dr')
+    with pytest.raises(ValueError):
+        scoped_vms(df, 'nope')
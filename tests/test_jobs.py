@@ -0,0 +1,115 @@
+"""Background jobs: slots, memory budget, cancellation and de-duplication."""
+import threading
+
+import pytest
+
+from buffers import MemoryBudgetExceeded
+from jobs import JobManager
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def manager():
+    jobs = JobManager(max_concurrent=1, memory_budget_mb=100)
+    yield jobs
+    jobs.shutdown()
+
+
+def wait_finished(job):
+    for _ in range(TIMEOUT * 100):
+        if job.finished:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError(f"{job.name} did not finish")
+
+
+def test_job_runs_and_keeps_only_its_outcome(manager):
+    def run(job):
+        job.report('writing:xlsx', rows=3)
+        return {'rows': 3}
+
+    job = wait_finished(manager.submit('k', 'export.xlsx', run, cache_key='k'))
+    assert job.status == 'done'
+    assert job.outcome == {'rows': 3}
+    assert job.progress == 1.0
+    assert manager.stats()['done'] == 1
+
+
+def test_identical_submits_share_one_job(manager):
+    release = threading.Event()
+    calls = []
+
+    def run(job):
+        calls.append(job.key)
+        release.wait(TIMEOUT)
+
+    first = manager.submit('k', 'a', run)
+    second = manager.submit('k', 'a', run)
+    release.set()
+    wait_finished(first)
+    assert first is second
+    assert calls == ['k']
+
+
+def test_queued_job_can_be_cancelled_while_another_runs(manager):
+    release = threading.Event()
+    running = manager.submit('first', 'a', lambda job: release.wait(TIMEOUT))
+    queued = manager.submit('second', 'b', lambda job: None)
+    manager.cancel('second')
+    release.set()
+    assert wait_finished(queued).status == 'cancelled'
+    assert wait_finished(running).status == 'done'
+
+
+def test_running_job_stops_at_its_next_stage(manager):
+    started, resume = threading.Event(), threading.Event()
+
+    def run(job):
+        started.set()
+        resume.wait(TIMEOUT)
+        job.report('normalizing')
+
+    job = manager.submit('k', 'a', run)
+    started.wait(TIMEOUT)
+    manager.cancel('k')
+    resume.set()
+    assert wait_finished(job).status == 'cancelled'
+
+
+def test_failures_are_recorded_and_can_be_resubmitted(manager):
+    def fail(job):
+        raise ValueError("bad export")
+
+    job = wait_finished(manager.submit('k', 'a', fail))
+    assert job.status == 'failed'
+    assert job.error == "bad export"
+    retry = wait_finished(manager.submit('k', 'a', lambda job: 'ok'))
+    assert retry is not job and retry.status == 'done'
+
+
+def test_memory_budget(manager):
+    with pytest.raises(MemoryBudgetExceeded):
+        manager.submit('big', 'a', lambda job: None, memory_mb=101)
+
+    jobs = JobManager(max_concurrent=2, memory_budget_mb=100)
+    try:
+        release = threading.Event()
+        overlap = []
+        first = jobs.submit('a', 'a', lambda job: release.wait(TIMEOUT), memory_mb=60)
+        # Fits a slot but not the budget, so it waits for the first job
+        second = jobs.submit('b', 'b', lambda job: overlap.append(first.finished), memory_mb=60)
+        threading.Event().wait(0.3)
+        assert second.status == 'queued'
+        release.set()
+        wait_finished(second)
+        assert overlap == [True]
+        assert jobs.stats()['reserved_mb'] == 0
+    finally:
+        jobs.shutdown()
+
+
+def test_running_jobs_split_the_cpus(monkeypatch):
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    assert JobManager(max_concurrent=2).workers_per_job == 4
+    assert JobManager(max_concurrent=16).workers_per_job == 1
@@ -0,0 +1,82 @@
+"""De-duplication of VMs when merging exports."""
+import shutil
+
+import pandas as pd
+
+from merge import duplicate_mask, merge_exports, merge_server_lists
+from processor import final_columns
+from synthetic import write_export
+
+
+def server_list(names, clusters=None, uuids=None, vcenter='vcA'):
+    """A parsed ServerList with the identity columns a merge needs"""
+    count = len(names)
+    df = pd.DataFrame({col: [''] * count for col in final_columns})
+    df['VM Name'] = names
+    df['Powerstate'] = 'poweredOn'
+    df['CPUs'] = 2
+    df['Memory (GB)'] = 4.0
+    df['Provisioned Disk (GB)'] = 40.0
+    df['In Use Disk (GB)'] = 20.0
+    df['Cluster'] = clusters if clusters is not None else ['CL1'] * count
+    df['OS according to the configuration file'] = 'Ubuntu Linux (64-bit)'
+    df['VM UUID'] = uuids if uuids is not None else [None] * count
+    df['VI SDK Server'] = vcenter
+    return df
+
+
+def test_same_export_twice_keeps_one_copy():
+    first = server_list(['a', 'b', 'c'], uuids=['u1', 'u2', 'u3'])
+    merged = merge_server_lists([('a.xlsx', first), ('a-copy.xlsx', first.copy())])
+    assert merged['VM Name'].tolist() == ['a', 'b', 'c']
+    assert merged.attrs['duplicates'] == 3
+    assert merged['CPUs'].sum() == 6
+
+
+def test_overlapping_exports_of_one_vcenter():
+    monday = server_list(['a', 'b'])
+    tuesday = server_list(['b', 'c'])
+    merged = merge_server_lists([('monday.xlsx', monday), ('tuesday.xlsx', tuesday)])
+    assert merged['VM Name'].tolist() == ['a', 'b', 'c']
+    assert merged.attrs['duplicates'] == 1
+
+
+def test_overlapping_vcenters_match_on_uuid_and_name():
+    one = server_list(['a', 'b'], uuids=['u1', 'u2'], vcenter='vcA')
+    two = server_list(['renamed', 'B'], clusters=['CL9', 'cl1'], uuids=['u1', None], vcenter='vcB')
+    merged = merge_server_lists([('one.xlsx', one), ('two.xlsx', two)])
+    assert merged['VM Name'].tolist() == ['a', 'b']
+    assert merged['Source'].tolist() == ['vcA', 'vcA']
+
+
+def test_repeats_within_one_export_are_kept():
+    one = server_list(['a', 'a', 'b'], uuids=['u1', 'u1', 'u2'])
+    merged = merge_server_lists([('one.xlsx', one)])
+    assert merged['VM Name'].tolist() == ['a', 'a', 'b']
+    assert merged.attrs['duplicates'] == 0
+
+
+def test_blank_names_do_not_match():
+    one = server_list([None, ''])
+    two = server_list([None, ''])
+    assert not duplicate_mask(pd.concat([one, two], ignore_index=True), [0, 0, 1, 1]).any()
+
+
+def test_missing_cluster_matches_missing_cluster():
+    one = server_list(['a'], clusters=[None])
+    two = server_list(['A '], clusters=[float('nan')])
+    assert duplicate_mask(pd.concat([one, two], ignore_index=True), [0, 1]).tolist() == [False, True]
+
+
+def test_merging_a_file_with_its_copy(tmp_path):
+    original = tmp_path / 'vcA.xlsx'
+    write_export(str(original), 50, vinfo_only=True)
+    copy = tmp_path / 'vcA-copy.xlsx'
+    shutil.copy(original, copy)
+
+    single, _ = merge_exports([(str(original), str(original))], workers=1)
+    merged, errors = merge_exports([(str(original), str(original)), (str(copy), str(copy))], workers=2)
+    assert not errors
+    assert len(merged) == len(single) == 50
+    assert merged.attrs['duplicates'] == 50
+    assert merged['Memory (GB)'].sum() == single['Memory (GB)'].sum()
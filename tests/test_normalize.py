@@ -0,0 +1,44 @@
+"""Numeric coercion, unit conversion and parse-failure counts."""
+import numpy as np
+import pandas as pd
+
+from normalize import normalize_server_list
+
+
+def raw_vinfo(cpus, memory, provisioned=None, in_use=None):
+    count = len(cpus)
+    return pd.DataFrame({
+        'VM Name': [f'vm{i}' for i in range(count)],
+        'Powerstate': ['poweredOn'] * count,
+        'CPUs': cpus,
+        'Memory': memory,
+        'Provisioned MB': provisioned if provisioned is not None else [953.7] * count,
+        'In Use MB': in_use if in_use is not None else [0] * count,
+        'Cluster': ['CL1'] * count,
+        'OS according to the configuration file': ['Linux'] * count,
+    })
+
+
+def test_failed_cells_are_counted_and_blank_cells_are_not():
+    df = raw_vinfo(cpus=[2, 'four', None, '  ', 8], memory=['1024', 'n/a', '', None, 2048.0])
+    normalized, errors = normalize_server_list(df)
+    assert errors['CPUs'] == 1
+    assert errors['Memory'] == 1
+    assert errors['Provisioned MB'] == 0
+    assert normalized['CPUs'].tolist() == [2, 0, 0, 0, 8]
+    assert normalized['Memory (GB)'].tolist() == [1.0, 0.0, 0.0, 0.0, 2.0]
+
+
+def test_units_are_converted_to_gb():
+    df = raw_vinfo(cpus=[1, 2], memory=[512, 4096], provisioned=[953.7, 9537], in_use=[476.85, np.nan])
+    normalized, errors = normalize_server_list(df)
+    assert normalized['Memory (GB)'].tolist() == [0.5, 4.0]
+    assert normalized['Provisioned Disk (GB)'].tolist() == [1.0, 10.0]
+    assert normalized['In Use Disk (GB)'].tolist() == [0.5, 0.0]
+    assert set(errors.values()) == {0}
+
+
+def test_whole_cpu_counts_are_downcast_and_text_columns_are_categorical():
+    normalized, _ = normalize_server_list(raw_vinfo(cpus=[1.0, 2.0], memory=[1024, 1024]))
+    assert pd.api.types.is_integer_dtype(normalized['CPUs'])
+    assert isinstance(normalized['Cluster'].dtype, pd.CategoricalDtype)
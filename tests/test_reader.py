@@ -0,0 +1,225 @@
+"""The byte scanner in reader.py against openpyxl on hand-written sheet XML."""
+import io
+import tempfile
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from buffers import BufferFile
+from enrichment import sheet_specs
+from reader import VINFO_SHEET, MissingSheetError, XlsxPackage, column_mappings, dtype_plan, read_sheets
+from synthetic import write_export
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="vInfo" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+    'Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+SHARED_STRINGS = [
+    '<si><t>VM</t></si>',
+    '<si><t>Powerstate</t></si>',
+    '<si><t>CPUs</t></si>',
+    '<si><t>Annotation</t></si>',
+    '<si><t>web &amp; db &lt;01&gt;</t></si>',
+    '<si><r><t>rich</t></r><r><rPr><b/></rPr><t xml:space="preserve"> text</t></r></si>',
+    '<si><t>poweredOn</t></si>',
+    '<si><t>caf&#233; &quot;q&quot;</t></si>',
+    '<si><t xml:space="preserve">  padded  </t></si>',
+]
+
+# Columns: A VM, B Powerstate, C CPUs, D (unmapped), E Annotation
+ROWS = [
+    '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c>'
+    '<c r="D1" t="inlineStr"><is><t>Ignored</t></is></c><c r="E1" t="s"><v>3</v></c></row>',
+    # Shared strings with entities and rich text runs
+    '<row r="2"><c r="A2" t="s"><v>4</v></c><c r="B2" t="s"><v>6</v></c><c r="C2"><v>4</v></c>'
+    '<c r="E2" t="s"><v>5</v></c></row>',
+    # Inline strings, with entities and runs, and a formula's cached string
+    '<row r="3"><c r="A3" t="inlineStr"><is><t>inline &amp; &#x41;</t></is></c>'
+    '<c r="B3" t="inlineStr"><is><r><t>powered</t></r><r><t>Off</t></r></is></c>'
+    '<c r="C3"><f>1+1</f><v>2</v></c><c r="E3" t="str"><f>"a"&amp;"b"</f><v>a&amp;b</v></c></row>',
+    # Self-closing and styled empty cells
+    '<row r="4"><c r="A4" t="s"><v>7</v></c><c r="B4" s="1"/><c r="C4" s="2"></c>'
+    '<c r="D4"/><c r="E4" t="s"><v>8</v></c></row>',
+    # A row whose projected cells are all empty
+    '<row r="5"><c r="A5" s="1"/><c r="D5"><v>9</v></c></row>',
+    # Attributes in another order than r first
+    '<row r="6"><c s="1" t="s" r="A6"><v>4</v></c><c t="b" r="B6"><v>1</v></c>'
+    '<c s="3" r="C6"><v>2.5</v></c><c t="inlineStr" s="1" r="E6"><is><t>x &gt; y</t></is></c></row>',
+    # Cells skipped in the middle of a row and a float
+    '<row r="8" spans="1:5"><c r="A8" t="s"><v>8</v></c><c r="E8"><v>1.25E2</v></c></row>',
+]
+
+MAPPINGS = {'VM Name': ['VM'], 'Powerstate': ['Powerstate'], 'CPUs': ['CPUs']}
+OPTIONAL = {'Annotation': ['Annotation']}
+
+
+def build_xlsx(rows=ROWS, shared_strings=SHARED_STRINGS):
+    """A minimal xlsx package with one vInfo sheet of the given row XML"""
+    sheet = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<sheetData>' + ''.join(rows) + '</sheetData></worksheet>'
+    )
+    strings = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        f'count="{len(shared_strings)}" uniqueCount="{len(shared_strings)}">' + ''.join(shared_strings) + '</sst>'
+    )
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        archive.writestr('xl/worksheets/sheet1.xml', sheet)
+        archive.writestr('xl/sharedStrings.xml', strings)
+    return output.getvalue()
+
+
+def read_openpyxl(data, columns):
+    """The named header columns as openpyxl reads them, without blank rows"""
+    ws = load_workbook(io.BytesIO(data), read_only=True, data_only=True)['vInfo']
+    rows = list(ws.values)
+    header = list(rows[0])
+    df = pd.DataFrame([[row[header.index(col)] if header.index(col) < len(row) else None for col in columns]
+                       for row in rows[1:]], columns=columns)
+    return df.dropna(how='all').reset_index(drop=True)
+
+
+def read_scanned(data):
+    with XlsxPackage(io.BytesIO(data)) as package:
+        df = package._read_scanned('vInfo', MAPPINGS, OPTIONAL)
+    assert df is not None, "the scanner fell back to the XML parser"
+    return df
+
+
+def test_scanner_matches_openpyxl():
+    data = build_xlsx()
+    scanned = read_scanned(data)
+    expected = read_openpyxl(data, ['VM', 'Powerstate', 'CPUs', 'Annotation'])
+    expected.columns = list(scanned.columns)
+    pd.testing.assert_frame_equal(scanned, expected, check_dtype=False)
+
+
+def test_scanner_decodes_strings():
+    scanned = read_scanned(build_xlsx())
+    assert scanned['VM Name'].tolist() == ['web & db <01>', 'inline & A', 'café "q"', 'web & db <01>', '  padded  ']
+    assert scanned['Powerstate'].tolist()[:2] == ['poweredOn', 'poweredOff']
+    assert scanned['Annotation'].tolist() == ['rich text', 'a&b', '  padded  ', 'x > y', 125]
+
+
+def test_scanner_skips_blank_rows_and_keeps_missing_cells():
+    scanned = read_scanned(build_xlsx())
+    assert len(scanned) == 5
+    assert scanned.loc[2, 'Powerstate'] is None
+    assert pd.isna(scanned.loc[2, 'CPUs'])
+    assert scanned.loc[3, 'Powerstate'] is True
+    assert scanned.loc[3, 'CPUs'] == 2.5
+
+
+@pytest.mark.parametrize('layout', ['ref-first', 'mixed', 'ref-later'])
+def test_scanner_agrees_with_parser(layout):
+    if layout == 'ref-first':
+        # Every cell has its reference first, so the scanner takes the leading-ref pattern
+        rows = [row for row in ROWS if 'r="A6"' not in row]
+    elif layout == 'mixed':
+        rows = ROWS
+    else:
+        rows = [row.replace('<c r="', '<c cm="0" r="') for row in ROWS]
+    with XlsxPackage(io.BytesIO(build_xlsx(rows))) as package:
+        scanned = package._read_scanned('vInfo', MAPPINGS, OPTIONAL)
+        parsed = package._read_parsed('vInfo', MAPPINGS, OPTIONAL)
+    pd.testing.assert_frame_equal(scanned, parsed)
+
+
+def test_scanner_reads_dates_and_unparsed_numbers():
+    rows = ROWS[:2] + [
+        '<row r="3"><c r="A3" t="s"><v>6</v></c><c r="B3" t="d"><v>2024-03-01T12:30:00</v></c>'
+        '<c r="C3"><v>n/a</v></c><c r="E3" t="d"><v>01/03/2024</v></c></row>',
+    ]
+    with XlsxPackage(io.BytesIO(build_xlsx(rows))) as package:
+        scanned = package._read_scanned('vInfo', MAPPINGS, OPTIONAL)
+        parsed = package._read_parsed('vInfo', MAPPINGS, OPTIONAL)
+    assert scanned.loc[1].tolist() == ['poweredOn', datetime(2024, 3, 1, 12, 30), 'n/a', '01/03/2024']
+    pd.testing.assert_frame_equal(scanned, parsed)
+
+
+def test_rows_without_references_fall_back_to_the_parser():
+    rows = [ROWS[0]] + ['<row><c t="s"><v>4</v></c><c t="s"><v>6</v></c><c><v>4</v></c></row>',
+                        '<row><c t="s"><v>8</v></c><c/><c><v>2</v></c></row>']
+    with XlsxPackage(io.BytesIO(build_xlsx(rows))) as package:
+        assert package._read_scanned('vInfo', MAPPINGS, OPTIONAL) is None
+        df = package.read_projected('vInfo', MAPPINGS, OPTIONAL)
+    assert df['VM Name'].tolist() == ['web & db <01>', '  padded  ']
+    assert df['CPUs'].tolist() == [4, 2]
+
+
+def test_targets_resolving_to_one_column_both_get_its_cells():
+    mappings = {**MAPPINGS, 'Name Copy': ['VM']}
+    with XlsxPackage(io.BytesIO(build_xlsx())) as package:
+        scanned = package._read_scanned('vInfo', mappings, OPTIONAL)
+        parsed = package._read_parsed('vInfo', mappings, OPTIONAL)
+    assert scanned['Name Copy'].tolist() == scanned['VM Name'].tolist()
+    pd.testing.assert_frame_equal(scanned, parsed)
+
+
+def test_only_missing_optional_sheets_are_skipped():
+    spec = {'mappings': MAPPINGS}
+    sheets = read_sheets(io.BytesIO(build_xlsx()), {'vInfo': spec, 'vDisk': spec}, required=('vInfo',))
+    assert list(sheets) == ['vInfo']
+    with pytest.raises(MissingSheetError):
+        read_sheets(io.BytesIO(build_xlsx()), {'vDisk': spec}, required=('vDisk',))
+
+
+def test_parallel_read_of_an_in_memory_export(tmp_path, monkeypatch):
+    path = tmp_path / 'export.xlsx'
+    write_export(str(path), 50)
+    specs = {VINFO_SHEET: {'mappings': column_mappings, 'plan': dtype_plan}, **sheet_specs}
+    serial = read_sheets(str(path), specs, required=(VINFO_SHEET,))
+
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(spool_dir))
+    parallel = read_sheets(BufferFile(path.read_bytes()), specs, required=(VINFO_SHEET,), workers=2)
+    assert list(parallel) == list(serial)
+    for name in serial:
+        pd.testing.assert_frame_equal(parallel[name], serial[name])
+    # The temporary copy the workers read is removed afterwards
+    assert list(spool_dir.iterdir()) == []
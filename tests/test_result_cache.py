@@ -0,0 +1,48 @@
+"""The result cache's LRU budget and disk spill."""
+import pandas as pd
+
+from result_cache import ResultCache, content_key
+
+
+def frame(rows):
+    return pd.DataFrame({'VM Name': [f'vm{i}' for i in range(rows)]})
+
+
+def test_content_key_depends_on_bytes_and_version():
+    assert content_key(b'abc', '1') == content_key(memoryview(b'abc'), '1')
+    assert content_key(b'abc', '1') != content_key(b'abc', '2')
+    assert content_key(b'abc', '1') != content_key(b'abd', '1')
+
+
+def test_least_recently_used_entries_are_evicted():
+    entry_size = ResultCache().put('probe', frame(10), b'x' * 1000).size
+    cache = ResultCache(max_bytes=entry_size * 2)
+    cache.put('a', frame(10), b'x' * 1000)
+    cache.put('b', frame(10), b'x' * 1000)
+    assert cache.get('a') is not None
+    cache.put('c', frame(10), b'x' * 1000)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert cache.current_bytes <= cache.max_bytes
+    assert cache.stats()['hits'] == 1
+
+
+def test_spilled_entries_survive_eviction_and_restarts(tmp_path):
+    cache = ResultCache(max_bytes=1, spill_dir=str(tmp_path))
+    cache.put('a', frame(5), b'workbook')
+    # Larger than the whole budget, so only kept on disk
+    assert len(cache) == 0
+
+    restarted = ResultCache(spill_dir=str(tmp_path))
+    entry = restarted.get('a')
+    assert entry.xlsx_bytes == b'workbook'
+    assert entry.server_list['VM Name'].tolist() == [f'vm{i}' for i in range(5)]
+    assert restarted.stats()['disk_hits'] == 1
+    assert restarted.get('missing') is None
+
+
+def test_truncated_spill_files_are_misses(tmp_path):
+    cache = ResultCache(spill_dir=str(tmp_path))
+    (tmp_path / 'broken.pkl').write_bytes(b'\x80\x05')
+    assert cache.get('broken') is None
+    assert cache.stats()['misses'] == 1
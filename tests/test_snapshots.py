@@ -0,0 +1,74 @@
+"""Snapshot diffs and carrying scope and notes forward from a processed workbook."""
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from snapshots import (carry_forward, diff_against_previous, read_processed_workbook, save_snapshot,
+                       trend_report)
+from workbook_writer import write_workbook
+
+
+def server_list(names, cpus, clusters=None, **columns):
+    count = len(names)
+    df = pd.DataFrame({
+        'VM Name': names,
+        'Powerstate': ['poweredOn'] * count,
+        'CPUs': cpus,
+        'Memory (GB)': [4.0] * count,
+        'Provisioned Disk (GB)': [40.0] * count,
+        'In Use Disk (GB)': [20.0] * count,
+        'Cluster': clusters if clusters is not None else ['CL1'] * count,
+        'OS according to the configuration file': ['Linux'] * count,
+        'In Scope for Prod?': [''] * count,
+        'In Scope for DR?': [''] * count,
+        'Notes': [''] * count,
+    })
+    for name, values in columns.items():
+        df[name] = values
+    return df
+
+
+def test_diff_against_the_previous_snapshot(tmp_path):
+    first = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    save_snapshot(server_list(['a', 'b', 'c'], [2, 2, 2]), 'vc1', tmp_path, first)
+    current = server_list(['A', 'c', 'd'], [2, 4, 2])
+
+    assert diff_against_previous(current, 'vc1', tmp_path, before=first) is None
+    changes = diff_against_previous(current, 'vc1', tmp_path, before=first + timedelta(days=1))
+    # Names match ignoring case
+    assert changes['added']['VM Name'].tolist() == ['d']
+    assert changes['removed']['VM Name'].tolist() == ['b']
+    assert changes['resized']['VM Name'].tolist() == ['c']
+    assert changes['resized'][['CPUs (previous)', 'CPUs']].values.tolist() == [[2, 4]]
+
+
+def test_uuid_keys_follow_renamed_vms(tmp_path):
+    first = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    save_snapshot(server_list(['a', 'b'], [2, 2], **{'VM UUID': ['u1', 'u2']}), 'vc1', tmp_path, first)
+    current = server_list(['a-renamed', 'b'], [2, 2], **{'VM UUID': ['u1', 'u2']})
+    changes = diff_against_previous(current, 'vc1', tmp_path, before=first + timedelta(days=1))
+    assert all(len(frame) == 0 for frame in changes.values())
+
+
+def test_trend_report_totals_each_snapshot(tmp_path):
+    for day, cpus in enumerate([[2, 2], [2, 2, 4]]):
+        save_snapshot(server_list([f'vm{i}' for i in range(len(cpus))], cpus), 'vc1', tmp_path,
+                      datetime(2026, 1, day + 1, tzinfo=timezone.utc))
+    trend = trend_report('vc1', tmp_path)
+    assert trend['VMs'].tolist() == [2, 3]
+    assert trend['CPUs'].tolist() == [4, 8]
+
+
+def test_scope_and_notes_carry_forward_from_a_processed_workbook():
+    previous = server_list(['a', 'b', 'c'], [1, 1, 1], clusters=['CL1', 'CL1', 'CL2'])
+    previous['In Scope for Prod?'] = ['yes', '', 'X']
+    previous['Notes'] = ['keep', None, 'other cluster']
+    output, _ = write_workbook(previous, summary_mode='values')
+    with output:
+        read_back = read_processed_workbook(output)
+
+    current = server_list(['A', 'b', 'c', 'new'], [1, 1, 1, 1], clusters=['CL1', 'CL1', 'CL1', 'CL1'])
+    updated, matched = carry_forward(current, read_back)
+    assert matched == 2
+    assert updated['In Scope for Prod?'].tolist() == ['yes', '', '', '']
+    assert updated['Notes'].tolist() == ['keep', '', '', '']
@@ -0,0 +1,108 @@
+"""Summary formulas against the static totals they stand in for."""
+import re
+
+import numpy as np
+import pandas as pd
+
+from summary import SCOPE_VALUES, aggregate, criterion, scope_flag, scope_helper_columns, summary_rows
+
+
+def countifs_matches(literal, cell):
+    """Whether COUNTIFS counts cell for a criterion given as a formula string literal.
+
+    Covers the '=' comparisons criterion() emits: case-insensitive, with
+    * and ? as wildcards unless escaped with ~, and a bare '=' for empty cells.
+    """
+    text = literal[1:-1].replace('""', '"')
+    assert text.startswith('=')
+    pattern = ''
+    chars = iter(text[1:])
+    for char in chars:
+        if char == '~':
+            pattern += re.escape(next(chars))
+        elif char == '*':
+            pattern += '.*'
+        elif char == '?':
+            pattern += '.'
+        else:
+            pattern += re.escape(char)
+    if pattern == '':
+        return cell is None or pd.isna(cell)
+    return cell is not None and not pd.isna(cell) and re.fullmatch(pattern, str(cell), re.I | re.S) is not None
+
+
+def helper_in_scope(cell):
+    """Excel's IF(OR(TRIM(cell&"")={...})) for a value as it would be written to the sheet"""
+    if cell is None or (isinstance(cell, float) and np.isnan(cell)):
+        text = ''
+    elif isinstance(cell, bool):
+        text = 'TRUE' if cell else 'FALSE'
+    elif isinstance(cell, float) and cell.is_integer():
+        text = str(int(cell))
+    else:
+        text = str(cell)
+    text = re.sub(' +', ' ', text.strip(' '))
+    return text.lower() in [value.lower() for value in SCOPE_VALUES]
+
+
+def server_list(os_names, powerstates=None, prod=None):
+    count = len(os_names)
+    return pd.DataFrame({
+        'VM Name': [f'vm{i}' for i in range(count)],
+        'Powerstate': powerstates if powerstates is not None else ['poweredOn'] * count,
+        'CPUs': [2] * count,
+        'Memory (GB)': [4.0] * count,
+        'Provisioned Disk (GB)': [40.0] * count,
+        'In Use Disk (GB)': [20.0] * count,
+        'Cluster': ['CL1'] * count,
+        'OS according to the configuration file': os_names,
+        'In Scope for Prod?': prod if prod is not None else [''] * count,
+        'In Scope for DR?': [''] * count,
+        'Notes': [''] * count,
+    })
+
+
+def test_criterion_escapes():
+    assert criterion(np.nan) == '"="'
+    assert criterion(None) == '"="'
+    assert criterion('Windows*') == '"=Windows~*"'
+    assert criterion('a?b~c') == '"=a~?b~~c"'
+    assert criterion('say "hi"') == '"=say ""hi"""'
+    assert criterion('>5') == '"=>5"'
+
+
+def test_os_criteria_count_exactly_their_static_group():
+    os_names = ['Windows*', 'Windows Server', None, 'a?b', 'axb', '~x', 'x', '"quoted"', '>5', np.nan]
+    df = server_list(os_names, powerstates=['poweredOn', None] * 5)
+    grouped = aggregate(df)
+    for level, column in [('_os', 'OS according to the configuration file'), ('_powerstate', 'Powerstate')]:
+        for value, row in grouped.groupby(level=level, sort=False, dropna=False).sum().iterrows():
+            literal = criterion(value)
+            counted = sum(countifs_matches(literal, cell) for cell in df[column])
+            assert counted == row['Count'], (column, value, literal)
+
+
+def test_missing_os_gets_an_empty_cell_criterion():
+    df = server_list(['Linux', None])
+    rows = summary_rows(df, 'formulas')
+    missing = next(row for row in rows if row[:2] == ['Operating System', None])
+    assert missing[2] == '=COUNTIFS(ServerList!$H$2:$H$3,"=")'
+
+
+def test_scope_flag_matches_the_helper_formula():
+    values = ['yes', ' Yes ', 'YES', '\tyes', 'yes\n', 'X', 'x ', '1', 1, True, False, '*', 'y?s', 'ye*',
+              '', None, 'no', 'true', ' y', 'yes please']
+    df = server_list(['Linux'] * len(values), prod=values)
+    flags = scope_flag(df['In Scope for Prod?'])
+    assert flags.tolist() == [helper_in_scope(value) for value in values]
+
+    floats = pd.Series([1.0, 1.5, np.nan, 0.0])
+    assert scope_flag(floats).tolist() == [helper_in_scope(value) for value in floats]
+
+
+def test_helper_formula_trims_and_does_not_use_wildcards():
+    df = server_list(['Linux'])
+    helpers = scope_helper_columns(df)
+    formula = helpers['Prod Scope (calc)'][0]
+    assert formula.startswith('=IF(OR(TRIM(I2&"")={')
+    assert 'MATCH' not in formula
@@ -0,0 +1,38 @@
+"""Peak RSS windows around the workbook write."""
+import time
+
+import numpy as np
+import pytest
+
+from workbook_writer import RSSWindow, current_rss_mb
+
+pytestmark = pytest.mark.skipif(current_rss_mb() == 0.0, reason="RSS is only read from /proc on Linux")
+
+
+def test_window_sees_a_transient_allocation():
+    with RSSWindow(interval=0.005) as window:
+        block = np.ones(64 * 1024 * 1024 // 8)
+        time.sleep(0.05)
+        del block
+    assert window.delta_mb() > 32
+
+
+def test_opening_a_window_leaves_the_others_alone():
+    with RSSWindow(interval=0.005) as outer:
+        block = np.ones(64 * 1024 * 1024 // 8)
+        time.sleep(0.05)
+        del block
+        with RSSWindow(interval=0.005) as inner:
+            time.sleep(0.02)
+    assert outer.delta_mb() > 32
+    assert inner.delta_mb() < 32
+
+
+def test_closed_window_stops_sampling():
+    window = RSSWindow(interval=0.005)
+    window.close()
+    peak = window.peak_mb()
+    block = np.ones(64 * 1024 * 1024 // 8)
+    time.sleep(0.05)
+    del block
+    assert window.peak_mb() == peak
@@ -0,0 +1,262 @@
+"""Streaming writer for the processed ServerList/Summary workbook.
+
+Rows are streamed through openpyxl's write-only mode (or xlsxwriter's
+constant_memory mode when it is installed) into a spooled temporary file, so
+the full workbook is never held as an in-memory object model. ServerLists
+longer than an Excel sheet are split across numbered ServerList sheets.
+"""
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+from summary import (DEFAULT_SUMMARY_MODE, MAX_SHEET_ROWS, scope_helper_columns, serverlist_shards,
+                     summary_rows, uses_formulas)
+
+try:
+    import xlsxwriter
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
+# Spooled output stays in memory up to this size before rolling over to disk
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+SUMMARY_COLUMN_WIDTH = 20
+
+# ServerList rows converted to cell values at a time while streaming
+WRITE_CHUNK_ROWS = 10_000
+
+
+def _serverlist_rows(server_list, summary_mode, shard_rows):
+    """Headers, a row iterator and the helper column count for the ServerList tab.
+
+    Live formula summaries need the hidden scope helper columns after the data.
+    """
+    headers = list(server_list.columns)
+    helper_count = 0
+    if uses_formulas(summary_mode):
+        helpers = list(scope_helper_columns(server_list.iloc[:0], shard_rows))
+        headers += helpers
+        helper_count = len(helpers)
+    return headers, _row_chunks(server_list, helper_count > 0, shard_rows), helper_count
+
+
+def _row_chunks(server_list, with_helpers, shard_rows, chunk_rows=WRITE_CHUNK_ROWS):
+    """ServerList rows as tuples, converted (and given their helper formulas) one chunk at a time"""
+    for start in range(0, len(server_list), chunk_rows):
+        chunk = server_list.iloc[start:start + chunk_rows]
+        columns = _column_values(chunk)
+        if with_helpers:
+            columns += list(scope_helper_columns(chunk, shard_rows, start).values())
+        yield from zip(*columns)
+
+
+@dataclass
+class WriteStats:
+    """Timing and memory measurements for one workbook write"""
+    engine: str
+    rows: int
+    seconds: float
+    size_bytes: int
+    peak_rss_mb: float
+    peak_delta_mb: float = 0.0
+
+
+def _proc_status_mb(field):
+    """A memory field of /proc/self/status in MB, or None off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    """Resident set size of this process right now in MB, or 0 if unavailable"""
+    rss = _proc_status_mb('VmRSS')
+    return rss if rss is not None else 0.0
+
+
+# Seconds between the RSS samples an RSSWindow takes
+RSS_SAMPLE_SECONDS = 0.02
+
+
+class RSSWindow:
+    """Approximate peak RSS over a span of code, rather than over the process lifetime.
+
+    A background thread samples VmRSS every RSS_SAMPLE_SECONDS until the
+    window is closed, so a spike shorter than that can be missed, and since
+    RSS is process-wide, work running concurrently on other threads counts
+    too. Nothing outside this process's own reads is touched, so windows can
+    nest and overlap freely. Off Linux no RSS is available and both readings
+    are 0.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.start_mb = current_rss_mb()
+        self._peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._sampler = None
+        if _proc_status_mb('VmRSS') is not None:
+            self._sampler = threading.Thread(target=self._sample, args=(interval,), daemon=True)
+            self._sampler.start()
+
+    def _sample(self, interval):
+        while not self._stop.wait(interval):
+            self._peak_mb = max(self._peak_mb, current_rss_mb())
+
+    def close(self):
+        """Stop sampling; the readings stay fixed from here on"""
+        if not self._stop.is_set():
+            self._peak_mb = max(self._peak_mb, current_rss_mb())
+            self._stop.set()
+            if self._sampler is not None:
+                self._sampler.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def peak_mb(self):
+        """Approximate peak RSS in MB since the window opened"""
+        if not self._stop.is_set():
+            self._peak_mb = max(self._peak_mb, current_rss_mb())
+        return self._peak_mb
+
+    def delta_mb(self):
+        """How far the approximate peak rose above the RSS when the window opened"""
+        return max(self.peak_mb() - self.start_mb, 0.0)
+
+
+def _column_values(server_list):
+    """Column values as Python lists with missing values turned into empty cells"""
+    columns = []
+    for name in server_list.columns:
+        col = server_list[name]
+        if col.hasnans:
+            col = col.astype(object).where(col.notna(), None)
+        columns.append(col.tolist())
+    return columns
+
+
+def _header_cells(ws, headers):
+    """Header cells styled like pandas' to_excel header row"""
+    font = Font(bold=True)
+    side = Side(style='thin')
+    border = Border(left=side, right=side, top=side, bottom=side)
+    alignment = Alignment(horizontal='center', vertical='top')
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = font
+        cell.border = border
+        cell.alignment = alignment
+        cells.append(cell)
+    return cells
+
+
+def _write_openpyxl(server_list, target, summary_mode, rows, shard_rows, extra_sheets):
+    """Stream both tabs with openpyxl's write-only workbook"""
+    wb = Workbook(write_only=True)
+    headers, records, helper_count = _serverlist_rows(server_list, summary_mode, shard_rows)
+
+    data_width = len(server_list.columns)
+    last_col = get_column_letter(data_width)
+    for name, start, stop in serverlist_shards(len(server_list), shard_rows):
+        serverlist_ws = wb.create_sheet(name)
+        for col in range(data_width + 1, data_width + helper_count + 1):
+            serverlist_ws.column_dimensions[get_column_letter(col)].hidden = True
+        serverlist_ws.append(_header_cells(serverlist_ws, headers))
+        for row in islice(records, stop - start):
+            serverlist_ws.append(row)
+        serverlist_ws.auto_filter.ref = f"A1:{last_col}{stop - start + 1}"
+
+    for name, sheet_rows in {'Summary': rows, **extra_sheets}.items():
+        ws = wb.create_sheet(name)
+        for col in range(1, max(len(row) for row in sheet_rows) + 1):
+            ws.column_dimensions[get_column_letter(col)].width = SUMMARY_COLUMN_WIDTH
+        for row in sheet_rows:
+            ws.append(row)
+
+    wb.save(target)
+
+
+def _write_xlsxwriter(server_list, target, summary_mode, rows, shard_rows, extra_sheets):
+    """Stream both tabs with xlsxwriter in constant_memory mode"""
+    wb = xlsxwriter.Workbook(target, {'constant_memory': True, 'nan_inf_to_errors': True, 'strings_to_formulas': False})
+    header_format = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    headers, records, helper_count = _serverlist_rows(server_list, summary_mode, shard_rows)
+
+    data_width = len(server_list.columns)
+    for name, start, stop in serverlist_shards(len(server_list), shard_rows):
+        serverlist_ws = wb.add_worksheet(name)
+        if helper_count:
+            serverlist_ws.set_column(data_width, data_width + helper_count - 1, None, None, {'hidden': True})
+        serverlist_ws.write_row(0, 0, headers, header_format)
+        for row_idx, row in enumerate(islice(records, stop - start), 1):
+            serverlist_ws.write_row(row_idx, 0, row[:data_width])
+            for col_idx, formula in enumerate(row[data_width:], data_width):
+                serverlist_ws.write_formula(row_idx, col_idx, formula)
+        serverlist_ws.autofilter(0, 0, stop - start, data_width - 1)
+
+    for name, sheet_rows in {'Summary': rows, **extra_sheets}.items():
+        ws = wb.add_worksheet(name)
+        ws.set_column(0, max(len(row) for row in sheet_rows) - 1, SUMMARY_COLUMN_WIDTH)
+        for row_idx, row in enumerate(sheet_rows):
+            for col_idx, value in enumerate(row):
+                if value is None:
+                    continue
+                if isinstance(value, str) and value.startswith('='):
+                    ws.write_formula(row_idx, col_idx, value)
+                else:
+                    ws.write(row_idx, col_idx, value)
+
+    wb.close()
+
+
+def write_workbook(server_list, engine=None, summary_mode=DEFAULT_SUMMARY_MODE, spool_max_size=SPOOL_MAX_SIZE,
+                   summary=None, shard_rows=MAX_SHEET_ROWS, extra_sheets=None):
+    """Write the ServerList and Summary tabs into a spooled temporary file.
+
+    summary takes Summary rows already built by summary_rows for this
+    ServerList, mode and shard_rows; they are built here when it is None.
+    The ServerList is split into sheets of at most shard_rows rows.
+    extra_sheets maps further sheet names to their rows, written after the Summary.
+    Rows are converted to cell values a chunk at a time as they are streamed.
+    Returns the file, rewound to the start, and the WriteStats for the write,
+    whose approximate peak RSS is sampled over the write alone.
+    """
+    if engine is None:
+        engine = 'xlsxwriter' if HAS_XLSXWRITER else 'openpyxl'
+    if summary is None:
+        summary = summary_rows(server_list, summary_mode, shard_rows)
+    extra_sheets = extra_sheets or {}
+
+    if engine not in ('xlsxwriter', 'openpyxl'):
+        raise ValueError(f"Unknown workbook engine: {engine}")
+
+    target = tempfile.SpooledTemporaryFile(max_size=spool_max_size, suffix='.xlsx')
+    with RSSWindow() as memory:
+        start = time.perf_counter()
+        if engine == 'xlsxwriter':
+            _write_xlsxwriter(server_list, target, summary_mode, summary, shard_rows, extra_sheets)
+        else:
+            _write_openpyxl(server_list, target, summary_mode, summary, shard_rows, extra_sheets)
+        seconds = time.perf_counter() - start
+
+    size_bytes = target.tell()
+    target.seek(0)
+    stats = WriteStats(engine, len(server_list), seconds, size_bytes, memory.peak_mb(), memory.delta_mb())
+    return target, stats